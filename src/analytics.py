@@ -0,0 +1,460 @@
+"""
+Engagement analytics for published videos
+
+Pulls views, retention and reach for every posted video from the YouTube Data
+and Analytics APIs and from Instagram Insights, batching ids so each platform
+needs only a handful of requests. Every collection run is stored as a
+snapshot in a local SQLite database, giving a time series per video.
+
+The stored scores are fed back into the schedule generator: each castle is
+scored from its own videos, or from similar castles (same country and
+structure type) if it hasn't been posted yet, and better scoring castles are
+scheduled earlier.
+
+The SQLite database is kept out of git (CI keeps it in the Actions cache).
+The latest value of every metric is exported to a small JSON summary that is
+committed, and a missing database is seeded from it.
+
+API clients are injected, and the Instagram collector goes through the shared
+HTTP client, so collection can be run against recorded responses with
+HTTP_RECORD_DIR / HTTP_REPLAY_DIR (see http_client.py).
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import json
+import math
+import os
+import sqlite3
+from datetime import datetime
+
+from http_client import get_client
+
+
+ANALYTICS_DB = os.environ.get("ANALYTICS_DB", "outputs/cache/analytics.db")
+ANALYTICS_SUMMARY = os.environ.get("ANALYTICS_SUMMARY", "content/analytics_latest.json")
+
+YOUTUBE_BATCH_SIZE = 50  # ids per videos.list request
+YOUTUBE_ANALYTICS_BATCH_SIZE = 200  # video ids per reports.query filter
+INSTAGRAM_BATCH_SIZE = 50  # ids per Graph API request
+
+YOUTUBE_ANALYTICS_METRICS = ['views', 'averageViewDuration', 'averageViewPercentage']
+INSTAGRAM_FIELDS = ['like_count', 'comments_count']
+INSTAGRAM_INSIGHT_METRICS = ['plays', 'reach', 'saved', 'shares', 'total_interactions']
+
+# YouTube Analytics data goes back to the channel's first video
+ANALYTICS_START_DATE = "2025-01-01"
+
+
+def chunks(items, size):
+    """Split a list into consecutive batches of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class MetricsStore:
+    """
+    Time series of video metrics in SQLite.
+    Each row is one metric for one video at one collection time.
+    """
+
+    def __init__(self, db_path=ANALYTICS_DB):
+        self.db_path = db_path
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                collected_at TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                media_id TEXT NOT NULL,
+                post_id TEXT,
+                metric TEXT NOT NULL,
+                value REAL,
+                PRIMARY KEY (collected_at, platform, media_id, metric)
+            )
+        """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS metrics_by_media ON metrics (platform, media_id, collected_at)"
+        )
+        self.connection.commit()
+
+    def add_snapshot(self, platform, metrics, post_ids=None, collected_at=None):
+        """
+        Store one collection run for a platform.
+
+        Args:
+            platform (str): 'youtube' or 'instagram'
+            metrics (dict): Media ID to {metric: value}
+            post_ids (dict, optional): Media ID to schedule post ID
+            collected_at (str, optional): ISO timestamp, defaults to now
+        """
+        collected_at = collected_at or datetime.now().isoformat(timespec='seconds')
+        post_ids = post_ids or {}
+        rows = [
+            (collected_at, platform, media_id, post_ids.get(media_id), metric, value)
+            for media_id, values in metrics.items()
+            for metric, value in values.items()
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def latest(self, platform=None):
+        """
+        Most recent value of every metric.
+
+        Returns:
+            dict: (platform, media_id) to {'post_id': ..., metric: value, ...}
+        """
+        query = """
+            SELECT m.platform, m.media_id, m.post_id, m.metric, m.value
+            FROM metrics m
+            JOIN (
+                SELECT platform, media_id, metric, MAX(collected_at) AS collected_at
+                FROM metrics GROUP BY platform, media_id, metric
+            ) newest USING (platform, media_id, metric, collected_at)
+        """
+        params = ()
+        if platform:
+            query += " WHERE m.platform = ?"
+            params = (platform,)
+        latest = {}
+        for row_platform, media_id, post_id, metric, value in self.connection.execute(query, params):
+            entry = latest.setdefault((row_platform, media_id), {'post_id': post_id})
+            entry[metric] = value
+        return latest
+
+    def history(self, platform, media_id, metric):
+        """Values of one metric over time, as (collected_at, value) pairs"""
+        return self.connection.execute(
+            "SELECT collected_at, value FROM metrics "
+            "WHERE platform = ? AND media_id = ? AND metric = ? ORDER BY collected_at",
+            (platform, media_id, metric)
+        ).fetchall()
+
+    def export_latest(self, path=ANALYTICS_SUMMARY):
+        """Write the latest value of every metric as compact JSON (one entry per video)"""
+        collected_at = self.connection.execute("SELECT MAX(collected_at) FROM metrics").fetchone()[0]
+        media = [
+            {'platform': platform, 'media_id': media_id,
+             **{metric: round(value, 3) if isinstance(value, float) else value for metric, value in metrics.items()}}
+            for (platform, media_id), metrics in sorted(self.latest().items())
+        ]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'collected_at': collected_at, 'media': media}, f, separators=(',', ':'))
+        return len(media)
+
+    def import_latest(self, path=ANALYTICS_SUMMARY):
+        """Seed the store from a summary written by export_latest"""
+        with open(path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        by_platform = {}
+        for entry in summary['media']:
+            entry = dict(entry)
+            platform, media_id, post_id = entry.pop('platform'), entry.pop('media_id'), entry.pop('post_id', None)
+            metrics, post_ids = by_platform.setdefault(platform, ({}, {}))
+            metrics[media_id] = entry
+            post_ids[media_id] = post_id
+        for platform, (metrics, post_ids) in by_platform.items():
+            self.add_snapshot(platform, metrics, post_ids, summary.get('collected_at'))
+        return len(summary['media'])
+
+    def is_empty(self):
+        return self.connection.execute("SELECT 1 FROM metrics LIMIT 1").fetchone() is None
+
+    def close(self):
+        self.connection.close()
+
+
+def open_metrics_store(db_path=ANALYTICS_DB, summary_path=ANALYTICS_SUMMARY):
+    """
+    The metrics store, seeded from the committed summary when the database is
+    missing (a fresh checkout or an evicted CI cache). None if there is
+    neither.
+    """
+    if not os.path.exists(db_path) and not os.path.exists(summary_path):
+        return None
+    metrics_store = MetricsStore(db_path)
+    if metrics_store.is_empty() and os.path.exists(summary_path):
+        print(f"📊 Seeding {db_path} from {summary_path}: {metrics_store.import_latest(summary_path)} videos")
+    return metrics_store
+
+
+class YouTubeAnalyticsCollector:
+    """
+    Collects YouTube statistics and retention.
+
+    videos.list takes 50 ids per call; the Analytics report is filtered to a
+    list of video ids and returns one row per video, so a whole channel needs
+    a few requests rather than one per video.
+    """
+
+    def __init__(self, youtube_service, analytics_service=None):
+        """
+        Args:
+            youtube_service: YouTube Data API v3 client (googleapiclient)
+            analytics_service: YouTube Analytics API v2 client, or None to
+                collect only the public statistics
+        """
+        self.youtube = youtube_service
+        self.analytics = analytics_service
+
+    def get_statistics(self, video_ids):
+        """View, like and comment counts from videos.list"""
+        metrics = {}
+        for batch in chunks(video_ids, YOUTUBE_BATCH_SIZE):
+            response = self.youtube.videos().list(part='statistics', id=','.join(batch)).execute()
+            for item in response.get('items', []):
+                stats = item.get('statistics', {})
+                metrics[item['id']] = {
+                    'view_count': float(stats.get('viewCount', 0)),
+                    'like_count': float(stats.get('likeCount', 0)),
+                    'comment_count': float(stats.get('commentCount', 0)),
+                }
+        return metrics
+
+    def get_retention(self, video_ids, end_date=None):
+        """Views and average view percentage per video from the Analytics API"""
+        if not self.analytics:
+            return {}
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        metrics = {}
+        for batch in chunks(video_ids, YOUTUBE_ANALYTICS_BATCH_SIZE):
+            response = self.analytics.reports().query(
+                ids='channel==MINE',
+                startDate=ANALYTICS_START_DATE,
+                endDate=end_date,
+                metrics=','.join(YOUTUBE_ANALYTICS_METRICS),
+                dimensions='video',
+                filters=f"video=={','.join(batch)}",
+                maxResults=len(batch)
+            ).execute()
+            columns = [header['name'] for header in response.get('columnHeaders', [])]
+            for row in response.get('rows', []):
+                values = dict(zip(columns, row))
+                video_id = values.pop('video')
+                metrics[video_id] = {name: float(value) for name, value in values.items()}
+        return metrics
+
+    def collect(self, video_ids):
+        """All metrics per video ID"""
+        metrics = self.get_statistics(video_ids)
+        try:
+            retention = self.get_retention(video_ids)
+        except Exception as e:
+            # Usually a token without the yt-analytics.readonly scope
+            print(f"⚠️ YouTube Analytics unavailable, collecting statistics only: {e}")
+            retention = {}
+        for video_id, values in retention.items():
+            metrics.setdefault(video_id, {}).update(values)
+        return metrics
+
+
+class InstagramInsightsCollector:
+    """
+    Collects Instagram Reels insights.
+
+    Insights are requested as a field expansion on a multi-id lookup
+    (?ids=...&fields=insights.metric(...)), so 50 media need one request.
+    """
+
+    def __init__(self, access_token=None, session=None, base_url="https://graph.facebook.com/v18.0"):
+        self.access_token = access_token or os.getenv('INSTAGRAM_ACCESS_TOKEN')
+        self.session = session or get_client("instagram")
+        self.base_url = base_url
+
+    def collect(self, media_ids):
+        """All metrics per media ID; media that fail are left out"""
+        fields = INSTAGRAM_FIELDS + [f"insights.metric({','.join(INSTAGRAM_INSIGHT_METRICS)})"]
+        metrics = {}
+        for batch in chunks(media_ids, INSTAGRAM_BATCH_SIZE):
+            response = self.session.get(
+                f"{self.base_url}/",
+                params={
+                    'ids': ','.join(batch),
+                    'fields': ','.join(fields),
+                    'access_token': self.access_token
+                },
+                timeout=30
+            )
+            data = response.json()
+            if 'error' in data:
+                print(f"⚠️ Instagram insights failed: {data['error'].get('message', 'Unknown error')}")
+                continue
+            for media_id in batch:
+                media = data.get(media_id)
+                if not media:
+                    continue
+                values = {field: float(media.get(field, 0)) for field in INSTAGRAM_FIELDS}
+                for insight in media.get('insights', {}).get('data', []):
+                    if insight.get('values'):
+                        values[insight['name']] = float(insight['values'][0].get('value', 0))
+                metrics[media_id] = values
+        return metrics
+
+
+def published_media(posts):
+    """
+    Media IDs of posted videos per platform.
+
+    Returns:
+        dict: Platform to {media_id: post_id}
+    """
+    media = {'youtube': {}, 'instagram': {}}
+    for post in posts:
+        if post.get('youtube_video_id'):
+            media['youtube'][post['youtube_video_id']] = post['id']
+        if post.get('instagram_media_id'):
+            media['instagram'][str(post['instagram_media_id'])] = post['id']
+    return media
+
+
+def collect_analytics(posts, metrics_store, youtube_collector=None, instagram_collector=None):
+    """
+    Collect metrics for every posted video and store them as a snapshot.
+
+    Args:
+        posts (list): Schedule posts (with youtube_video_id / instagram_media_id)
+        metrics_store (MetricsStore): Where snapshots are stored
+        youtube_collector (YouTubeAnalyticsCollector, optional)
+        instagram_collector (InstagramInsightsCollector, optional)
+
+    Returns:
+        dict: Number of videos collected per platform
+    """
+    media = published_media(posts)
+    collectors = {'youtube': youtube_collector, 'instagram': instagram_collector}
+    collected_at = datetime.now().isoformat(timespec='seconds')
+    counts = {}
+    for platform, collector in collectors.items():
+        if not collector or not media[platform]:
+            continue
+        metrics = collector.collect(list(media[platform]))
+        metrics_store.add_snapshot(platform, metrics, media[platform], collected_at)
+        counts[platform] = len(metrics)
+        print(f"📊 {platform}: collected metrics for {len(metrics)}/{len(media[platform])} videos")
+    return counts
+
+
+def engagement_score(platform, metrics):
+    """
+    A single comparable score for a video.
+
+    Reach is counted on a log scale so one viral video doesn't drown out the
+    rest, and scaled up by how much of the video people watched (YouTube) or
+    how often they interacted with it (Instagram).
+    """
+    if platform == 'youtube':
+        views = metrics.get('views', metrics.get('view_count', 0))
+        retention = metrics.get('averageViewPercentage', 50) / 100
+        interactions = metrics.get('like_count', 0) + metrics.get('comment_count', 0)
+    else:
+        views = metrics.get('plays', metrics.get('reach', 0))
+        retention = 0.5
+        interactions = metrics.get('total_interactions', 0) + metrics.get('saved', 0) + metrics.get('shares', 0)
+    interaction_rate = interactions / views if views else 0
+    return math.log1p(views) * (0.5 + retention) * (1 + 10 * interaction_rate)
+
+
+def post_scores(metrics_store):
+    """Latest engagement score per post ID, summed across platforms"""
+    scores = {}
+    for (platform, _), metrics in metrics_store.latest().items():
+        if metrics.get('post_id'):
+            scores[metrics['post_id']] = scores.get(metrics['post_id'], 0) + engagement_score(platform, metrics)
+    return scores
+
+
+def castle_priority(metrics_store, posts, metadata, prior_weight=2):
+    """
+    Scheduling priority for every castle in the metadata.
+
+    A castle that has been posted is scored by its own videos' engagement.
+    Other castles get the average engagement of posted castles with the same
+    country and structure type, shrunk towards the overall average by
+    prior_weight posts so a group with one lucky video doesn't jump the queue.
+
+    Args:
+        metrics_store (MetricsStore): Collected metrics
+        posts (list): Schedule posts
+        metadata (dict): Output of schedule_generator.load_castle_metadata
+        prior_weight (float): Posts' worth of the overall average mixed into
+            each group's average
+
+    Returns:
+        dict: Castle name (file-name form) to priority, for plan_schedule
+    """
+    scores = post_scores(metrics_store)
+    if not scores:
+        return {}
+
+    def group_of(name):
+        info = metadata.get(name, {})
+        return info.get('country', '').lower(), info.get('structure_type', '').lower()
+
+    own = {}
+    totals = {}
+    for post in posts:
+        if post['id'] in scores:
+            name = os.path.basename(post['video_file']).split('_video')[0]
+            own.setdefault(name, []).append(scores[post['id']])
+            total, count = totals.get(group_of(name), (0, 0))
+            totals[group_of(name)] = (total + scores[post['id']], count + 1)
+
+    overall = sum(scores.values()) / len(scores)
+
+    def priority(name):
+        if name in own:
+            return sum(own[name]) / len(own[name])
+        total, count = totals.get(group_of(name), (0, 0))
+        return (total + overall * prior_weight) / (count + prior_weight)
+
+    return {name: priority(name) for name in metadata}
+
+
+def build_youtube_services():
+    """
+    YouTube Data and Analytics clients from the same OAuth credentials as the
+    uploader. The refresh token needs the yt-analytics.readonly scope for
+    retention metrics; without it only public statistics are collected.
+    """
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
+    refresh_token = os.environ.get("YOUTUBE_REFRESH_TOKEN")
+    client_id = os.environ.get("YOUTUBE_CLIENT_ID")
+    client_secret = os.environ.get("YOUTUBE_CLIENT_SECRET")
+    if not all([refresh_token, client_id, client_secret]):
+        print("❌ Missing YouTube OAuth credentials in environment variables")
+        return None, None
+
+    creds = Credentials(
+        None,
+        refresh_token=refresh_token,
+        client_id=client_id,
+        client_secret=client_secret,
+        token_uri="https://oauth2.googleapis.com/token"
+    )
+    return build("youtube", "v3", credentials=creds), build("youtubeAnalytics", "v2", credentials=creds)
+
+
+if __name__ == "__main__":
+    from schedule_store import open_store
+
+    posts = open_store().get_all_posts()
+    metrics_store = open_metrics_store() or MetricsStore()
+
+    youtube_service, analytics_service = build_youtube_services()
+    youtube_collector = YouTubeAnalyticsCollector(youtube_service, analytics_service) if youtube_service else None
+    instagram_collector = InstagramInsightsCollector() if os.getenv('INSTAGRAM_ACCESS_TOKEN') else None
+
+    counts = collect_analytics(posts, metrics_store, youtube_collector, instagram_collector)
+    exported = metrics_store.export_latest()
+    metrics_store.close()
+    print(f"✅ Analytics saved to {ANALYTICS_DB}: {counts} ({exported} videos in {ANALYTICS_SUMMARY})")
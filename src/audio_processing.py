@@ -0,0 +1,167 @@
+"""
+Audio post-processing for castle videos
+
+EBU R128 loudness normalisation of the narration (with the loudnorm
+measurement cached per audio file) and an optional background music bed that
+ducks under the voice. Everything is expressed as FFmpeg filters so it runs in
+the same pass as the video encode.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import hashlib
+import json
+import math
+import os
+import re
+import subprocess
+
+
+# EBU R128 targets for social video
+LOUDNESS_TARGET = {'I': -16.0, 'TP': -1.5, 'LRA': 11.0}
+
+LOUDNORM_CACHE = "outputs/cache/loudnorm.json"
+
+MUSIC_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.wav', '.ogg', '.flac')
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """SHA-1 of a file's contents, used as a cache key"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_cache(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _save_cache(cache, cache_path):
+    if not cache_path:
+        return
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+
+
+def measure_loudness(audio_path, cache_path=LOUDNORM_CACHE):
+    """
+    Measure an audio file with loudnorm's analysis pass.
+    Results are cached by file contents, so a re-render never measures twice.
+
+    Returns:
+        dict: loudnorm measurement (input_i, input_tp, input_lra, input_thresh,
+        target_offset), or None if the measurement failed
+    """
+    key = file_fingerprint(audio_path)
+    cache = _load_cache(cache_path)
+    if key in cache:
+        return cache[key]
+
+    target = LOUDNESS_TARGET
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', audio_path,
+        '-af', f"loudnorm=I={target['I']}:TP={target['TP']}:LRA={target['LRA']}:print_format=json",
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+
+    # The JSON summary is the last {...} block FFmpeg prints to stderr
+    match = re.search(r'\{[^{}]*"input_i"[^{}]*\}', result.stderr)
+    if result.returncode != 0 or not match:
+        print(f"Error measuring loudness of {audio_path}")
+        return None
+
+    measurement = json.loads(match.group(0))
+    cache[key] = measurement
+    _save_cache(cache, cache_path)
+    return measurement
+
+
+def choose_music_track(library_dir, key):
+    """
+    Pick a background track from a local library.
+    The choice is stable for a given key (e.g. the castle name), so re-renders
+    get the same music.
+
+    Returns:
+        str: Path to the track, or None if the library is missing or empty
+    """
+    if not library_dir or not os.path.isdir(library_dir):
+        return None
+    tracks = sorted(f for f in os.listdir(library_dir) if f.lower().endswith(MUSIC_EXTENSIONS))
+    if not tracks:
+        return None
+    index = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % len(tracks)
+    return os.path.join(library_dir, tracks[index])
+
+
+def measurement_is_finite(measurement):
+    """Whether every value loudnorm's second pass needs is a finite number"""
+    for key in ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset'):
+        try:
+            if not math.isfinite(float(measurement[key])):
+                return False
+        except (KeyError, TypeError, ValueError):
+            return False
+    return True
+
+
+def build_audio_filter(narration_label, output_label, duration, measurement=None, music_label=None, music_volume=0.15):
+    """
+    Build the filter chain for the final audio.
+
+    The narration is normalised with loudnorm in linear mode using the cached
+    measurement (dynamic single-pass mode if there is none). A music bed, if
+    given, is lowered, faded and side-chain compressed by the narration so it
+    ducks whenever the voice is speaking.
+
+    Parameters:
+    - narration_label: Filter label of the narration stream, e.g. '3:a'
+    - output_label: Label for the finished audio
+    - duration: Length of the video in seconds
+    - measurement: Result of measure_loudness, or None
+    - music_label: Filter label of the (looped) music stream, or None
+    - music_volume: Level of the music bed relative to its source
+
+    Returns:
+    - Filter string (ending in ';')
+    """
+    target = LOUDNESS_TARGET
+    loudnorm = f"loudnorm=I={target['I']}:TP={target['TP']}:LRA={target['LRA']}"
+    if measurement and not measurement_is_finite(measurement):
+        # Silent or near-silent narration measures as -inf, which linear mode rejects
+        print("Loudness measurement is not finite; using single-pass loudnorm")
+        measurement = None
+    if measurement:
+        loudnorm += (
+            f":measured_I={measurement['input_i']}"
+            f":measured_TP={measurement['input_tp']}"
+            f":measured_LRA={measurement['input_lra']}"
+            f":measured_thresh={measurement['input_thresh']}"
+            f":offset={measurement['target_offset']}"
+            ":linear=true"
+        )
+    # loudnorm works at 192 kHz internally, bring it back to 48 kHz
+    chain = f"[{narration_label}]{loudnorm},aresample=48000"
+
+    if not music_label:
+        return f"{chain}[{output_label}];"
+
+    fade_out = max(duration - 2, 0)
+    return (
+        f"{chain},asplit=2[narration][narration_key];"
+        f"[{music_label}]aresample=48000,volume={music_volume},"
+        f"afade=t=in:st=0:d=1,afade=t=out:st={fade_out:.3f}:d=2[music_bed];"
+        "[music_bed][narration_key]sidechaincompress=threshold=0.03:ratio=8:attack=20:release=400[music_ducked];"
+        f"[narration][music_ducked]amix=inputs=2:duration=first:normalize=0[{output_label}];"
+    )
@@ -0,0 +1,210 @@
+"""
+Rule-based cleaning of the castle datasets
+
+Each cleaning stage is a list of declarative rules (column, operation,
+value). The rules are compiled into boolean masks over the whole frame and
+OR-ed into one rejection mask, so a stage is a single vectorised pass with
+one final selection instead of a chain of filtered copies. The number of
+rows each rule rejects is reported, which shows where castles are lost.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import pandas as pd
+
+
+# Legacy free-text descriptions start with "City: 'x', Country: 'y'"
+LOCATION_PATTERN = r"City:\s*'?(?P<city>[^,'\n]*)'?,\s*Country:\s*'?(?P<country>[^'\n]*)"
+
+# Stage 1: generated descriptions (llm_input output)
+DESCRIPTION_RULES = [
+    {'name': 'missing name', 'column': 'name', 'op': 'missing'},
+    {'name': 'unknown name', 'column': 'name', 'op': 'in', 'value': ["Unknown", ""]},
+    {'name': 'missing description', 'column': 'description', 'op': 'missing'},
+    {'name': 'refused description', 'column': 'description', 'op': 'matches',
+     'value': r"^(?:Unfortunately|I'm sorry|I'm afraid)", 'case': True},
+    {'name': 'short description', 'column': 'description', 'op': 'min_words', 'value': 51},
+]
+
+# Stage 2: structure classification (llm_verify output)
+CLASSIFICATION_RULES = [
+    {'name': 'unclassified', 'column': 'structure_type', 'op': 'missing'},
+    {'name': 'marked for removal', 'column': 'structure_type', 'op': 'in', 'value': ['remove']},
+    {'name': 'low confidence', 'column': 'confidence', 'op': 'below', 'value': 0.5},
+    {'name': 'ruin', 'column': ['description', 'name'], 'op': 'matches', 'value': 'ruin'},
+    {'name': 'stately home', 'column': 'castle_type', 'op': 'matches', 'value': 'stately'},
+]
+
+# Stage 3: castles with retrieved images
+IMAGE_RULES = [
+    {'name': 'too few images', 'column': ['wikimedia_number_of_images', 'wikipedia_number_of_images'],
+     'op': 'below', 'value': 4},
+    {'name': 'duplicate name', 'column': 'name', 'op': 'duplicate'},
+]
+
+# Order of preference when sorting castles by how complete their row is
+COMPLETENESS_WEIGHTS = {
+    'description': 4,
+    'city': 3,
+    'historic_type': 2,
+    'castle_type': 1,
+}
+
+
+def _columns(rule):
+    return rule['column'] if isinstance(rule['column'], list) else [rule['column']]
+
+
+def rule_mask(df, rule):
+    """
+    Rows a rule rejects, as a boolean Series. Rules over several columns
+    reject a row if any column matches ('below' compares their sum, and
+    rejects a row with any of them missing).
+
+    Operations: missing, in, matches (regex, case-insensitive unless
+    'case' is set), min_words, below. 'duplicate' is handled by build_mask,
+    since it depends on the rows the other rules keep.
+    """
+    op = rule['op']
+    columns = [column for column in _columns(rule) if column in df]
+    if not columns:
+        # A rule for a column this dataset doesn't have rejects nothing
+        return pd.Series(False, index=df.index)
+
+    if op == 'below':
+        # A missing count isn't 0; without every value the row can't pass
+        total = df[columns].sum(axis=1, skipna=False)
+        return total.lt(rule['value']) | total.isna()
+
+    masks = []
+    for column in columns:
+        values = df[column]
+        if op == 'missing':
+            masks.append(values.isna())
+        elif op == 'in':
+            masks.append(values.isin(rule['value']))
+        elif op == 'matches':
+            masks.append(values.astype('string').str.contains(
+                rule['value'], case=rule.get('case', False), regex=True, na=False
+            ).astype(bool))
+        elif op == 'min_words':
+            masks.append(values.astype('string').str.count(r'\S+').fillna(0).lt(rule['value']).astype(bool))
+        else:
+            raise ValueError(f"Unknown rule operation '{op}' in rule '{rule['name']}'")
+    mask = masks[0]
+    for other in masks[1:]:
+        mask = mask | other
+    return mask
+
+
+def build_mask(df, rules):
+    """
+    Combined rejection mask for a list of rules.
+
+    Returns:
+        tuple: (boolean Series, True for rejected rows;
+                dict of rule name to the number of rows it rejects)
+    """
+    rejected = pd.Series(False, index=df.index)
+    counts = {}
+    for rule in rules:
+        if rule['op'] == 'duplicate':
+            continue
+        mask = rule_mask(df, rule)
+        counts[rule['name']] = int(mask.sum())
+        rejected |= mask
+
+    # Duplicates are judged among the surviving rows, keeping the first of each
+    for rule in rules:
+        if rule['op'] != 'duplicate':
+            continue
+        column = rule['column']
+        keys = df.loc[~rejected, column].astype('string').str.lower()
+        mask = keys.duplicated(keep='first').reindex(df.index, fill_value=False)
+        counts[rule['name']] = int(mask.sum())
+        rejected |= mask
+    return rejected, counts
+
+
+def apply_rules(df, rules, columns=None, label="Cleaning"):
+    """
+    Keep the rows no rule rejects, in one selection.
+
+    Args:
+        df (pd.DataFrame): Data to clean
+        rules (list): Rule dicts (see rule_mask)
+        columns (list, optional): Columns to keep; those missing from df are skipped
+        label (str): Name printed with the rejection counts
+
+    Returns:
+        tuple: (cleaned pd.DataFrame, dict of rule name to rejected rows)
+    """
+    rejected, counts = build_mask(df, rules)
+    columns = [column for column in columns if column in df] if columns else list(df.columns)
+    cleaned = df.loc[~rejected, columns]
+
+    print(f"{label}: kept {len(cleaned)} of {len(df)} rows")
+    for name, count in counts.items():
+        print(f"  {name}: {count} rejected")
+    return cleaned, counts
+
+
+def extract_location(df, column='description'):
+    """
+    Fill missing city and country values from legacy descriptions that start
+    with "City: 'x', Country: 'y'". Structured llm_input output already has
+    both columns, so this only fills gaps.
+    """
+    location = df[column].astype('string').str.extract(LOCATION_PATTERN)
+    location = location.apply(lambda values: values.str.strip(" '\".").replace({'Unknown': pd.NA, '': pd.NA}))
+    for field in ('city', 'country'):
+        df[field] = df[field].fillna(location[field]) if field in df else location[field]
+    return df
+
+
+def sort_by_completeness(df, weights=COMPLETENESS_WEIGHTS):
+    """Order rows by how many of the weighted columns they have filled (unlisted columns weigh 1)"""
+    score = sum(df[column].notna().astype(int) * weights.get(column, 1) for column in df.columns)
+    return df.loc[score.sort_values(ascending=False, kind='stable').index].reset_index(drop=True)
+
+
+def clean_descriptions(df):
+    """Stage 1: castles with usable generated descriptions, most complete first"""
+    df = extract_location(df)
+    cleaned, _ = apply_rules(
+        df, DESCRIPTION_RULES,
+        columns=['name', 'description', 'historic_type', 'castle_type', 'country', 'city', 'era', 'style'],
+        label="Descriptions"
+    )
+    cleaned = sort_by_completeness(cleaned)
+    return cleaned[[column for column in ['name', 'country', 'city', 'era', 'style', 'castle_type', 'description']
+                    if column in cleaned]]
+
+
+def clean_classified(df, min_confidence=0.5):
+    """Stage 2: castles the classifier kept, excluding ruins and stately homes"""
+    rules = [dict(rule, value=min_confidence) if rule['name'] == 'low confidence' else rule
+             for rule in CLASSIFICATION_RULES]
+    cleaned, _ = apply_rules(
+        df, rules,
+        columns=['name', 'country', 'city', 'era', 'style', 'structure_type', 'description'],
+        label="Classification"
+    )
+    return cleaned.reset_index(drop=True)
+
+
+def clean_with_images(df, min_images=4):
+    """Stage 3: castles with at least min_images images across both sources, one row per name"""
+    rules = [dict(rule, value=min_images) if rule['name'] == 'too few images' else rule
+             for rule in IMAGE_RULES]
+    cleaned, _ = apply_rules(
+        df, rules,
+        columns=['name', 'country', 'city', 'era', 'style', 'structure_type', 'description',
+                 'wikipedia_article_url', 'wikipedia_language', 'wikipedia_image_urls',
+                 'wikimedia_image_urls', 'wikipedia_number_of_images', 'wikimedia_number_of_images'],
+        label="Images"
+    )
+    return cleaned.reset_index(drop=True)
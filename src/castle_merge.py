@@ -0,0 +1,160 @@
+"""
+Merge the per-letter castle shards into one dataset
+
+Shards are read in parallel (a bounded number ahead, so only a few are in
+memory at once) and de-duplicated on a spatial key as they arrive: the
+castle's position rounded to about 10 m, or its OpenStreetMap element when
+it has no coordinates. The result is either concatenated once in memory or
+streamed shard by shard to a CSV or Parquet file.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for Parquet output
+    pa = None
+
+# Columns of an openstreetmap.get_castles_from_overpass shard, with fixed types
+# so every shard has the same schema in a columnar output
+SHARD_COLUMNS = {
+    'id': 'Int64',
+    'osm_type': 'string',
+    'name': 'string',
+    'historic_type': 'string',
+    'castle_type': 'string',
+    'architecture': 'string',
+    'start_date': 'string',
+    'wikimedia_commons': 'string',
+    'wikipedia': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'country': 'string',
+    'city': 'string',
+    'address': 'string',
+    'website': 'string',
+    'description': 'string',
+}
+
+# Decimal places of latitude/longitude in the spatial key (4 is about 11 m)
+SPATIAL_PRECISION = 4
+
+SHARD_SUFFIX = "_castles.csv"
+
+
+def spatial_key(df, precision=SPATIAL_PRECISION):
+    """
+    Rounded 'lat,lon' for rows with coordinates, otherwise 'osm_type/id',
+    so castles without coordinates aren't all treated as one.
+    """
+    located = df['latitude'].notna() & df['longitude'].notna()
+    key = (df['latitude'].round(precision).astype('string') + "," +
+           df['longitude'].round(precision).astype('string'))
+    element = df['osm_type'].astype('string').fillna('osm') + "/" + df['id'].astype('string').fillna('')
+    return key.where(located, element)
+
+
+def deduplicate(df, seen=None):
+    """
+    Drop castles whose spatial key is repeated within df or already in seen
+    (which is updated with the keys kept).
+    """
+    keys = spatial_key(df)
+    keep = ~keys.duplicated(keep='first')
+    if seen is not None:
+        keep &= ~keys.isin(seen)
+        seen.update(keys[keep])
+    return df[keep]
+
+
+def read_shard(path):
+    """One shard with the shared column types"""
+    df = pd.read_csv(path, dtype={column: dtype for column, dtype in SHARD_COLUMNS.items() if dtype == 'string'})
+    return df.reindex(columns=list(SHARD_COLUMNS)).astype(SHARD_COLUMNS)
+
+
+def read_shards(paths, max_workers=8):
+    """
+    Shards in the given order, read by a thread pool that stays at most
+    max_workers files ahead of the consumer.
+    """
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(read_shard, path)))
+            if len(pending) >= max_workers:
+                yield pending[0][0], pending.popleft()[1].result()
+        while pending:
+            yield pending[0][0], pending.popleft()[1].result()
+
+
+def shard_paths(directory, suffix=SHARD_SUFFIX, exclude=()):
+    """Shard files in a directory, sorted so the merge order is stable"""
+    exclude = {os.path.abspath(path) for path in exclude if path}
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.endswith(suffix) and os.path.abspath(os.path.join(directory, name)) not in exclude]
+
+
+def _write_chunk(df, output_path, state):
+    """Append a de-duplicated shard to a CSV or Parquet output"""
+    if output_path.endswith('.parquet'):
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet output")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if state.get('writer') is None:
+            state['writer'] = pq.ParquetWriter(output_path, table.schema)
+        state['writer'].write_table(table)
+    else:
+        df.to_csv(output_path, mode='a' if state.get('started') else 'w',
+                  header=not state.get('started'), index=False)
+        state['started'] = True
+
+
+def merge_shards(paths, output_path=None, max_workers=8):
+    """
+    Merge castle shards, keeping the first castle seen at each position.
+
+    Args:
+        paths (list): Shard CSV files, in priority order
+        output_path (str, optional): CSV or .parquet file to stream the merged
+            castles to, one shard at a time; without it they are returned
+        max_workers (int): Shards read in parallel
+
+    Returns:
+        pd.DataFrame or int: The merged castles, or the number written
+    """
+    seen = set()
+    frames = []
+    state = {}
+    total = written = 0
+    try:
+        for path, df in read_shards(paths, max_workers):
+            total += len(df)
+            df = deduplicate(df, seen)
+            written += len(df)
+            print(f"{os.path.basename(path)}: {len(df)} castles")
+            if output_path:
+                _write_chunk(df, output_path, state)
+            else:
+                frames.append(df)
+    finally:
+        if state.get('writer') is not None:
+            state['writer'].close()
+
+    print(f"Merged {written} castles from {len(paths)} shards ({total - written} duplicates dropped)")
+    if output_path:
+        return written
+    if not frames:
+        return pd.DataFrame(columns=list(SHARD_COLUMNS)).astype(SHARD_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
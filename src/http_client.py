@@ -0,0 +1,230 @@
+"""
+Shared HTTP client for every integration
+
+One requests.Session per integration, with:
+- connection pools per host (kept alive between calls, so repeat requests
+  skip the TCP/TLS handshake)
+- retries with exponential backoff on connection errors, 429 and 5xx for
+  idempotent methods, honouring Retry-After
+- a default timeout on every request, overridable per host
+- timing metrics per host (see print_metrics)
+- optional record/replay of responses, for running integrations offline
+  against recorded fixtures
+
+Record/replay is switched on with environment variables:
+    HTTP_RECORD_DIR=fixtures/http   save every response to this directory
+    HTTP_REPLAY_DIR=fixtures/http   answer requests from this directory only
+Access tokens and secrets are never written to the recordings: they are
+left out of the query parameters and redacted from JSON response bodies.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_TIMEOUT = 30  # seconds, for connect and read
+
+# Hosts that need a different timeout than DEFAULT_TIMEOUT
+HOST_TIMEOUTS = {
+    'overpass-api.de': 300,  # whole-country queries run for minutes
+    'raw.githubusercontent.com': 10,
+}
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Query parameters left out of recordings and fixture keys
+SECRET_PARAMS = ('access_token', 'input_token', 'client_secret', 'ig_access_token', 'key')
+# Fields of JSON response bodies redacted in recordings (e.g. a refreshed token)
+SECRET_FIELDS = SECRET_PARAMS + ('refresh_token', 'id_token', 'token')
+REDACTED = "REDACTED"
+
+USER_AGENT = "CastlesWorldwide/0.1 (https://github.com/nweerasuriya/CastlesWorldwide)"
+
+
+class RequestMetrics:
+    """Request counts and timings per host, safe to update from many threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def add(self, host, seconds, error=False):
+        with self.lock:
+            entry = self.hosts.setdefault(host, {'requests': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['requests'] += 1
+            entry['errors'] += int(error)
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def summary(self):
+        with self.lock:
+            return {host: dict(entry) for host, entry in self.hosts.items()}
+
+
+METRICS = RequestMetrics()
+
+
+def _strip_secrets(params):
+    if not isinstance(params, dict):
+        return params
+    return {k: v for k, v in params.items() if k not in SECRET_PARAMS}
+
+
+def _redact(value):
+    """Copy of a decoded JSON value with every secret field replaced"""
+    if isinstance(value, dict):
+        return {k: REDACTED if k in SECRET_FIELDS else _redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def _redact_body(content):
+    """Response body with secret JSON fields replaced; other bodies are kept as they are"""
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return content
+    redacted = _redact(body)
+    return content if redacted == body else json.dumps(redacted).encode('utf-8')
+
+
+def fixture_key(method, url, params=None, data=None):
+    """File name of the recording for a request"""
+    parts = json.dumps(
+        [method.upper(), url, _strip_secrets(params), _strip_secrets(data)],
+        sort_keys=True, default=str
+    )
+    host = urlsplit(url).hostname or 'unknown'
+    return f"{host}_{hashlib.sha1(parts.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+class HTTPClient(requests.Session):
+    """
+    requests.Session with pooling, retries, timeouts, metrics and record/replay.
+
+    Use it exactly like a Session; get_client() returns a shared instance per
+    integration.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5, pool_size=16,
+                 record_dir=None, replay_dir=None):
+        """
+        Args:
+            timeout (float): Default timeout for requests without one
+            retries (int): Retries for idempotent requests (GET, HEAD, PUT, DELETE, OPTIONS)
+            backoff (float): Backoff factor; waits are backoff * 2 ** (retry - 1) seconds
+            pool_size (int): Connections kept open per host
+            record_dir (str): Save responses here (default HTTP_RECORD_DIR)
+            replay_dir (str): Serve responses from here (default HTTP_REPLAY_DIR)
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.record_dir = record_dir or os.environ.get('HTTP_RECORD_DIR')
+        self.replay_dir = replay_dir or os.environ.get('HTTP_REPLAY_DIR')
+        self.headers.update({'User-Agent': USER_AGENT})
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            # POSTs create things (containers, uploads), so they aren't retried blindly
+            allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # urllib3 keeps a separate pool for each host behind an adapter
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = HOST_TIMEOUTS.get(urlsplit(url).hostname, self.timeout)
+
+        if self.replay_dir:
+            return self._replay(method, url, params, data)
+
+        host = urlsplit(url).hostname
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, params=params, data=data, **kwargs)
+        except requests.exceptions.RequestException:
+            METRICS.add(host, time.perf_counter() - start, error=True)
+            raise
+        METRICS.add(host, time.perf_counter() - start, error=response.status_code >= 400)
+
+        if self.record_dir:
+            self._record(method, url, params, data, response)
+        return response
+
+    def _record(self, method, url, params, data, response):
+        os.makedirs(self.record_dir, exist_ok=True)
+        recording = {
+            'method': method.upper(),
+            'url': url,
+            'params': _strip_secrets(params),
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() == 'content-type'},
+            'body': base64.b64encode(_redact_body(response.content)).decode('ascii'),
+        }
+        path = os.path.join(self.record_dir, fixture_key(method, url, params, data))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(recording, f, indent=2)
+
+    def _replay(self, method, url, params, data):
+        path = os.path.join(self.replay_dir, fixture_key(method, url, params, data))
+        if not os.path.exists(path):
+            raise requests.exceptions.ConnectionError(f"No recorded response for {method} {url} ({path})")
+        with open(path, 'r', encoding='utf-8') as f:
+            recording = json.load(f)
+
+        response = requests.Response()
+        response.status_code = recording['status']
+        response.headers.update(recording.get('headers', {}))
+        response._content = base64.b64decode(recording['body'])
+        response._content_consumed = True  # so iter_content() works on stream=True requests
+        response.url = url
+        response.encoding = 'utf-8'
+        return response
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name="default", **options):
+    """
+    Shared client for an integration, created on first use.
+    Options are only applied when the client is created.
+    """
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = HTTPClient(**options)
+        return _clients[name]
+
+
+def print_metrics():
+    """Print request counts and timings per host"""
+    summary = METRICS.summary()
+    if not summary:
+        return
+    print("🌐 HTTP requests by host:")
+    for host, entry in sorted(summary.items()):
+        average = entry['seconds'] / entry['requests']
+        print(f"  {host}: {entry['requests']} requests, {entry['errors']} errors, "
+              f"avg {average * 1000:.0f} ms, max {entry['max_seconds'] * 1000:.0f} ms")
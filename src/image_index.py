@@ -0,0 +1,308 @@
+"""
+Image index for castle videos
+
+Keeps perceptual hashes, dimensions, licence and source for every candidate
+image so the same photo found on both Wikipedia and Wikimedia Commons is only
+rendered once, and the best images for a portrait video are used first.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import io
+import json
+import os
+import re
+from urllib.parse import unquote, urlparse
+
+import requests
+
+try:
+    from http_client import get_client
+except ImportError:
+    from src.http_client import get_client
+
+try:
+    from PIL import Image
+except ImportError:  # hashing is skipped and dedup falls back to file names
+    Image = None
+
+
+COMMONS_API = "https://commons.wikimedia.org/w/api.php"
+USER_AGENT = "CastlesWorldwide/0.1 (https://github.com/nweerasuriya/CastlesWorldwide)"
+
+# Target frame for the rendered videos (vertical 9:16)
+TARGET_WIDTH = 1080
+TARGET_HEIGHT = 1920
+
+# Two hashes this close (in bits, out of 64) are treated as the same photo
+DUPLICATE_DISTANCE = 10
+
+NON_FREE_LICENCES = ('fair use', 'non-free')
+
+
+def title_from_url(url):
+    """
+    Get the 'File:' title of an upload.wikimedia.org URL.
+    Handles both original and thumbnail URLs.
+    """
+    parts = urlparse(url).path.split('/')
+    if 'thumb' in parts and len(parts) >= 2:
+        name = parts[-2]
+    else:
+        name = parts[-1]
+    return "File:" + unquote(name).replace('_', ' ')
+
+
+def language_from_url(url):
+    """
+    Get the wiki that hosts a file from its upload URL, e.g. 'commons' or 'en'.
+    """
+    parts = urlparse(url).path.split('/')
+    if len(parts) > 2 and parts[1] == 'wikipedia':
+        return parts[2]
+    return 'commons'
+
+
+def normalise_name(title):
+    """
+    Normalise a file title so resized copies of the same upload compare equal.
+    """
+    name = title.lower().split(':', 1)[-1]
+    name = re.sub(r'^\d+px-', '', name)
+    name = os.path.splitext(name)[0]
+    return re.sub(r'[^a-z0-9]', '', name)
+
+
+def difference_hash(image_bytes, hash_size=8):
+    """
+    Compute a 64-bit difference hash (dHash) of an image.
+    Returns None if Pillow is unavailable or the image cannot be read.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            pixels = list(img.convert('L').resize((hash_size + 1, hash_size)).getdata())
+    except Exception as e:
+        print(f"Error hashing image: {e}")
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two hashes"""
+    return bin(hash_a ^ hash_b).count('1')
+
+
+def portrait_fitness(width, height):
+    """
+    Share of the image that survives a crop to the 9:16 target frame (0-1).
+    """
+    if not width or not height:
+        return 0.0
+    aspect = width / height
+    target = TARGET_WIDTH / TARGET_HEIGHT
+    return min(aspect, target) / max(aspect, target)
+
+
+def resolution_quality(width, height):
+    """
+    Resolution score (0-1), saturating once the image covers the target frame.
+    """
+    if not width or not height:
+        return 0.0
+    # Pixels available once cropped to the target aspect ratio
+    target = TARGET_WIDTH / TARGET_HEIGHT
+    crop_width = min(width, height * target)
+    crop_height = crop_width / target
+    return min(crop_width * crop_height / (TARGET_WIDTH * TARGET_HEIGHT), 1.0)
+
+
+def quality_score(width, height):
+    """
+    Rank an image for use in a portrait video: resolution first, then how
+    little of it is lost to the vertical crop.
+    """
+    return 0.6 * resolution_quality(width, height) + 0.4 * portrait_fitness(width, height)
+
+
+class ImageIndex:
+    def __init__(self, cache_path="outputs/cache/image_index.json", thumb_width=256):
+        """
+        Initialize the image index.
+
+        Args:
+            cache_path (str): JSON file the index is persisted to (None to disable)
+            thumb_width (int): Width of the thumbnail downloaded for hashing
+        """
+        self.cache_path = cache_path
+        self.thumb_width = thumb_width
+        self.session = get_client("wikimedia")
+        self.entries = {}
+
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        """Persist the index so images are only hashed once"""
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+
+    def _fetch_metadata(self, urls):
+        """
+        Get dimensions, licence and a thumbnail URL for each image URL.
+        Titles are requested 50 at a time from the wiki hosting the file.
+
+        Returns:
+            dict: Mapping of URL to metadata dictionary, or None for URLs
+            whose request failed
+        """
+        by_title = {}
+        for url in urls:
+            by_title.setdefault((language_from_url(url), title_from_url(url)), []).append(url)
+
+        metadata = {}
+        keys = list(by_title)
+        for start in range(0, len(keys), 50):
+            chunk = keys[start:start + 50]
+            for language in {lang for lang, _ in chunk}:
+                titles = [title for lang, title in chunk if lang == language]
+                base_url = COMMONS_API if language == 'commons' else f"https://{language}.wikipedia.org/w/api.php"
+                params = {
+                    "action": "query",
+                    "format": "json",
+                    "titles": "|".join(titles),
+                    "prop": "imageinfo",
+                    "iiprop": "url|size|extmetadata",
+                    "iiurlwidth": self.thumb_width,
+                }
+                try:
+                    response = self.session.get(base_url, params=params, timeout=30)
+                    response.raise_for_status()
+                    query = response.json().get("query", {})
+                except requests.exceptions.RequestException as e:
+                    print(f"Error fetching image metadata: {e}")
+                    for title in titles:
+                        metadata.update(dict.fromkeys(by_title[(language, title)]))
+                    continue
+
+                # The API may normalise titles, so map them back to what was asked for
+                requested = {item["to"]: item["from"] for item in query.get("normalized", [])}
+                for page_data in query.get("pages", {}).values():
+                    info = (page_data.get("imageinfo") or [{}])[0]
+                    if not info:
+                        continue
+                    licence = info.get("extmetadata", {}).get("LicenseShortName", {}).get("value", "Unknown")
+                    title = page_data.get("title", "")
+                    for url in by_title.get((language, requested.get(title, title)), []):
+                        metadata[url] = {
+                            "title": title,
+                            "width": info.get("width", 0),
+                            "height": info.get("height", 0),
+                            "license": licence,
+                            "thumb_url": info.get("thumburl", ""),
+                        }
+        return metadata
+
+    def _hash_thumbnail(self, thumb_url):
+        """Download a thumbnail and return its difference hash (False if the download failed)"""
+        if Image is None or not thumb_url:
+            return None
+        try:
+            response = self.session.get(thumb_url, timeout=30)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading thumbnail for hashing: {e}")
+            return False
+        return difference_hash(response.content)
+
+    def add_candidates(self, urls, source):
+        """
+        Index candidate images from one source ('wikipedia' or 'commons').
+        URLs already in the index are not looked up again, unless their
+        lookup failed last time (they are kept, ranked last, until it works).
+        """
+        new_urls = [url for url in dict.fromkeys(urls)
+                    if url and (url not in self.entries or self.entries[url].get("retry"))]
+        if not new_urls:
+            return
+
+        metadata = self._fetch_metadata(new_urls)
+        for url in new_urls:
+            meta = metadata.get(url, {})
+            phash = self._hash_thumbnail(meta.get("thumb_url")) if meta is not None else False
+            meta = meta or {}
+            width = meta.get("width", 0)
+            height = meta.get("height", 0)
+            self.entries[url] = {
+                "url": url,
+                "source": source,
+                "title": meta.get("title") or title_from_url(url),
+                "width": width,
+                "height": height,
+                "license": meta.get("license", "Unknown"),
+                "phash": None if phash is False else phash,
+                "score": quality_score(width, height),
+            }
+            if phash is False:
+                # A request failed, so look the image up again next time
+                self.entries[url]["retry"] = True
+
+    def is_duplicate(self, entry, kept):
+        """Check whether an entry shows the same photo as one already kept"""
+        name = normalise_name(entry["title"])
+        for other in kept:
+            if name and name == normalise_name(other["title"]):
+                return True
+            if entry["phash"] is not None and other["phash"] is not None:
+                if hamming_distance(entry["phash"], other["phash"]) <= DUPLICATE_DISTANCE:
+                    return True
+        return False
+
+    def top_k(self, urls, k=8, min_size=400):
+        """
+        Return the k best distinct images out of the given URLs.
+
+        Args:
+            urls (list): Candidate image URLs (already indexed)
+            k (int): Maximum number of images to return
+            min_size (int): Skip images whose shorter side is below this
+
+        Returns:
+            list: Image URLs ordered best first
+        """
+        candidates = []
+        for url in dict.fromkeys(urls):
+            entry = self.entries.get(url)
+            if not entry:
+                continue
+            if any(term in entry["license"].lower() for term in NON_FREE_LICENCES):
+                continue
+            # Unknown dimensions are kept (ranked last) rather than dropped
+            if entry["width"] and min(entry["width"], entry["height"]) < min_size:
+                continue
+            candidates.append(entry)
+
+        candidates.sort(key=lambda x: x["score"], reverse=True)
+
+        kept = []
+        for entry in candidates:
+            if not self.is_duplicate(entry, kept):
+                kept.append(entry)
+            if len(kept) >= k:
+                break
+        return [entry["url"] for entry in kept]
@@ -1,151 +1,294 @@
-# src/instagram_poster.py - Instagram posting functionality for GitHub-hosted videos
+# src/instagram_poster.py - Instagram posting functionality for videos served from a media origin
 import requests
 import os
 import time
 import json
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http_client import get_client
+from media_origin import get_media_origin
+
+
+class ContainerStatusPoller:
+    """
+    Tracks the processing status of many Reels containers at once and
+    publishes each one as soon as it is FINISHED.
+
+    Containers are checked in a single batched request on a background thread.
+    Checks start every few seconds and back off towards POLL_MAX_INTERVAL, so
+    quick uploads publish quickly without hammering the API for slow ones.
+    """
+    POLL_FIRST_INTERVAL = 3
+    POLL_MAX_INTERVAL = 30
+    POLL_BACKOFF = 1.5
+    BATCH_SIZE = 50  # ids per Graph API request
+
+    def __init__(self, poster, max_wait=600):
+        self.poster = poster
+        self.max_wait = max_wait
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, container_id):
+        """Start tracking a container; returns a Future for its media ID"""
+        future = Future()
+        future.container_id = container_id
+        now = time.time()
+        with self.condition:
+            self.pending[container_id] = {
+                'future': future,
+                'submitted': now,
+                'next_check': now + self.POLL_FIRST_INTERVAL,
+                'checks': 0,
+            }
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="instagram-poller", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def cancel(self, container_id):
+        """Stop tracking a container"""
+        with self.condition:
+            entry = self.pending.pop(container_id, None)
+        if entry:
+            entry['future'].cancel()
+
+    def _finish(self, container_id, result):
+        with self.condition:
+            entry = self.pending.pop(container_id, None)
+        if entry and not entry['future'].done():
+            entry['future'].set_result(result)
+
+    def poll_once(self):
+        """
+        Check every container that is due, publish the finished ones and
+        schedule the next check for the rest.
+
+        Returns:
+            float: Seconds until the next check is due (None if nothing is pending)
+        """
+        now = time.time()
+        with self.condition:
+            due = [cid for cid, entry in self.pending.items() if entry['next_check'] <= now]
+
+        for start in range(0, len(due), self.BATCH_SIZE):
+            batch = due[start:start + self.BATCH_SIZE]
+            try:
+                statuses = self.poster.get_container_statuses(batch)
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Network error checking container status: {e}")
+                statuses = {}
+
+            for container_id in batch:
+                status_code = statuses.get(container_id, 'UNKNOWN')
+                with self.condition:
+                    entry = self.pending.get(container_id)
+                if entry is None:
+                    continue
+                entry['checks'] += 1
+                print(f"🔄 Processing status of {container_id}: {status_code} (check {entry['checks']})")
+
+                if status_code == 'FINISHED':
+                    print(f"✅ Media processing completed: {container_id}")
+                    try:
+                        result = self.poster.publish_container(container_id)
+                    except requests.exceptions.RequestException as e:
+                        print(f"❌ Network error publishing {container_id}: {e}")
+                        result = False
+                    self._finish(container_id, result)
+                elif status_code in ('ERROR', 'EXPIRED'):
+                    print(f"❌ Media processing failed: {container_id} ({status_code})")
+                    self._finish(container_id, False)
+                elif time.time() - entry['submitted'] > self.max_wait:
+                    print(f"❌ Media processing timeout ({self.max_wait // 60} minutes): {container_id}")
+                    self._finish(container_id, False)
+                else:
+                    if status_code not in ('IN_PROGRESS', 'PUBLISHED'):
+                        print(f"⚠️ Unknown status: {status_code}")
+                    interval = min(self.POLL_FIRST_INTERVAL * self.POLL_BACKOFF ** entry['checks'],
+                                   self.POLL_MAX_INTERVAL)
+                    entry['next_check'] = time.time() + interval
+
+        with self.condition:
+            return self._wait_time()
+
+    def _wait_time(self):
+        """Seconds until the next check is due (None if nothing is pending); call holding the lock"""
+        if not self.pending:
+            return None
+        return max(min(entry['next_check'] for entry in self.pending.values()) - time.time(), 0)
+
+    def _run(self):
+        """Background loop: poll whenever a container is due, exit when idle"""
+        while True:
+            self.poll_once()
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    return
+                # Computed under the lock, so a container submitted since
+                # poll_once returned is included rather than its wakeup lost
+                wait_time = self._wait_time()
+                if wait_time:
+                    # Woken early if a new container is submitted
+                    self.condition.wait(timeout=wait_time)
+
 
 class InstagramPoster:
-    def __init__(self):
+    def __init__(self, media_origin=None):
         self.access_token = os.getenv('INSTAGRAM_ACCESS_TOKEN')
         self.user_id = os.getenv('INSTAGRAM_USER_ID')
         self.base_url = "https://graph.facebook.com/v18.0"
+        self.session = get_client("instagram")
+        self.poller = ContainerStatusPoller(self)
+        self.media_origin = media_origin or get_media_origin()
+        self.video_urls = {}
         
         if not self.access_token or not self.user_id:
             print("❌ Instagram credentials not found in environment variables")
             print("Required: INSTAGRAM_ACCESS_TOKEN, INSTAGRAM_USER_ID")
     
-    def get_github_video_url(self, video_path):
-        """Convert local GitHub path to raw GitHub URL"""
-        try:
-            # Get repository info from environment
-            repo = os.environ.get('GITHUB_REPOSITORY')  # e.g., "nweerasuriya/CastlesWorldwide"
-            
-            if not repo:
-                print("❌ GITHUB_REPOSITORY not found in environment")
-                return None
+    def prepare_media(self, video_paths):
+        """Make videos available on the media origin and verify them in one batch"""
+        self.media_origin.prepare(video_paths)
+        urls = self.media_origin.check_available(video_paths)
+        for video_path, url in urls.items():
+            if url:
+                print(f"✅ Video URL is accessible: {url}")
+            else:
+                print(f"❌ Video URL not accessible: {video_path}")
+        self.video_urls.update(urls)
+        return urls
+    
+    def get_video_url(self, video_path):
+        """Public URL Instagram can fetch the video from, or None if unreachable"""
+        if video_path not in self.video_urls:
+            self.prepare_media([video_path])
+        video_url = self.video_urls.get(video_path)
+        if video_url:
+            print(f"📡 Video URL: {video_url}")
+        return video_url
+    
+    def create_container(self, video_path, caption):
+        """Create a Reels media container, returning its ID or None"""
+        # Step 1: Get the public URL for the video
+        video_url = self.get_video_url(video_path)
+        if not video_url:
+            return None
+        
+        # Step 2: Create media container
+        print("📤 Creating Instagram media container...")
+        
+        create_url = f"{self.base_url}/{self.user_id}/media"
+        
+        params = {
+            'media_type': 'REELS',
+            'video_url': video_url,
+            'caption': caption,
+            'access_token': self.access_token
+        }
+        
+        print(f"🎬 Posting video: {os.path.basename(video_path)}")
+        print(f"📝 Caption: {caption[:50]}...")
+        
+        response = self.session.post(create_url, data=params, timeout=30)
+        response_data = response.json()
+        
+        if 'id' not in response_data:
+            print(f"❌ Failed to create media container")
+            print(f"Response: {json.dumps(response_data, indent=2)}")
             
-            # Convert path to raw GitHub URL
-            github_url = f"https://raw.githubusercontent.com/{repo}/main/{video_path}"
-            print(f"📡 GitHub video URL: {github_url}")
+            # Check for specific errors
+            if 'error' in response_data:
+                error_msg = response_data['error'].get('message', 'Unknown error')
+                error_code = response_data['error'].get('code', 'Unknown code')
+                print(f"❌ Instagram API Error ({error_code}): {error_msg}")
             
-            # Test if URL is accessible
-            test_response = requests.head(github_url, timeout=10)
-            if test_response.status_code == 200:
-                print("✅ Video URL is accessible")
-                return github_url
-            else:
-                print(f"❌ Video URL not accessible: {test_response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Error creating GitHub URL: {e}")
             return None
+        
+        container_id = response_data['id']
+        print(f"✅ Media container created: {container_id}")
+        return container_id
+    
+    def get_container_statuses(self, container_ids):
+        """Get the processing status of up to 50 containers in one request"""
+        response = self.session.get(
+            f"{self.base_url}/",
+            params={
+                'ids': ','.join(container_ids),
+                'fields': 'status_code',
+                'access_token': self.access_token
+            },
+            timeout=30
+        )
+        data = response.json()
+        if 'error' in data:
+            print(f"⚠️ Status check failed: {data['error'].get('message', 'Unknown error')}")
+            return {}
+        return {container_id: data.get(container_id, {}).get('status_code', 'UNKNOWN')
+                for container_id in container_ids}
+    
+    def publish_container(self, container_id):
+        """Publish a processed container, returning the media ID or False"""
+        print(f"📱 Publishing {container_id} to Instagram...")
+        publish_url = f"{self.base_url}/{self.user_id}/media_publish"
+        publish_params = {
+            'creation_id': container_id,
+            'access_token': self.access_token
+        }
+        
+        publish_response = self.session.post(publish_url, data=publish_params, timeout=30)
+        publish_data = publish_response.json()
+        
+        if 'id' in publish_data:
+            media_id = publish_data['id']
+            print(f"🎉 Successfully posted to Instagram!")
+            print(f"📱 Media ID: {media_id}")
+            return media_id
+        else:
+            print(f"❌ Failed to publish to Instagram")
+            print(f"Response: {json.dumps(publish_data, indent=2)}")
+            return False
     
-    def post_video(self, video_path, caption):
-        """Post video to Instagram as Reel using GitHub-hosted video"""
+    def submit_video(self, video_path, caption):
+        """
+        Create a Reels container and hand it to the status poller without waiting.
+        Returns a Future that resolves to the media ID (or False) once the
+        container has been processed and published.
+        """
         if not self.access_token or not self.user_id:
             print("❌ Instagram credentials missing")
-            return False
+            return None
         
         try:
-            # Step 1: Get GitHub URL for video
-            video_url = self.get_github_video_url(video_path)
-            if not video_url:
-                return False
-            
-            # Step 2: Create media container
-            print("📤 Creating Instagram media container...")
-            
-            create_url = f"{self.base_url}/{self.user_id}/media"
-            
-            params = {
-                'media_type': 'REELS',
-                'video_url': video_url,
-                'caption': caption,
-                'access_token': self.access_token
-            }
-            
-            print(f"🎬 Posting video: {os.path.basename(video_path)}")
-            print(f"📝 Caption: {caption[:50]}...")
-            
-            response = requests.post(create_url, data=params, timeout=30)
-            response_data = response.json()
-            
-            if 'id' not in response_data:
-                print(f"❌ Failed to create media container")
-                print(f"Response: {json.dumps(response_data, indent=2)}")
-                
-                # Check for specific errors
-                if 'error' in response_data:
-                    error_msg = response_data['error'].get('message', 'Unknown error')
-                    error_code = response_data['error'].get('code', 'Unknown code')
-                    print(f"❌ Instagram API Error ({error_code}): {error_msg}")
-                
+            container_id = self.create_container(video_path, caption)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Network error: {e}")
+            return None
+        if not container_id:
+            return None
+        return self.poller.submit(container_id)
+    
+    def post_video(self, video_path, caption, deadline=None):
+        """Post video to Instagram as Reel, served from the media origin.
+        Stops waiting for processing once time.time() passes deadline, if given."""
+        try:
+            future = self.submit_video(video_path, caption)
+            if future is None:
                 return False
             
-            container_id = response_data['id']
-            print(f"✅ Media container created: {container_id}")
-            
-            # Step 3: Check container status and wait for processing
+            # Step 3: Wait for the poller to publish it
             print("⏳ Waiting for media processing...")
-            max_attempts = 60  # Wait up to 10 minutes
-            
-            for attempt in range(max_attempts):
-                status_url = f"{self.base_url}/{container_id}"
-                status_params = {
-                    'fields': 'status_code',
-                    'access_token': self.access_token
-                }
-                
-                status_response = requests.get(status_url, params=status_params, timeout=30)
-                status_data = status_response.json()
-                
-                status_code = status_data.get('status_code', 'UNKNOWN')
-                print(f"🔄 Processing status: {status_code} (attempt {attempt + 1}/{max_attempts})")
-                
-                if status_code == 'FINISHED':
-                    print("✅ Media processing completed")
-                    break
-                elif status_code == 'ERROR':
-                    print(f"❌ Media processing failed: {status_data}")
-                    return False
-                elif status_code in ['IN_PROGRESS', 'PUBLISHED']:
-                    # Continue waiting
-                    time.sleep(10)  # Wait 10 seconds before checking again
-                else:
-                    print(f"⚠️ Unknown status: {status_code}")
-                    time.sleep(10)
-            else:
-                print("❌ Media processing timeout (10 minutes)")
-                return False
-            
-            # Step 4: Publish media
-            print("📱 Publishing to Instagram...")
-            publish_url = f"{self.base_url}/{self.user_id}/media_publish"
-            publish_params = {
-                'creation_id': container_id,
-                'access_token': self.access_token
-            }
-            
-            publish_response = requests.post(publish_url, data=publish_params, timeout=30)
-            publish_data = publish_response.json()
-            
-            if 'id' in publish_data:
-                media_id = publish_data['id']
-                print(f"🎉 Successfully posted to Instagram!")
-                print(f"📱 Media ID: {media_id}")
-                return media_id
-            else:
-                print(f"❌ Failed to publish to Instagram")
-                print(f"Response: {json.dumps(publish_data, indent=2)}")
+            timeout = max(deadline - time.time(), 0) if deadline else None
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                print("❌ Publishing deadline reached while waiting for media processing")
+                self.poller.cancel(future.container_id)
                 return False
                 
-        except requests.exceptions.Timeout:
-            print("❌ Request timeout - Instagram API might be slow")
-            return False
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error: {e}")
-            return False
         except Exception as e:
             print(f"❌ Instagram posting error: {e}")
             return False
@@ -162,7 +305,7 @@ class InstagramPoster:
                 'access_token': self.access_token
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -189,12 +332,12 @@ if __name__ == "__main__":
         
         # Test URL generation
         test_video = "content/castles_videos/test_video.mp4"
-        test_url = poster.get_github_video_url(test_video)
+        test_url = poster.get_video_url(test_video)
         
         if test_url:
-            print(f"✅ GitHub URL generation working: {test_url}")
+            print(f"✅ Media origin URL working: {test_url}")
         else:
-            print("❌ GitHub URL generation failed")
+            print("❌ Media origin URL not accessible")
     else:
         print("\n❌ Instagram setup has issues")
         print("Check your environment variables:")
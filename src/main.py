@@ -1,54 +1,140 @@
 # src/main.py - Main posting orchestrator (YouTube + Instagram)
-import json
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
 from youtube_uploader import YouTubeUploader
 from instagram_poster import InstagramPoster
+from http_client import print_metrics
+from schedule_store import open_store
+from video_validation import publish_file
 
-def load_schedule():
-    """Load the posting schedule from JSON file"""
-    try:
-        with open('content/schedule.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("❌ No schedule.json found. Run the bulk scheduler first.")
-        return None
-    except json.JSONDecodeError:
-        print("❌ Invalid JSON in schedule.json")
-        return None
+# Uploads allowed at once per platform (the YouTube API client is not thread-safe).
+# Instagram threads mostly wait on the shared status poller, so more can be in flight.
+PLATFORM_CONCURRENCY = {
+    'youtube': 1,
+    'instagram': 10,
+}
 
-def save_schedule(schedule_data):
-    """Save updated schedule back to JSON file"""
-    with open('content/schedule.json', 'w', encoding='utf-8') as f:
-        json.dump(schedule_data, f, indent=2, ensure_ascii=False)
+# Everything must be published within this many seconds of the job starting
+PUBLISH_DEADLINE_SECONDS = int(os.environ.get('PUBLISH_DEADLINE_SECONDS', 40 * 60))
+# How long uploads already running at the deadline get to reach their next
+# deadline check (one chunk) and report back, so a late success is recorded
+DEADLINE_GRACE_SECONDS = int(os.environ.get('DEADLINE_GRACE_SECONDS', 3 * 60))
+# Unposted posts from this many earlier days are picked up again (e.g. an
+# upload stopped at the deadline), oldest first, before today's
+CATCH_UP_DAYS = int(os.environ.get('CATCH_UP_DAYS', 3))
 
-def get_today_posts(schedule_data):
-    """Get posts scheduled for today"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    today_posts = []
+def get_due_posts(store, catch_up_days=CATCH_UP_DAYS):
+    """Get posts scheduled for today, or the last few days, that haven't been posted yet"""
+    today = datetime.now()
+    posts = []
+    for offset in range(catch_up_days, -1, -1):
+        date_key = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+        posts.extend(post for post in store.get_posts(date_key) if not post['posted'])
+    return posts
+
+def publish_to_youtube(youtube_uploader, post, deadline=None):
+    """Upload one post to YouTube, returning the video ID or None"""
+    video_id = youtube_uploader.upload_video(
+        video_path=post['publish_files']['youtube'],
+        title=post['youtube']['title'],
+        description=post['youtube']['description'],
+        tags=post['youtube']['tags'],
+        deadline=deadline
+    )
+    if video_id:
+        print(f"✅ YouTube: https://youtube.com/watch?v={video_id}")
+    else:
+        print(f"❌ YouTube upload failed: {post['id']}")
+    return video_id
+
+def publish_to_instagram(instagram_poster, post, deadline=None):
+    """Post one video to Instagram, returning the media ID or None"""
+    media_id = instagram_poster.post_video(
+        video_path=post['publish_files']['instagram'],
+        caption=post['instagram']['caption'],
+        deadline=deadline
+    )
+    if media_id:
+        print(f"✅ Instagram: Media ID {media_id}")
+    else:
+        print(f"❌ Instagram upload failed: {post['id']}")
+    return media_id
+
+def publish_posts(posts, publishers, deadline):
+    """
+    Publish every post to every platform concurrently.
+
+    Each platform gets its own thread pool, sized by PLATFORM_CONCURRENCY, so
+    a slow platform (Instagram processing) never holds up another one.
+
+    Args:
+        posts: Posts to publish
+        publishers: Dictionary of platform name to a function taking a post
+        deadline: time.time() by which all publishing must be finished
+
+    Returns:
+        dict: {post id: {platform: result}}, result None on failure or timeout
+    """
+    results = {post['id']: {platform: None for platform in publishers} for post in posts}
+    executors = {
+        platform: ThreadPoolExecutor(max_workers=PLATFORM_CONCURRENCY.get(platform, 1),
+                                     thread_name_prefix=platform)
+        for platform in publishers
+    }
+    
+    futures = {}
+    for post in posts:
+        for platform, publish in publishers.items():
+            if platform in post.get('platforms', publishers):
+                futures[executors[platform].submit(publish, post)] = (post, platform)
     
-    for post in schedule_data.get('posts', []):
-        if post['scheduled_date'] == today and not post['posted']:
-            today_posts.append(post)
+    done, not_done = wait(futures, timeout=max(deadline - time.time(), 0))
     
-    return today_posts
+    # Don't start anything still queued
+    for executor in executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Uploads already running stop at their next deadline check; wait for them
+    # so one that finishes late is still recorded and not posted again next run
+    if not_done:
+        late_done, not_done = wait(not_done, timeout=DEADLINE_GRACE_SECONDS)
+        done |= {future for future in late_done if not future.cancelled()}
+        not_done |= {future for future in late_done if future.cancelled()}
+    
+    for future in done:
+        post, platform = futures[future]
+        try:
+            results[post['id']][platform] = future.result()
+        except Exception as e:
+            print(f"❌ {platform} upload error for {post['id']}: {e}")
+    
+    for future in not_done:
+        post, platform = futures[future]
+        print(f"⏰ {platform} did not finish {post['id']} before the deadline")
+    
+    return results
 
 def main():
     print("🤖 Starting daily social media posting...")
     print("🎯 Platforms: YouTube + Instagram")
+    deadline = time.time() + PUBLISH_DEADLINE_SECONDS
     
-    # Load schedule
-    schedule = load_schedule()
-    if not schedule:
+    # Open the schedule store and fold older posting results into their shards
+    store = open_store()
+    if store.is_empty():
+        print("❌ No schedule found. Run the bulk scheduler first.")
         return
+    store.compact(before=datetime.now().strftime('%Y-%m-%d'))
     
-    # Get today's posts
-    today_posts = get_today_posts(schedule)
+    # Get today's posts, and any earlier ones that didn't make it
+    today_posts = get_due_posts(store)
     if not today_posts:
         print("📅 No posts scheduled for today")
         return
     
-    print(f"📋 Found {len(today_posts)} posts scheduled for today")
+    print(f"📋 Found {len(today_posts)} posts due (scheduled for today or the last {CATCH_UP_DAYS} days)")
     
     # Initialize uploaders
     youtube_uploader = YouTubeUploader()
@@ -65,85 +151,84 @@ def main():
         print("❌ No platforms available - check your credentials")
         return
     
-    posted_count = 0
+    publishers = {}
+    if youtube_ready:
+        publishers['youtube'] = lambda post: publish_to_youtube(youtube_uploader, post, deadline)
+    else:
+        print("⏭️ Skipping YouTube (credentials not available)")
+    if instagram_ready:
+        publishers['instagram'] = lambda post: publish_to_instagram(instagram_poster, post, deadline)
+    else:
+        print("⏭️ Skipping Instagram (credentials not available)")
     
+    # Check every video meets the platform limits before starting any uploads;
+    # variants are normally prepared ahead of posting day by video_validation.py
+    ready_posts = []
     for post in today_posts:
-        print(f"\n{'='*60}")
-        print(f"🎬 Processing: {post['youtube']['title']}")
+        print(f"🎬 Queued: {post['youtube']['title']}")
         print(f"📁 Video: {post['video_file']}")
-        
-        # Check if video file exists
         if not os.path.exists(post['video_file']):
             print(f"❌ Video file not found: {post['video_file']}")
             continue
-        
-        youtube_success = False
-        instagram_success = False
-        
-        # Upload to YouTube
-        if youtube_ready:
-            try:
-                print(f"\n📺 YOUTUBE UPLOAD")
-                print("-" * 20)
-                video_id = youtube_uploader.upload_video(
-                    video_path=post['video_file'],
-                    title=post['youtube']['title'],
-                    description=post['youtube']['description'],
-                    tags=post['youtube']['tags']
-                )
-                
-                if video_id:
-                    print(f"✅ YouTube: https://youtube.com/watch?v={video_id}")
-                    post['youtube_video_id'] = video_id
-                    youtube_success = True
+        publish_files = {}
+        for platform in publishers:
+            if platform in post.get('platforms', publishers):
+                path = publish_file(post, platform)
+                if path:
+                    publish_files[platform] = path
                 else:
-                    print("❌ YouTube upload failed")
-            except Exception as e:
-                print(f"❌ YouTube upload error: {e}")
-        else:
-            print("⏭️ Skipping YouTube (credentials not available)")
-        
-        # Post to Instagram
-        if instagram_ready:
-            try:
-                print(f"\n📱 INSTAGRAM UPLOAD")
-                print("-" * 22)
-                media_id = instagram_poster.post_video(
-                    video_path=post['video_file'],
-                    caption=post['instagram']['caption']
-                )
-                
-                if media_id:
-                    print(f"✅ Instagram: Media ID {media_id}")
-                    post['instagram_media_id'] = media_id
-                    instagram_success = True
-                else:
-                    print("❌ Instagram upload failed")
-            except Exception as e:
-                print(f"❌ Instagram upload error: {e}")
-        else:
-            print("⏭️ Skipping Instagram (credentials not available)")
+                    print(f"❌ {post['id']} can't be published to {platform}")
+        if not publish_files:
+            continue
+        post['publish_files'] = publish_files
+        post['platforms'] = sorted(publish_files)
+        ready_posts.append(post)
+    
+    # Make every video available to Instagram and check them in one batch
+    instagram_files = [post['publish_files']['instagram'] for post in ready_posts if 'instagram' in post['publish_files']]
+    if instagram_ready and instagram_files:
+        instagram_poster.prepare_media(instagram_files)
+    
+    print(f"\n{'='*60}")
+    print(f"🚀 Publishing {len(ready_posts)} posts to {' + '.join(publishers)} in parallel")
+    results = publish_posts(ready_posts, publishers, deadline)
+    
+    posted_count = 0
+    
+    for post in ready_posts:
+        youtube_id = results[post['id']].get('youtube')
+        instagram_id = results[post['id']].get('instagram')
+        youtube_success = bool(youtube_id)
+        instagram_success = bool(instagram_id)
         
         # Mark as posted if at least one platform succeeded
         if youtube_success or instagram_success:
-            post['posted'] = True
-            post['posted_timestamp'] = datetime.now().isoformat()
-            post['platforms_posted'] = {
-                'youtube': youtube_success,
-                'instagram': instagram_success
+            result = {
+                'posted': True,
+                'posted_timestamp': datetime.now().isoformat(),
+                'platforms_posted': {
+                    'youtube': youtube_success,
+                    'instagram': instagram_success
+                }
             }
+            if youtube_success:
+                result['youtube_video_id'] = youtube_id
+            if instagram_success:
+                result['instagram_media_id'] = instagram_id
+            # Appended to today's ledger rather than rewriting the schedule
+            store.record_result(post, **result)
             posted_count += 1
             
             success_platforms = []
             if youtube_success: success_platforms.append("YouTube")
             if instagram_success: success_platforms.append("Instagram")
             
-            print(f"\n🎉 SUCCESS: Posted to {' + '.join(success_platforms)}")
+            print(f"🎉 SUCCESS: {post['id']} posted to {' + '.join(success_platforms)}")
         else:
-            print(f"\n💥 FAILED: No platforms succeeded")
+            print(f"💥 FAILED: {post['id']} - no platforms succeeded")
     
-    # Save updated schedule
-    save_schedule(schedule)
+    instagram_poster.media_origin.close()
+    print_metrics()
     
     print(f"\n{'='*60}")
     print(f"🏁 DAILY POSTING COMPLETE!")
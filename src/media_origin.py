@@ -0,0 +1,360 @@
+"""
+Media origins for Instagram publishing
+
+Instagram pulls each Reel from a public URL. A media origin decides where
+that URL points and checks, in one batch, that the files are reachable.
+
+- GitHubRawOrigin: files committed to the repo, served by raw.githubusercontent.com
+  (not the transcoded variants, which are kept out of git)
+- LocalHTTPOrigin: the prepared files (and nothing else) served from this
+  machine by a small HTTP server with range request support, exposed
+  through MEDIA_PUBLIC_BASE_URL
+- S3Origin: files uploaded to an S3-compatible bucket (AWS S3, Cloudflare
+  R2, MinIO, ...) and fetched through presigned URLs, or through
+  MEDIA_PUBLIC_BASE_URL for a public bucket
+
+The origin is chosen with the MEDIA_ORIGIN environment variable; without it,
+S3Origin is used when MEDIA_BUCKET is set and GitHubRawOrigin otherwise.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+import requests
+
+from http_client import get_client
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for S3Origin
+    boto3 = None
+
+
+# Directories kept out of git (transcoded variants live in outputs/cache)
+LOCAL_ONLY_DIRS = ("outputs",)
+
+
+def is_local_only(video_path):
+    """Whether a file is in a directory that is never committed"""
+    parts = os.path.normpath(os.path.relpath(video_path)).split(os.sep)
+    return parts[0] in LOCAL_ONLY_DIRS
+
+
+class MediaOrigin(ABC):
+    """Base class for the places Instagram can fetch videos from"""
+
+    def __init__(self):
+        self.session = get_client("media_origin")
+
+    @abstractmethod
+    def url_for(self, video_path):
+        """Public URL of a local video file"""
+
+    def prepare(self, video_paths):
+        """Make the files available before publishing (upload, start a server, ...)"""
+
+    def is_available(self, url):
+        """Check a single URL responds to a HEAD request"""
+        try:
+            response = self.session.head(url, allow_redirects=True)
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Error checking {url}: {e}")
+            return False
+
+    def check_available(self, video_paths, max_workers=8):
+        """
+        Check all files at once.
+
+        Returns:
+            dict: Mapping of video path to its public URL, or None if unreachable
+        """
+        urls = {path: self.url_for(path) for path in video_paths}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            available = dict(zip(urls, executor.map(self.is_available, urls.values())))
+        return {path: urls[path] if available[path] else None for path in urls}
+
+    def close(self):
+        """Release any resources held by the origin"""
+
+
+class GitHubRawOrigin(MediaOrigin):
+    """Videos committed to the repository and served by raw.githubusercontent.com"""
+
+    def __init__(self, repo=None, branch="main"):
+        super().__init__()
+        self.repo = repo or os.environ.get('GITHUB_REPOSITORY')  # e.g., "nweerasuriya/CastlesWorldwide"
+        self.branch = branch
+        if not self.repo:
+            print("❌ GITHUB_REPOSITORY not found in environment")
+
+    def url_for(self, video_path):
+        return f"https://raw.githubusercontent.com/{self.repo}/{self.branch}/{quote(video_path)}"
+
+    def check_available(self, video_paths, max_workers=8):
+        if not self.repo:
+            return {path: None for path in video_paths}
+        # Gitignored files never reach raw.githubusercontent.com
+        local_only = [path for path in video_paths if is_local_only(path)]
+        for path in local_only:
+            print(f"❌ {path} is not in the repo, publish it through a bucket (MEDIA_BUCKET)")
+        urls = super().check_available([path for path in video_paths if path not in local_only], max_workers)
+        return {path: urls.get(path) for path in video_paths}
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler with HTTP range support, so clients can fetch the
+    parts of an MP4 they need. File bodies are sent with os.sendfile where
+    the platform allows it.
+    """
+    RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+    def __init__(self, *args, allowed=None, **kwargs):
+        # Absolute paths that may be served; anything else is a 404
+        self.allowed = allowed if allowed is not None else set()
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        path = os.path.realpath(self.translate_path(self.path))
+        if path not in self.allowed or not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+
+        range_header = self.headers.get('Range')
+        if range_header:
+            match = self.RANGE_PATTERN.match(range_header.strip())
+            if not match or not (match.group(1) or match.group(2)):
+                self._send_unsatisfiable(size)
+                return
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                # Suffix range: the last N bytes
+                start = max(size - int(match.group(2)), 0)
+            if start > end:
+                self._send_unsatisfiable(size)
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Last-Modified', formatdate(os.path.getmtime(path), usegmt=True))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        if send_body:
+            with open(path, 'rb') as f:
+                self._send_file(f, start, end - start + 1)
+
+    def _send_unsatisfiable(self, size):
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{size}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_file(self, f, offset, length):
+        try:
+            while length > 0:
+                sent = os.sendfile(self.connection.fileno(), f.fileno(), offset, length)
+                if sent == 0:
+                    break
+                offset += sent
+                length -= sent
+        except (AttributeError, OSError):
+            # No sendfile on this platform/socket, fall back to a buffered copy
+            f.seek(offset)
+            while length > 0:
+                chunk = f.read(min(length, 1024 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+    def log_message(self, format, *args):
+        # Instagram fetches in many ranges; keep the job log readable
+        pass
+
+
+class LocalHTTPOrigin(MediaOrigin):
+    """
+    Videos served by a local HTTP server. Only the files passed to prepare()
+    are served, never the rest of root_dir (which holds .git, content/ and
+    so on). The server listens on localhost; public_base_url is the
+    externally reachable address that forwards to it (e.g. a tunnel or
+    reverse proxy).
+    """
+
+    def __init__(self, public_base_url=None, root_dir=".", host="127.0.0.1", port=8000):
+        super().__init__()
+        self.public_base_url = (public_base_url or os.environ.get('MEDIA_PUBLIC_BASE_URL', '')).rstrip('/')
+        self.root_dir = os.path.realpath(root_dir)
+        self.host = host
+        self.port = port
+        self.server = None
+        self.allowed = set()
+        if not self.public_base_url:
+            print("❌ MEDIA_PUBLIC_BASE_URL not found in environment")
+
+    def start(self):
+        """Start serving in a background thread (no-op if already running)"""
+        if self.server:
+            return
+        handler = partial(RangeRequestHandler, directory=self.root_dir, allowed=self.allowed)
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        threading.Thread(target=self.server.serve_forever, name="media-origin", daemon=True).start()
+        print(f"📡 Serving prepared media on {self.host}:{self.server.server_address[1]}")
+
+    def url_for(self, video_path):
+        relative = os.path.relpath(os.path.abspath(video_path), self.root_dir).replace(os.sep, '/')
+        return f"{self.public_base_url}/{quote(relative)}"
+
+    def prepare(self, video_paths):
+        for video_path in video_paths:
+            path = os.path.realpath(video_path)
+            if os.path.commonpath([path, self.root_dir]) != self.root_dir:
+                print(f"❌ Not serving {video_path}: outside {self.root_dir}")
+                continue
+            self.allowed.add(path)
+        self.start()
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class S3Origin(MediaOrigin):
+    """
+    Videos uploaded to an S3-compatible bucket. Objects are keyed by a hash
+    of the file's contents, so a file is uploaded once and a changed file
+    never reuses a stale object. Instagram is given a presigned GET URL
+    unless public_base_url points at a public bucket or CDN.
+
+    Credentials come from the usual AWS environment variables
+    (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY); endpoint_url selects a
+    provider other than AWS, e.g. https://<account>.r2.cloudflarestorage.com.
+    A bucket lifecycle rule should expire old objects.
+    """
+    # Presigned URLs stay valid long enough for Instagram to finish fetching
+    URL_EXPIRY_SECONDS = 6 * 60 * 60
+
+    def __init__(self, bucket=None, prefix=None, public_base_url=None, endpoint_url=None, region=None):
+        super().__init__()
+        if boto3 is None:
+            raise ImportError("boto3 is required for the s3 media origin")
+        self.bucket = bucket or os.environ.get('MEDIA_BUCKET')
+        self.prefix = prefix if prefix is not None else os.environ.get('MEDIA_PREFIX', 'videos/')
+        self.public_base_url = (public_base_url or os.environ.get('MEDIA_PUBLIC_BASE_URL', '')).rstrip('/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or os.environ.get('MEDIA_ENDPOINT_URL') or None,
+            region_name=region or os.environ.get('MEDIA_REGION') or None,
+        )
+        self.keys = {}
+        if not self.bucket:
+            print("❌ MEDIA_BUCKET not found in environment")
+
+    def object_key(self, video_path):
+        """Bucket key for a file: its content hash, then its name"""
+        if video_path not in self.keys:
+            digest = hashlib.sha1()
+            with open(video_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            self.keys[video_path] = f"{self.prefix}{digest.hexdigest()[:16]}/{os.path.basename(video_path)}"
+        return self.keys[video_path]
+
+    def object_exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def url_for(self, video_path):
+        key = self.object_key(video_path)
+        if self.public_base_url:
+            return f"{self.public_base_url}/{quote(key)}"
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=self.URL_EXPIRY_SECONDS
+        )
+
+    def prepare(self, video_paths):
+        """Upload the files not already in the bucket"""
+        if not self.bucket:
+            return
+        for video_path in video_paths:
+            key = self.object_key(video_path)
+            try:
+                if self.object_exists(key):
+                    continue
+                print(f"📤 Uploading {os.path.basename(video_path)} to {self.bucket}...")
+                self.client.upload_file(video_path, self.bucket, key, ExtraArgs={
+                    'ContentType': mimetypes.guess_type(video_path)[0] or 'video/mp4'
+                })
+            except ClientError as e:
+                print(f"❌ Error uploading {video_path}: {e}")
+
+    def is_available(self, url):
+        # A presigned GET URL isn't valid for HEAD, so ask for the first byte instead
+        if self.public_base_url:
+            return super().is_available(url)
+        try:
+            response = self.session.get(url, headers={'Range': 'bytes=0-0'})
+            return response.status_code in (200, 206)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Error checking {url}: {e}")
+            return False
+
+    def check_available(self, video_paths, max_workers=8):
+        if not self.bucket:
+            return {path: None for path in video_paths}
+        return super().check_available(video_paths, max_workers)
+
+
+MEDIA_ORIGINS = {
+    'github': GitHubRawOrigin,
+    'local': LocalHTTPOrigin,
+    's3': S3Origin,
+}
+
+
+def get_media_origin(name=None):
+    """Create the media origin named by MEDIA_ORIGIN (default 's3' with a MEDIA_BUCKET, else 'github')"""
+    name = name or os.environ.get('MEDIA_ORIGIN') or ('s3' if os.environ.get('MEDIA_BUCKET') else 'github')
+    if name not in MEDIA_ORIGINS:
+        raise ValueError(f"Unknown media origin '{name}', expected one of: {', '.join(MEDIA_ORIGINS)}")
+    return MEDIA_ORIGINS[name]()
@@ -8,11 +8,17 @@ __version__ = "0.1"
 
 
 
-import requests
 import pandas as pd
 import time
 from tqdm import tqdm
 
+try:
+    from castle_merge import deduplicate
+    from http_client import get_client
+except ImportError:
+    from src.castle_merge import deduplicate
+    from src.http_client import get_client
+
 def get_castles_from_overpass(country=None):
     """
     Fetch castle data from OpenStreetMap using Overpass API
@@ -49,7 +55,7 @@ def get_castles_from_overpass(country=None):
         out center;
         """
     
-    response = requests.get(overpass_url, params={'data': overpass_query})
+    response = get_client("overpass").get(overpass_url, params={'data': overpass_query})
     
     if response.status_code != 200:
         print(f"Error: {response.status_code}")
@@ -63,7 +69,7 @@ def get_castles_from_overpass(country=None):
         if element['type'] == 'node':
             lat = element['lat']
             lon = element['lon']
-        elif 'centre' in element:
+        elif 'center' in element:
             lat = element['center']['lat']
             lon = element['center']['lon']
         else:
@@ -128,7 +134,8 @@ def get_castles_by_countries(countries):
     # Convert to DataFrame
     df = pd.DataFrame(all_castles)
     
-    # Remove duplicates based on location
-    df = df.drop_duplicates(subset=['latitude', 'longitude'])
+    # Remove duplicates based on location (castles without coordinates are kept)
+    if not df.empty:
+        df = deduplicate(df)
     
     return df
@@ -1,4 +1,4 @@
-import requests
+from http_client import get_client
 import os
 import subprocess
 import json
@@ -20,7 +20,7 @@ def refresh_and_update_token():
             'access_token': current_token
         }
         
-        response = requests.get(url, params=params)
+        response = get_client("instagram").get(url, params=params)
         
         if response.status_code == 200:
             data = response.json()
@@ -0,0 +1,328 @@
+"""
+Render queue for castle videos
+
+Rendering is the slowest step, so castles are rendered in order of how good
+a video they are likely to make. Each castle gets a base score from its
+description, its distinct high-resolution images, the classifier's
+confidence and (once videos have been posted) the engagement of similar
+castles. The queue then interleaves countries, discounting a country each
+time one of its castles is rendered or queued.
+
+Base scores are kept in a JSON cache with a fingerprint of their inputs,
+so an update only rescores castles whose description, images, confidence or
+engagement changed; ordering is a heap merge over countries rather than a
+sort of the whole CSV.
+
+Counting distinct high-resolution images means fetching and hashing them, so
+every castle is first scored on its number of image URLs, and only the
+castles that reach the top of the queue are rescored with the image index.
+The counting method is part of the fingerprint, so a URL-count score is
+replaced once the index has been run for that castle.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import hashlib
+import heapq
+import json
+import os
+import re
+from ast import literal_eval
+
+from schedule_generator import get_castle_names_from_videos, safe_name
+
+RENDER_QUEUE_CACHE = "outputs/cache/render_queue.json"
+
+# How much each signal contributes to the base score; engagement is left
+# out (and the rest rescaled) until there is analytics data
+SCORE_WEIGHTS = {
+    'description': 0.30,
+    'images': 0.35,
+    'confidence': 0.15,
+    'engagement': 0.20,
+}
+
+# Descriptions are narrated up to about this many words
+TARGET_WORDS = 250
+# Images counted towards the score, and the minimum for a video at all
+MAX_IMAGES = 8
+MIN_IMAGES = 3
+# Shorter side (pixels) for an image to count as high resolution
+HI_RES_MIN_SIZE = 800
+# Confidence assumed when the classifier didn't give one
+DEFAULT_CONFIDENCE = 0.5
+# Each castle already rendered or queued from a country divides its next
+# castle's score by 1 + COUNTRY_PENALTY * count
+COUNTRY_PENALTY = 0.5
+# Rounds of rescoring the top of the queue with the image index; castles
+# whose score drops let others into the top, which are then checked too
+REFINE_ROUNDS = 10
+
+REFUSAL_PATTERN = re.compile(r"^\s*(?:Unfortunately|I'm sorry|I'm afraid)")
+
+
+def _value(row, column):
+    item = row.get(column)
+    return None if item is None or item != item else item  # NaN != NaN
+
+
+def _url_list(value):
+    """Image URLs from a list or its string form in the CSV"""
+    if value is None or value != value or value == '':
+        return []
+    if isinstance(value, str):
+        try:
+            value = literal_eval(value)
+        except (ValueError, SyntaxError):
+            return []
+    return [url for url in value if isinstance(url, str) and url]
+
+
+def description_score(description):
+    """
+    Length and quality of a description (0-1): word count up to
+    TARGET_WORDS, scaled down for repetitive text; refusals score 0.
+    """
+    if not isinstance(description, str) or REFUSAL_PATTERN.match(description):
+        return 0.0
+    words = re.findall(r"[\w']+", description.lower())
+    if not words:
+        return 0.0
+    length = min(len(words) / TARGET_WORDS, 1.0)
+    # Share of distinct words; generated filler repeats itself
+    variety = min(len(set(words)) / len(words) / 0.5, 1.0)
+    return length * (0.5 + 0.5 * variety)
+
+
+def image_score(count):
+    """Distinct high-resolution images (0-1); too few to make a video scores 0"""
+    return 0.0 if count < MIN_IMAGES else min(count, MAX_IMAGES) / MAX_IMAGES
+
+
+def base_score(features, weights=SCORE_WEIGHTS):
+    """Weighted sum of the castle's scores, over the signals it has"""
+    if features['images'] == 0 or features['description'] == 0:
+        return 0.0
+    available = {name: weight for name, weight in weights.items() if features.get(name) is not None}
+    total = sum(available.values())
+    return sum(features[name] * weight for name, weight in available.items()) / total
+
+
+def fingerprint(*parts):
+    material = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(material.encode('utf-8')).hexdigest()
+
+
+def load_engagement(castle_csv):
+    """
+    Engagement priority per castle (file-name form, 0-1) from the collected
+    analytics, or {} before any have been collected.
+    """
+    from analytics import castle_priority, open_metrics_store
+    from schedule_generator import load_castle_metadata
+    from schedule_store import open_store
+
+    metrics_store = open_metrics_store()
+    if metrics_store is None:
+        return {}
+    priority = castle_priority(metrics_store, open_store().get_all_posts(), load_castle_metadata(castle_csv))
+    metrics_store.close()
+    top = max(priority.values(), default=0)
+    return {name: value / top for name, value in priority.items()} if top else {}
+
+
+class RenderQueue:
+    def __init__(self, cache_path=RENDER_QUEUE_CACHE):
+        """
+        Args:
+            cache_path (str): JSON file the castle scores are kept in (None to disable)
+        """
+        self.cache_path = cache_path
+        self.entries = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+
+    def _count_images(self, commons_urls, wikipedia_urls, image_index):
+        """Distinct high-resolution images, or the candidate count without an index"""
+        urls = commons_urls + wikipedia_urls
+        if image_index is None:
+            return len(set(urls))
+        image_index.add_candidates(commons_urls, source='commons')
+        image_index.add_candidates(wikipedia_urls, source='wikipedia')
+        return len(image_index.top_k(urls, k=MAX_IMAGES, min_size=HI_RES_MIN_SIZE))
+
+    def update(self, df, image_index=None, engagement=None, only=None):
+        """
+        Rescore the castles whose inputs changed and drop those no longer in df.
+
+        Args:
+            df (pd.DataFrame): Castles with name, country, description,
+                wikimedia_image_urls / wikipedia_image_urls and optionally
+                confidence and structure_type
+            image_index (ImageIndex, optional): Used to count distinct
+                high-resolution images; without it every URL counts
+            engagement (dict, optional): Output of load_engagement
+            only (set, optional): Castle names (file-name form) to count with
+                the image index; the rest keep their score or count URLs
+
+        Returns:
+            int: Number of castles rescored
+        """
+        engagement = engagement or {}
+        seen = set()
+        rescored = 0
+        for _, row in df.iterrows():
+            name = _value(row, 'name')
+            if not name:
+                continue
+            key = safe_name(name)
+            seen.add(key)
+            commons_urls = _url_list(_value(row, 'wikimedia_image_urls'))
+            wikipedia_urls = _url_list(_value(row, 'wikipedia_image_urls'))
+            confidence = _value(row, 'confidence')
+
+            def inputs(method):
+                return fingerprint(
+                    _value(row, 'description'), sorted(commons_urls + wikipedia_urls), confidence,
+                    _value(row, 'structure_type'), _value(row, 'country'), engagement.get(key), method
+                )
+            index = image_index if only is None or key in only else None
+            # An index count is better than a URL count, so it is kept when no index is given
+            current = {inputs('index')} if index is not None else {inputs('urls'), inputs('index')}
+            if key in self.entries and self.entries[key]['fingerprint'] in current:
+                continue
+
+            features = {
+                'description': description_score(_value(row, 'description')),
+                'images': image_score(self._count_images(commons_urls, wikipedia_urls, index)),
+                'confidence': float(confidence) if confidence is not None else DEFAULT_CONFIDENCE,
+                'engagement': engagement.get(key),
+            }
+            if _value(row, 'structure_type') == 'remove':
+                features['confidence'] = 0.0
+            self.entries[key] = {
+                'name': name,
+                'country': (_value(row, 'country') or '').strip().lower(),
+                'fingerprint': inputs('index' if index is not None else 'urls'),
+                'image_count': 'index' if index is not None else 'urls',
+                'features': features,
+                'score': base_score(features),
+            }
+            rescored += 1
+
+        if only is None:
+            for key in set(self.entries) - seen:
+                del self.entries[key]
+        if image_index is not None:
+            image_index.save()
+        self.save()
+        print(f"Render queue: rescored {rescored} of {len(seen)} castles")
+        return rescored
+
+    def refine(self, df, image_index, limit, output_dir=None, engagement=None):
+        """
+        Count the distinct high-resolution images of the castles at the top
+        of the queue with the image index, so only those are fetched and
+        hashed. Repeated while castles without an index count reach the top,
+        up to REFINE_ROUNDS times.
+
+        Args:
+            df (pd.DataFrame): Castles, as for update
+            image_index (ImageIndex): Counts distinct high-resolution images
+            limit (int): Castles at the top of the queue to check
+            output_dir (str, optional): Videos already rendered, skipped
+            engagement (dict, optional): Output of load_engagement
+
+        Returns:
+            int: Number of castles rescored
+        """
+        rendered = self._rendered(output_dir)
+        checked = set()
+        rescored = 0
+        for _ in range(REFINE_ROUNDS):
+            top = {safe_name(name) for name in self.ranked(rendered, limit)}
+            unchecked = {key for key in top if self.entries[key].get('image_count') != 'index'} - checked
+            if not unchecked:
+                break
+            checked |= unchecked
+            rows = df[df['name'].map(lambda name: isinstance(name, str) and safe_name(name) in unchecked)]
+            rescored += self.update(rows, image_index, engagement, only=unchecked) if len(rows) else 0
+        return rescored
+
+    def ranked(self, rendered=(), limit=None):
+        """
+        Castles to render next, best first, skipping those already rendered.
+
+        Castles are taken best first from each country, and the next one
+        comes from the country whose best remaining castle has the highest
+        score after its country discount.
+
+        Args:
+            rendered (iterable): Castle names (file-name form) with videos already
+            limit (int, optional): Number of castles to return
+
+        Returns:
+            list: Castle names (as in the CSV)
+        """
+        rendered = set(rendered)
+        by_country = {}
+        counts = {}
+        for key, entry in self.entries.items():
+            if key in rendered:
+                if entry['country']:
+                    counts[entry['country']] = counts.get(entry['country'], 0) + 1
+            elif entry['score'] > 0:
+                by_country.setdefault(entry['country'], []).append(entry)
+        for members in by_country.values():
+            # Best first; popped from the end
+            members.sort(key=lambda e: e['score'])
+
+        def discounted(country):
+            return by_country[country][-1]['score'] / (1 + COUNTRY_PENALTY * counts.get(country, 0))
+
+        heap = [(-discounted(country), country) for country in by_country]
+        heapq.heapify(heap)
+        ordered = []
+        while heap and (limit is None or len(ordered) < limit):
+            _, country = heapq.heappop(heap)
+            ordered.append(by_country[country].pop()['name'])
+            # Unknown countries aren't a group, so they aren't discounted
+            if country:
+                counts[country] = counts.get(country, 0) + 1
+            if by_country[country]:
+                heapq.heappush(heap, (-discounted(country), country))
+        return ordered
+
+    @staticmethod
+    def _rendered(output_dir):
+        """Castle names (file-name form) with videos in output_dir"""
+        return [castle['name'] for castle in get_castle_names_from_videos(output_dir)] \
+            if output_dir and os.path.isdir(output_dir) else []
+
+    def order(self, df, output_dir=None, limit=None):
+        """
+        Rows of df in render order, leaving out castles already rendered to
+        output_dir and castles that can't make a video.
+        """
+        names = self.ranked(self._rendered(output_dir), limit)
+        positions = {name: i for i, name in enumerate(names)}
+        queued = df[df['name'].isin(positions)]
+        return queued.iloc[queued['name'].map(positions).argsort()]
+
+    def print_top(self, n=10):
+        print(f"Top {n} castles to render:")
+        for i, name in enumerate(self.ranked(limit=n), 1):
+            entry = self.entries[safe_name(name)]
+            features = ", ".join(f"{k} {v:.2f}" for k, v in entry['features'].items() if v is not None)
+            print(f"  {i}. {name} ({entry['country'] or 'unknown'}): {entry['score']:.3f} [{features}]")
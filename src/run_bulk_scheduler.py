@@ -9,18 +9,24 @@ __author__ = "NedeeshaWeerasuriya"
 __version__ = "0.1"
 
 
-from schedule_generator import get_castle_description, save_schedule_to_file
+from analytics import castle_priority, open_metrics_store
+from schedule_generator import DEFAULT_SLOTS, load_castle_metadata, plan_schedule
+from schedule_store import STORE_DIR, open_store
+from datetime import datetime
 import os
 
+CASTLE_CSV = "outputs/final/only_castles_v4.csv"
+
 def main():
     print("Castle Video Bulk Scheduler")
     print("=" * 40)
     
     # Get user input (with your defaults)
-    start_date = input("Enter start date (DD/MM/YYYY HH:MM) [04/09/2025]: ") or "04/09/2025"
-    start_date += " 17:20"  # Default time
+    today = datetime.now().strftime('%d/%m/%Y')
+    start_date = input(f"Enter start date (DD/MM/YYYY) [{today}]: ") or today
+    start_date = datetime.strptime(start_date, '%d/%m/%Y').strftime('%Y-%m-%d')
     video_dir = "content/castle_videos"
-    frequency = 1
+    slots = DEFAULT_SLOTS
     
     # Check if directory exists and has videos
     if not os.path.exists(video_dir):
@@ -39,32 +45,45 @@ def main():
     if len(castle_files) > 5:
         print(f"  ... and {len(castle_files) - 5} more")
     
-    # Generate schedule using your original logic
+    # Merge new videos into the existing schedule; posted history is kept
     print(f"\nGenerating schedule...")
-    schedule = get_castle_description(
-        start_date=start_date,
+    store = open_store()
+    existing_posts = store.get_all_posts()
+    metadata = load_castle_metadata(CASTLE_CSV)
+    
+    # Castles like the best performing ones so far go first
+    priority = {}
+    metrics_store = open_metrics_store()
+    if metrics_store:
+        priority = castle_priority(metrics_store, existing_posts, metadata)
+        metrics_store.close()
+        print(f"📊 Ordering by engagement from {metrics_store.db_path}")
+    
+    new_posts = plan_schedule(
         video_directory=video_dir,
-        freq=frequency
+        existing_posts=existing_posts,
+        start_date=start_date,
+        slots=slots,
+        metadata=metadata,
+        priority=priority
     )
+    store.put_posts(new_posts)
     
-    # Save schedule
-    output_path = "content/schedule.json"
-    save_schedule_to_file(schedule, output_path)
-    
-    print(f"✅ Generated {len(schedule['posts'])} castle posts")
-    print(f"📅 Schedule saved to: {output_path}")
+    print(f"✅ Scheduled {len(new_posts)} new castle posts")
+    print(f"📅 Schedule saved to: {STORE_DIR}")
     
     # Show summary (like your original Excel output)
-    if schedule['posts']:
-        first_post = schedule['posts'][0]['scheduled_date']
-        last_post = schedule['posts'][-1]['scheduled_date']
+    if new_posts:
+        first_post = new_posts[0]['scheduled_date']
+        last_post = new_posts[-1]['scheduled_date']
         print(f"📅 Posting range: {first_post} to {last_post}")
-        print(f"🕐 Daily at 5:00 PM UK time")
+        for platform, times in slots.items():
+            print(f"🕐 {platform}: daily at {', '.join(times)} UK time")
     
     print(f"\n📋 Sample posts:")
-    for i, post in enumerate(schedule['posts'][:2]):
+    for i, post in enumerate(new_posts[:2]):
         print(f"  {i+1}. {post['youtube']['title']}")
-        print(f"     Date: {post['scheduled_date']}")
+        print(f"     Date: {post['scheduled_date']} {post['scheduled_time']}")
     
 
 if __name__ == "__main__":
@@ -1,97 +1,259 @@
-import pandas as pd
-import json
+import csv
+import heapq
 import os
+import re
 from datetime import datetime, timedelta
 
-def create_date_range(start_date, end_date, freq='1D'):
-    """Create date range with specified frequency - same as your original logic"""
-    start_date = pd.to_datetime(start_date, format="%d/%m/%Y %H:%M")
-    end_date = pd.to_datetime(end_date, format="%d/%m/%Y %H:%M")
-    date_range = pd.date_range(start=start_date, end=end_date, freq=freq)
-    # create d/m/y H:M format
-    return date_range.strftime("%d/%m/%Y %H:%M").tolist()
+HASHTAGS = "#castles #castlesworldwide #CastleLovers #shorts"
+TAGS = ["castles", "castlesworldwide", "CastleLovers", "shorts", "history", "architecture"]
+
+# Posting times (UK) for each platform; several times give several posts a day
+DEFAULT_SLOTS = {
+    'youtube': ['17:00'],
+    'instagram': ['17:00'],
+}
+
+# How much engagement priority can speed up a group, relative to its size
+PRIORITY_WEIGHT = 1.0
+
+def safe_name(castle_name):
+    """File-name form of a castle name, as used for the rendered videos"""
+    return "".join([c if c.isalnum() else "_" for c in castle_name])
 
 def get_castle_names_from_videos(directory):
     """Extract castle names from directory - same as your original logic"""
     castle_names = []
-    for filename in os.listdir(directory):
+    for filename in sorted(os.listdir(directory)):
         if filename.endswith("_video.mp4"):
             castle_name = filename.split('_video')[0]
             castle_names.append({
                 'name': castle_name,
-                'filename': filename
+                'filename': filename,
+                'video_file': f"{directory.rstrip('/')}/{filename}",
             })
     return castle_names
 
-def get_castle_description(start_date, video_directory, freq=1):
-    """Generate castle posting schedule - adapted from your original logic"""
-    castle_data = get_castle_names_from_videos(video_directory)
-    castle_df = pd.DataFrame(castle_data)
-    
-    total_days_needed = len(castle_df) * freq
-    # calculate the end date based on the start date and total days needed
-    end_date = pd.to_datetime(start_date, format='%d/%m/%Y %H:%M') + pd.Timedelta(days=total_days_needed)
-    # create the new date range with the updated end date
-    date_range = create_date_range(start_date, end_date.strftime('%d/%m/%Y %H:%M'), freq=f"{freq}D")
-    
-    castle_df['date'] = date_range[:-1]
-    hashtags = "#castles #castlesworldwide #CastleLovers #shorts"
-    
-    # Create the posts list for JSON
-    posts = []
-    for i, row in castle_df.iterrows():
-        # Convert date to ISO format for easier processing
-        scheduled_date = pd.to_datetime(row['date'], format='%d/%m/%Y %H:%M').strftime('%Y-%m-%d')
-        
-        # Create post object
-        post = {
-            "id": f"castle_{i+1:03d}",
-            "video_file": f"content/videos/{row['filename']}",
-            "youtube": {
-                "title": f"{row['name'].replace('_', ' ').title()} {hashtags}",
-                "description": f"Explore the magnificent {row['name'].replace('_', ' ')} castle! {hashtags}",
-                "tags": ["castles", "castlesworldwide", "CastleLovers", "shorts", "history", "architecture"]
-            },
-            "instagram": {
-                "caption": f"🏰 {row['name'].replace('_', ' ').title()} {hashtags} ✨"
-            },
-            "scheduled_date": scheduled_date,
-            "posted": False
-        }
-        posts.append(post)
-    
-    return {"posts": posts}
-
-def save_schedule_to_file(schedule_data, output_path):
-    """Save schedule data to JSON file"""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(schedule_data, f, indent=2, ensure_ascii=False)
-
-# Main execution for bulk scheduling - same as your original approach
+def load_castle_metadata(csv_path):
+    """
+    Read country and structure type for each castle from the castle CSV,
+    keyed by the castle's file-name form so it matches the video names.
+    """
+    metadata = {}
+    if not csv_path or not os.path.exists(csv_path):
+        return metadata
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('name'):
+                metadata[safe_name(row['name'])] = {
+                    'country': row.get('country') or '',
+                    'structure_type': row.get('structure_type') or '',
+                }
+    return metadata
+
+def spread_castles(castles, metadata, priority=None):
+    """
+    Order castles so the same country or castle type doesn't come up back to back.
+
+    Castles are grouped by (country, type). The next castle comes from the
+    country with the most castles left, weighted up by the priority of the
+    group's best castle, and within it the largest group (ties broken by
+    priority), among the groups whose country and type both
+    differ from the previous castle's. If no group differs in both, a group
+    with a different country is used, then one with a different type, and
+    only then a repeat. Taking the largest country first spreads it evenly
+    across the whole schedule instead of leaving a run of it at the end.
+
+    Groups are kept in one heap per type, refreshed lazily (a group's rank
+    only falls, so a stale entry is re-pushed when it reaches the top). A
+    type has at most one group per country, so its best two groups always
+    include the best one from another country, and each pick looks at two
+    groups per type: O(n t log g) for g groups and t types (a small fixed
+    set, see llm_verify.STRUCTURE_TYPES).
+
+    Args:
+        castles (list): Castles from get_castle_names_from_videos
+        metadata (dict): Output of load_castle_metadata
+        priority (dict, optional): Score per castle name, higher goes earlier
+            within its group, and a group whose best castle has the top
+            priority is drawn up to 1 + PRIORITY_WEIGHT times as often
+
+    Returns:
+        list: The castles in posting order
+    """
+    priority = priority or {}
+    top_priority = max([value for value in priority.values() if value > 0], default=0)
+    groups = {}
+    for castle in castles:
+        info = metadata.get(castle['name'], {})
+        key = (info.get('country', '').lower(), info.get('structure_type', '').lower())
+        groups.setdefault(key, []).append(castle)
+    for members in groups.values():
+        # Best first; popped from the end
+        members.sort(key=lambda c: priority.get(c['name'], 0))
+
+    country_left = {}
+    for (country, _), members in groups.items():
+        country_left[country] = country_left.get(country, 0) + len(members)
+
+    def rank(key):
+        members = groups[key]
+        best = priority.get(members[-1]['name'], 0)
+        boost = 1 + PRIORITY_WEIGHT * max(best, 0) / top_priority if top_priority else 1
+        # Castles with no country aren't one country, so only their group size counts
+        left = country_left[key[0]] if key[0] else len(members)
+        return left * boost, len(members), best
+
+    # Ties go to the group seen first
+    first_seen = {key: i for i, key in enumerate(groups)}
+
+    def entry(key):
+        return tuple(-value for value in rank(key)), first_seen[key], key
+
+    heaps = {}
+    for key in groups:
+        heaps.setdefault(key[1], []).append(entry(key))
+    for heap in heaps.values():
+        heapq.heapify(heap)
+
+    def best_two(heap):
+        """The two best groups in a heap, refreshing stale entries on the way"""
+        found = []
+        while heap and len(found) < 2:
+            item = heapq.heappop(heap)
+            if item[2] not in groups:
+                continue  # emptied
+            current = entry(item[2])
+            if current != item:
+                heapq.heappush(heap, current)
+                continue
+            found.append(item)
+        for item in found:
+            heapq.heappush(heap, item)
+        return found
+
+    ordered = []
+    previous = ('', '')
+    while groups:
+        # Unknown countries and types never count as a repeat
+        def differs(key, index):
+            return not key[index] or key[index] != previous[index]
+
+        candidates = [item[2] for item in sorted(item for heap in heaps.values() for item in best_two(heap))]
+        key = next((k for k in candidates if differs(k, 0) and differs(k, 1)), None) \
+            or next((k for k in candidates if differs(k, 0)), None) \
+            or next((k for k in candidates if differs(k, 1)), None) \
+            or candidates[0]
+
+        ordered.append(groups[key].pop())
+        country_left[key[0]] -= 1
+        if not groups[key]:
+            del groups[key]
+        previous = key
+    return ordered
+
+def build_post(post_id, castle, scheduled_date, scheduled_time, platforms):
+    """Create a post object for the schedule"""
+    title_name = castle['name'].replace('_', ' ').title()
+    return {
+        "id": post_id,
+        "video_file": castle['video_file'],
+        "youtube": {
+            "title": f"{title_name} {HASHTAGS}",
+            "description": f"Explore the magnificent {castle['name'].replace('_', ' ')} castle! {HASHTAGS}",
+            "tags": list(TAGS)
+        },
+        "instagram": {
+            "caption": f"🏰 {title_name} {HASHTAGS} ✨"
+        },
+        "scheduled_date": scheduled_date,
+        "scheduled_time": scheduled_time,
+        "platforms": sorted(platforms),
+        "posted": False
+    }
+
+def plan_schedule(video_directory, existing_posts, start_date, slots=None, metadata=None, priority=None):
+    """
+    Schedule every video that isn't already in the schedule.
+
+    Existing posts are left untouched (posted history is never rewritten), and
+    their slots are treated as taken. New videos are spread by country and
+    type, then each platform fills its own free slots in that order from
+    start_date onwards. Videos landing on the same date and time for several
+    platforms share one post.
+
+    Args:
+        video_directory (str): Directory with the *_video.mp4 files
+        existing_posts (list): Posts already scheduled
+        start_date (str): First date to fill, YYYY-MM-DD
+        slots (dict): Platform to list of HH:MM posting times per day
+        metadata (dict): Castle metadata from load_castle_metadata
+        priority (dict): Optional score per castle name, higher posts earlier
+
+    Returns:
+        list: The new posts
+    """
+    slots = slots or DEFAULT_SLOTS
+    scheduled_files = {post['video_file'] for post in existing_posts}
+    castles = [c for c in get_castle_names_from_videos(video_directory) if c['video_file'] not in scheduled_files]
+    queue = spread_castles(castles, metadata or {}, priority)
+
+    # Slots already taken by existing posts
+    taken = set()
+    for post in existing_posts:
+        for platform in post.get('platforms', slots.keys()):
+            default_time = slots.get(platform, [''])[0]
+            taken.add((platform, post['scheduled_date'], post.get('scheduled_time', default_time)))
+
+    # Each platform walks forward through its free slots
+    assignments = {}
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    for platform, times in slots.items():
+        if not times:
+            continue
+        remaining = list(queue)
+        remaining.reverse()
+        current = day
+        while remaining:
+            date_key = current.strftime('%Y-%m-%d')
+            for slot_time in sorted(times):
+                if remaining and (platform, date_key, slot_time) not in taken:
+                    castle = remaining.pop()
+                    assignments.setdefault((castle['video_file'], date_key, slot_time), (castle, set()))[1].add(platform)
+            current += timedelta(days=1)
+
+    # Continue the castle_NNN numbering from the existing schedule
+    numbers = [int(m.group(1)) for m in (re.match(r'castle_(\d+)$', p['id']) for p in existing_posts) if m]
+    next_number = max(numbers, default=0) + 1
+
+    new_posts = []
+    for (video_file, date_key, slot_time), (castle, platforms) in sorted(
+            assignments.items(), key=lambda item: (item[0][1], item[0][2])):
+        new_posts.append(build_post(f"castle_{next_number:03d}", castle, date_key, slot_time, platforms))
+        next_number += 1
+    return new_posts
+
+# Main execution for bulk scheduling
 if __name__ == "__main__":
-    # Your original configuration
-    START_DATE = "04/09/2025 17:00"
-    VIDEO_DIRECTORY = "content/videos"  # Changed from your "castle_videos/"
-    OUTPUT_PATH = "content/schedule.json"
-    FREQUENCY_DAYS = 1  # Same as your freq=1
-    
-    # Generate schedule using your logic
-    schedule = get_castle_description(
-        start_date=START_DATE,
+    from schedule_store import open_store
+
+    START_DATE = datetime.now().strftime('%Y-%m-%d')
+    VIDEO_DIRECTORY = "content/castle_videos"
+    CASTLE_CSV = "outputs/final/only_castles_v4.csv"
+
+    store = open_store()
+    new_posts = plan_schedule(
         video_directory=VIDEO_DIRECTORY,
-        freq=FREQUENCY_DAYS
+        existing_posts=store.get_all_posts(),
+        start_date=START_DATE,
+        metadata=load_castle_metadata(CASTLE_CSV)
     )
-    
-    # Save to file
-    save_schedule_to_file(schedule, OUTPUT_PATH)
-    
-    print(f"Generated schedule with {len(schedule['posts'])} castle posts")
-    print(f"Schedule saved to: {OUTPUT_PATH}")
-    
+    store.put_posts(new_posts)
+
+    print(f"Scheduled {len(new_posts)} new castle posts")
+
     # Print first few posts for verification
-    for i, post in enumerate(schedule['posts'][:3]):
+    for i, post in enumerate(new_posts[:3]):
         print(f"\nCastle Post {i+1}:")
-        print(f"  Date: {post['scheduled_date']}")
+        print(f"  Date: {post['scheduled_date']} {post['scheduled_time']} ({', '.join(post['platforms'])})")
         print(f"  Castle: {post['youtube']['title']}")
-        print(f"  Video: {post['video_file']}")
\ No newline at end of file
+        print(f"  Video: {post['video_file']}")
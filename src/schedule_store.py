@@ -0,0 +1,225 @@
+"""
+Sharded posting schedule with an append-only results ledger
+
+Posts are stored one file per scheduled date, so a daily run only reads
+today's shard. Posting results are appended to a per-date ledger instead of
+rewriting the schedule, which keeps concurrent runs from overwriting each
+other. compact() periodically folds the ledger back into the shards.
+
+Layout:
+    content/schedule/days/YYYY-MM-DD.json     posts scheduled for that date
+    content/schedule/ledger/YYYY-MM-DD.jsonl  posting results, one per line
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still atomic per line, compaction isn't locked
+    fcntl = None
+
+
+STORE_DIR = "content/schedule"
+LEGACY_SCHEDULE = "content/schedule.json"
+
+
+@contextmanager
+def locked(f):
+    """Hold an exclusive lock on an open file"""
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+        yield f
+    finally:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class ScheduleStore:
+    def __init__(self, root=STORE_DIR):
+        """
+        Args:
+            root (str): Directory holding the day shards and ledger
+        """
+        self.root = root
+        self.days_dir = os.path.join(root, "days")
+        self.ledger_dir = os.path.join(root, "ledger")
+
+    def _day_path(self, date_key):
+        return os.path.join(self.days_dir, f"{date_key}.json")
+
+    def _ledger_path(self, date_key):
+        return os.path.join(self.ledger_dir, f"{date_key}.jsonl")
+
+    def dates(self):
+        """All scheduled dates, in order"""
+        if not os.path.isdir(self.days_dir):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.days_dir) if f.endswith('.json'))
+
+    def is_empty(self):
+        return not self.dates()
+
+    def _read_day(self, date_key):
+        path = self._day_path(date_key)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_day(self, date_key, posts):
+        os.makedirs(self.days_dir, exist_ok=True)
+        path = self._day_path(date_key)
+        if not posts:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        # Write to a temporary file first so readers never see a partial shard
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(posts, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_ledger(self, date_key):
+        path = self._ledger_path(date_key)
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves at most one broken last line
+                    print(f"⚠️ Skipping unreadable ledger line in {path}")
+        return entries
+
+    def get_posts(self, date_key):
+        """
+        Posts scheduled for a date (YYYY-MM-DD), with any ledger results applied.
+        """
+        posts = self._read_day(date_key)
+        results = {}
+        for entry in self._read_ledger(date_key):
+            results.setdefault(entry['id'], {}).update(entry['fields'])
+        for post in posts:
+            post.update(results.get(post['id'], {}))
+        return posts
+
+    def get_all_posts(self):
+        """Every post in date order (reads every shard; not used by daily runs)"""
+        posts = []
+        for date_key in self.dates():
+            posts.extend(self.get_posts(date_key))
+        return posts
+
+    def record_result(self, post, **fields):
+        """
+        Append a posting result for a post to its date's ledger.
+
+        Args:
+            post (dict): The post, used for its 'id' and 'scheduled_date'
+            **fields: Fields to set on the post, e.g. posted=True
+        """
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        entry = {
+            'id': post['id'],
+            'recorded': datetime.now().isoformat(),
+            'fields': fields,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with open(self._ledger_path(post['scheduled_date']), 'a', encoding='utf-8') as f:
+            with locked(f):
+                f.write(line)
+                f.flush()
+        post.update(fields)
+
+    def put_posts(self, posts):
+        """
+        Add or replace posts (matched by id) in their date shards.
+        A post moved to another date is removed from its old shard, which
+        means checking every shard; this is for the scheduler, not daily runs.
+        """
+        by_id = {post['id']: post for post in posts}
+        by_date = {}
+        for post in posts:
+            by_date.setdefault(post['scheduled_date'], []).append(post)
+
+        # Drop moved posts from the shards they used to be in
+        for date_key in self.dates():
+            if date_key in by_date:
+                continue
+            if any(p['id'] in by_id for p in self._read_day(date_key)):
+                self.compact_date(date_key)
+                self._write_day(date_key, [p for p in self._read_day(date_key) if p['id'] not in by_id])
+
+        for date_key, new_posts in by_date.items():
+            new_ids = {post['id'] for post in new_posts}
+            self.compact_date(date_key)
+            kept = [p for p in self._read_day(date_key) if p['id'] not in new_ids]
+            self._write_day(date_key, kept + new_posts)
+
+    def compact_date(self, date_key):
+        """Fold a date's ledger into its shard and clear the ledger"""
+        ledger_path = self._ledger_path(date_key)
+        if not os.path.exists(ledger_path) or os.path.getsize(ledger_path) == 0:
+            return
+        # Truncated rather than deleted, so a run appending concurrently
+        # waits on the same file's lock instead of writing to a removed one
+        with open(ledger_path, 'r+', encoding='utf-8') as f:
+            with locked(f):
+                posts = self.get_posts(date_key)
+                self._write_day(date_key, posts)
+                f.truncate(0)
+
+    def compact(self, before=None):
+        """
+        Fold ledgers into their shards.
+
+        Args:
+            before (str, optional): Only compact dates before this YYYY-MM-DD,
+                leaving recent ledgers append-only
+        """
+        if not os.path.isdir(self.ledger_dir):
+            return 0
+        compacted = 0
+        for filename in sorted(os.listdir(self.ledger_dir)):
+            date_key = filename[:-len('.jsonl')]
+            if not filename.endswith('.jsonl') or (before and date_key >= before):
+                continue
+            if os.path.getsize(os.path.join(self.ledger_dir, filename)) == 0:
+                continue
+            self.compact_date(date_key)
+            compacted += 1
+        return compacted
+
+    def import_schedule(self, schedule_data):
+        """Load a {'posts': [...]} schedule (e.g. the old schedule.json) into the store"""
+        self.put_posts(schedule_data.get('posts', []))
+
+    def export_schedule(self):
+        """The whole schedule in the old {'posts': [...]} form"""
+        return {'posts': self.get_all_posts()}
+
+
+def open_store(root=STORE_DIR, legacy_path=LEGACY_SCHEDULE):
+    """
+    Open the schedule store, importing the old schedule.json the first time.
+    """
+    store = ScheduleStore(root)
+    if store.is_empty() and legacy_path and os.path.exists(legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            store.import_schedule(json.load(f))
+        print(f"📦 Imported {legacy_path} into {root}")
+    return store
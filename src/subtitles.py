@@ -0,0 +1,166 @@
+"""
+ASS subtitle generation from word timings
+
+Writes karaoke-style ASS subtitles directly from the per-word timing reported
+by the speech synthesiser, with styles and per-format layouts defined here.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+# Sizes and margins are in units of a 288px-high script, as before with SRT
+# subtitles; PlayResX follows the frame's aspect ratio so text isn't stretched.
+SCRIPT_HEIGHT = 288
+
+SUBTITLE_STYLE = {
+    'Fontname': 'Arial',
+    'Fontsize': 10,
+    'PrimaryColour': '&H00008AFF',    # orange once the word is spoken
+    'SecondaryColour': '&H00FFFFFF',  # white before it is spoken
+    'OutlineColour': '&H00000000',
+    'BackColour': '&H00000000',
+    'Bold': -1,
+    'Italic': 0,
+    'Underline': 0,
+    'StrikeOut': 0,
+    'ScaleX': 100,
+    'ScaleY': 100,
+    'Spacing': 0,
+    'Angle': 0,
+    'BorderStyle': 1,
+    'Outline': 2,
+    'Shadow': 0,
+    'Alignment': 2,
+    'MarginL': 10,
+    'MarginR': 10,
+    'MarginV': 50,
+    'Encoding': 1,
+}
+
+# Frame size and style overrides for each video format
+SUBTITLE_LAYOUTS = {
+    'shorts': {'size': (1080, 1920), 'style': {'Fontsize': 10, 'MarginV': 50}},
+    'reels': {'size': (1080, 1920), 'style': {'Fontsize': 10, 'MarginV': 70}},  # clear of the Reels caption overlay
+    'landscape': {'size': (1920, 1080), 'style': {'Fontsize': 16, 'MarginV': 20}},
+    'square': {'size': (1080, 1080), 'style': {'Fontsize': 13, 'MarginV': 30}},
+}
+
+# How long a line stays up after its last word, unless the next line starts first
+LINE_HOLD = 0.3
+
+
+def layout_style(layout):
+    """Full style for a layout: the base style with the layout's overrides"""
+    return {**SUBTITLE_STYLE, **SUBTITLE_LAYOUTS[layout]['style']}
+
+
+def force_style(layout):
+    """
+    Style overrides in the form expected by FFmpeg's subtitles filter,
+    for subtitle files not written by this module (e.g. SRT).
+    """
+    return ",".join(f"{key}={value}" for key, value in layout_style(layout).items())
+
+
+def format_ass_time(seconds):
+    """Format time in ASS format (H:MM:SS.cc)"""
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def escape_ass_text(text):
+    """Make text safe for an ASS event (no override blocks or line breaks)"""
+    return (text.replace('\\', '/').replace('{', '(').replace('}', ')')
+            .replace('\r', ' ').replace('\n', ' '))
+
+
+def build_ass_header(layout='shorts'):
+    """
+    Build the [Script Info] and [V4+ Styles] sections for a layout.
+    """
+    width, height = SUBTITLE_LAYOUTS[layout]['size']
+    style = layout_style(layout)
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {round(SCRIPT_HEIGHT * width / height)}",
+        f"PlayResY: {SCRIPT_HEIGHT}",
+        "ScaledBorderAndShadow: yes",
+        "WrapStyle: 0",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, " + ", ".join(style.keys()),
+        "Style: Default," + ",".join(str(value) for value in style.values()),
+        "",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def build_karaoke_events(segments):
+    """
+    Build the [Events] section with one line per segment and a karaoke tag
+    per word, so each word is highlighted as it is spoken.
+
+    Parameters:
+    - segments: List of dicts with 'words', each a dict of 'word', 'start'
+      and 'end' in seconds from the start of the audio
+
+    Returns:
+    - String with the events section
+    """
+    lines = [
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    timed = [segment for segment in segments if segment['words']]
+    for idx, segment in enumerate(timed):
+        words = segment['words']
+        start = words[0]['start']
+        end = words[-1]['end'] + LINE_HOLD
+        if idx + 1 < len(timed):
+            end = min(end, timed[idx + 1]['words'][0]['start'])
+        end = max(end, words[-1]['end'])
+
+        # Each word is highlighted until the next one starts
+        parts = []
+        for word_idx, word in enumerate(words):
+            next_start = words[word_idx + 1]['start'] if word_idx + 1 < len(words) else word['end']
+            duration = int(round(max(next_start - word['start'], 0) * 100))
+            parts.append(f"{{\\k{duration}}}{escape_ass_text(word['word'])}")
+
+        lines.append(
+            f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{' '.join(parts)}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_ass(segments, output_path, layout='shorts'):
+    """
+    Write karaoke ASS subtitles for the given word-timed segments.
+
+    Returns:
+    - Path of the written file
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(build_ass_header(layout))
+        f.write(build_karaoke_events(segments))
+    return output_path
+
+
+def restyle_ass(source_path, output_path, layout):
+    """
+    Copy an ASS file written by write_ass with the header for another layout.
+    The events are kept as they are, so timings are only computed once.
+    """
+    with open(source_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    events = content[content.index("[Events]"):]
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(build_ass_header(layout))
+        f.write(events)
+    return output_path
@@ -9,7 +9,6 @@ __version__ = "0.1"
 
 
 # Import required libraries
-import numpy as np
 import pandas as pd
 
     
@@ -28,18 +27,3 @@ def read_sort_get_countries_by_first_letter(csv_file: str, chosen_letter: str =
         countries = [country for country in countries if country.startswith(chosen_letter)]
     
     return countries
-
-def separate_city_country(text: str):
-    """
-    Separate city and country from a text string that has the format 'City: city_name, Country: country_name'
-    """
-    if 'City' in text:
-        city = text.split('City: ')[1].split(',')[0]
-    else:
-        city = np.nan
-    if 'Country' in text:
-        country = text.split('Country: ')[1].split('  ')[0]
-    else:
-        country
-    return city, country
-
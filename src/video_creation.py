@@ -11,27 +11,56 @@ __version__ = "0.3"
 import os
 import azure.cognitiveservices.speech as speechsdk
 import pandas as pd
-import requests
 import subprocess
 import time
 import json
 import tempfile
+import math
 from ast import literal_eval
+from http_client import get_client
+from image_index import ImageIndex
+from render_queue import RenderQueue, load_engagement
+from subtitles import force_style, restyle_ass, write_ass
+from audio_processing import build_audio_filter, choose_music_track, measure_loudness
+from video_validation import is_faststart
 
+try:
+    from PIL import Image, ImageFilter
+except ImportError:  # focal points fall back to the image centre
+    Image = None
 
-def generate_azure_voice_with_subtitles(text, audio_output_path, srt_output_path, voice_name="en-GB-OllieMultilingualNeural"):
+# Output frame for the vertical videos
+OUTPUT_WIDTH = 1080
+OUTPUT_HEIGHT = 1920
+FPS = 30
+
+# A keyframe every two seconds (fixed, no scene-cut keyframes) gives platforms
+# evenly sized segments to seek and transcode in parallel
+KEYFRAME_INTERVAL = 2
+
+# MP4 layouts: 'faststart' moves the moov atom to the front after encoding,
+# 'fragmented' writes a moov up front followed by self-contained fragments
+CONTAINER_MOVFLAGS = {
+    'faststart': '+faststart',
+    'fragmented': '+frag_keyframe+empty_moov+default_base_moof',
+}
+
+
+def generate_azure_voice_with_subtitles(text, audio_output_path, subtitle_output_path, voice_name="en-GB-OllieMultilingualNeural",
+                                        layout="shorts"):
     """
     Generate speech from text using Azure Speech Service with a British male voice,
-    while simultaneously creating SRT subtitle file with accurate word timing.
+    while simultaneously creating an ASS subtitle file with word-level karaoke timing.
     
     Parameters:
     - text: The text to convert to speech
     - audio_output_path: Where to save the audio file
-    - srt_output_path: Where to save the SRT subtitle file
+    - subtitle_output_path: Where to save the ASS subtitle file
     - voice_name: The Azure voice to use
+    - layout: Subtitle layout (key of subtitles.SUBTITLE_LAYOUTS)
     
     Returns:
-    - Tuple: (audio_path, srt_path) or (None, None) on failure
+    - Tuple: (audio_path, subtitle_path) or (None, None) on failure
     """
     import os
     import azure.cognitiveservices.speech as speechsdk
@@ -41,13 +70,6 @@ def generate_azure_voice_with_subtitles(text, audio_output_path, srt_output_path
     speech_key = os.getenv("AZURE_SPEECH_KEY")
     service_region = "uksouth"
     
-    # Function to format time in SRT format (HH:MM:SS,mmm)
-    def format_srt_time(seconds):
-        hours = int(seconds / 3600)
-        minutes = int((seconds % 3600) / 60)
-        seconds_remainder = seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{seconds_remainder:06.3f}".replace(".", ",")
-    
     # Function to split text into meaningful segments (sentences or phrases)
     def split_into_segments(text, max_length=10):
         # Split by sentence endings (., !, ?) followed by a space or newline
@@ -89,66 +111,40 @@ def generate_azure_voice_with_subtitles(text, audio_output_path, srt_output_path
         # Split the text into segments
         segments = split_into_segments(text)
         
-        # Prepare for SRT generation
-        srt_entries = []
-        current_entry = 1
+        # Word timings for the whole narration. Offsets reported by the SDK are
+        # relative to the current segment, so the audio already written is added.
+        words = []
+        audio_offset = 0.0
         
-        # Process each segment separately to create better subtitle chunks
-        for segment_idx, segment in enumerate(segments):
-            # Track timing data for this segment
-            segment_start_time = None
-            segment_end_time = None
-            segment_words = []
-            
-            # Set up word boundary event handler
-            def word_boundary_event_handler(evt):
-                nonlocal segment_start_time, segment_end_time
-                # Convert from ticks (100-nanosecond units) to seconds
-                time_in_seconds = evt.audio_offset / 10000000
-                duration_in_seconds = evt.duration.total_seconds()
-                
-                # Track first word's start time
-                if segment_start_time is None:
-                    segment_start_time = time_in_seconds
-                
-                # Always update the end time with the last word's end
-                segment_end_time = time_in_seconds + duration_in_seconds + 0.2
-                
-                # Store the word and its timing
-                segment_words.append({
-                    'word': evt.text,
-                    'start': time_in_seconds,
-                    'end': time_in_seconds + duration_in_seconds
-                })
+        # Set up a single word boundary event handler for all segments
+        def word_boundary_event_handler(evt):
+            # Convert from ticks (100-nanosecond units) to seconds
+            start = audio_offset + evt.audio_offset / 10000000
+            end = start + evt.duration.total_seconds()
             
-            # Connect the event handler
-            synthesizer.synthesis_word_boundary.connect(word_boundary_event_handler)
+            # Attach punctuation to the word before it rather than timing it separately
+            if not any(c.isalnum() for c in evt.text):
+                if words:
+                    words[-1]['word'] += evt.text
+                return
+            words.append({'word': evt.text, 'start': start, 'end': end})
+        
+        # Connect the event handler
+        synthesizer.synthesis_word_boundary.connect(word_boundary_event_handler)
+        
+        timed_segments = []
+        
+        # Process each segment separately to create better subtitle chunks
+        for segment in segments:
+            first_word = len(words)
             
             # Generate speech for this segment
             result = synthesizer.speak_text_async(segment).get()
             
             # Check result
             if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                # If we have valid timing data, create an SRT entry
-                if segment_start_time is not None and segment_end_time is not None:
-                    # Handle segment offset relative to audio start for segments after the first
-                    if segment_idx > 0 and srt_entries:
-                        # Get last entry's end time as our reference
-                        last_end_time = srt_entries[-1]['end']
-                        
-                        # Adjust timing to be continuous
-                        time_offset = last_end_time - segment_start_time
-                        segment_start_time += time_offset
-                        segment_end_time += time_offset
-                    
-                    # Create SRT entry - Remove html.escape() to fix apostrophes
-                    srt_entries.append({
-                        'number': current_entry,
-                        'start': segment_start_time,
-                        'end': segment_end_time,
-                        'text': segment  # No HTML escaping for plain text SRT
-                    })
-                    current_entry += 1
+                timed_segments.append({'text': segment, 'words': words[first_word:]})
+                audio_offset += result.audio_duration.total_seconds()
             elif result.reason == speechsdk.ResultReason.Canceled:
                 cancellation_details = result.cancellation_details
                 print(f"Speech synthesis canceled: {cancellation_details.reason}")
@@ -156,16 +152,12 @@ def generate_azure_voice_with_subtitles(text, audio_output_path, srt_output_path
                     print(f"Error details: {cancellation_details.error_details}")
                 return None, None
 
-        # Write the SRT file
-        with open(srt_output_path, 'w', encoding='utf-8') as srt_file:
-            for entry in srt_entries:
-                srt_file.write(f"{entry['number']}\n")
-                srt_file.write(f"{format_srt_time(entry['start'])} --> {format_srt_time(entry['end'])}\n")
-                srt_file.write(f"{entry['text']}\n\n")
+        # Write the subtitles straight from the word timings
+        write_ass(timed_segments, subtitle_output_path, layout=layout)
         
         print(f"Speech synthesized to {audio_output_path}")
-        print(f"Subtitles created at {srt_output_path}")
-        return audio_output_path, srt_output_path
+        print(f"Subtitles created at {subtitle_output_path}")
+        return audio_output_path, subtitle_output_path
     
     except Exception as e:
         print(f"Error generating speech and subtitles: {str(e)}")
@@ -178,7 +170,7 @@ def download_image(image_url, image_path):
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
     }
-    response = requests.get(image_url, stream=True, headers=headers)
+    response = get_client("images").get(image_url, stream=True, headers=headers)
     if response.status_code == 200:
         with open(image_path, 'wb') as file:
             for chunk in response.iter_content(chunk_size=128):
@@ -204,17 +196,216 @@ def get_audio_duration(audio_path):
         return float(result.stdout.strip())
     return None
 
-def create_castle_video(image_paths, audio_path, subtitle_path, output_path, castle_name):
+def get_image_dimensions(image_path):
+    """
+    Get the width and height of an image using ffprobe.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'quiet',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height',
+        '-of', 'csv=p=0:s=x',
+        image_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        width, height = result.stdout.strip().split('x')[:2]
+        return int(width), int(height)
+    except ValueError:
+        return None
+
+def find_focal_point(image_path):
+    """
+    Estimate where the interesting part of an image is, as (x, y) fractions.
+    Edge energy on a small thumbnail is weighted towards the centre, so busy
+    detail (the castle) pulls the point away from sky and foreground.
+    Falls back to the centre if Pillow is not installed.
+    """
+    if Image is None:
+        return 0.5, 0.5
+    try:
+        with Image.open(image_path) as img:
+            thumb = img.convert('L')
+            thumb.thumbnail((64, 64))
+            edges = thumb.filter(ImageFilter.FIND_EDGES)
+            width, height = edges.size
+            pixels = list(edges.getdata())
+    except Exception as e:
+        print(f"Error finding focal point for {image_path}: {e}")
+        return 0.5, 0.5
+
+    total = sum_x = sum_y = 0.0
+    for idx, value in enumerate(pixels):
+        x = (idx % width + 0.5) / width
+        y = (idx // width + 0.5) / height
+        weight = value * math.exp(-((x - 0.5) ** 2 + (y - 0.5) ** 2) / 0.125)
+        total += weight
+        sum_x += weight * x
+        sum_y += weight * y
+    if total == 0:
+        return 0.5, 0.5
+
+    # Blend with the centre so a single noisy region can't dominate
+    return 0.5 * (sum_x / total) + 0.25, 0.5 * (sum_y / total) + 0.25
+
+def _even(value):
+    """Round to the nearest even integer (required by yuv420p)"""
+    return int(round(value / 2.0)) * 2
+
+def plan_motion(width, height, focal_point, index, out_width=OUTPUT_WIDTH, out_height=OUTPUT_HEIGHT, zoom=1.15):
+    """
+    Plan the pan/zoom path for one image so it fills the output frame without
+    letterboxing. Images much wider or taller than the frame pan across their
+    long side towards the focal point; images of a similar shape slowly zoom
+    in or out on it. Directions alternate by index to vary the motion.
+
+    Returns:
+    - Dictionary describing the motion, used by build_motion_filter
+    """
+    fx, fy = focal_point
+    aspect = width / height
+    out_aspect = out_width / out_height
+    direction = 1 if index % 2 == 0 else -1
+
+    if aspect > out_aspect * zoom or aspect < out_aspect / zoom:
+        # Scale so the short side fills the frame, then slide along the long side
+        if aspect > out_aspect:
+            scaled_w, scaled_h = _even(width * out_height / height), out_height
+            span, focus, window = scaled_w - out_width, fx * scaled_w, out_width
+        else:
+            scaled_w, scaled_h = out_width, _even(height * out_width / width)
+            span, focus, window = scaled_h - out_height, fy * scaled_h, out_height
+
+        end = min(max(focus - window / 2, 0), span)
+        travel = min(span, window * 0.6)
+        start = end + direction * travel
+        if start < 0 or start > span:
+            start = end - direction * travel
+        start = min(max(start, 0), span)
+
+        if aspect > out_aspect:
+            from_xy, to_xy = (start, (scaled_h - out_height) / 2), (end, (scaled_h - out_height) / 2)
+        else:
+            from_xy, to_xy = ((scaled_w - out_width) / 2, start), ((scaled_w - out_width) / 2, end)
+        return {
+            'type': 'pan',
+            'scaled_size': (scaled_w, scaled_h),
+            'from': tuple(int(v) for v in from_xy),
+            'to': tuple(int(v) for v in to_xy),
+        }
+
+    # Similar shape: crop to the frame's aspect ratio at 1.5x so zoompan stays smooth
+    canvas_w, canvas_h = _even(out_width * 1.5), _even(out_height * 1.5)
+    scale = max(canvas_w / width, canvas_h / height)
+    scaled_w, scaled_h = _even(width * scale), _even(height * scale)
+    crop_x = int(min(max(fx * scaled_w - canvas_w / 2, 0), scaled_w - canvas_w))
+    crop_y = int(min(max(fy * scaled_h - canvas_h / 2, 0), scaled_h - canvas_h))
+    return {
+        'type': 'zoom',
+        'scaled_size': (scaled_w, scaled_h),
+        'crop': (canvas_w, canvas_h, crop_x, crop_y),
+        'focus': ((fx * scaled_w - crop_x) / canvas_w, (fy * scaled_h - crop_y) / canvas_h),
+        'zoom': (1.0, zoom) if direction == 1 else (zoom, 1.0),
+    }
+
+def build_motion_filter(input_label, output_label, motion, duration, out_width=OUTPUT_WIDTH, out_height=OUTPUT_HEIGHT):
+    """
+    Build the filter chain that renders one image along its motion path.
+    The image is decoded and scaled once; pans repeat that frame with the loop
+    filter and move a crop window, zooms use zoompan on the single frame.
+    """
+    frames = int(math.ceil(duration * FPS)) + 1
+    scaled_w, scaled_h = motion['scaled_size']
+
+    if motion['type'] == 'pan':
+        (x0, y0), (x1, y1) = motion['from'], motion['to']
+        progress = f"min(t/{duration:.3f},1)"
+        return (
+            f"[{input_label}]scale={scaled_w}:{scaled_h},"
+            f"loop=loop={frames - 1}:size=1:start=0,setpts=N/{FPS}/TB,fps={FPS},"
+            f"crop={out_width}:{out_height}:x='{x0}+({x1 - x0})*{progress}':y='{y0}+({y1 - y0})*{progress}',"
+            f"format=yuv420p[{output_label}];"
+        )
+
+    canvas_w, canvas_h, crop_x, crop_y = motion['crop']
+    focus_x, focus_y = motion['focus']
+    z0, z1 = motion['zoom']
+    return (
+        f"[{input_label}]scale={scaled_w}:{scaled_h},crop={canvas_w}:{canvas_h}:{crop_x}:{crop_y},"
+        f"zoompan=z='{z0}+({z1 - z0:.3f})*on/{frames}':"
+        f"x='max(0,min(iw-iw/zoom,{focus_x:.3f}*iw-iw/zoom/2))':"
+        f"y='max(0,min(ih-ih/zoom,{focus_y:.3f}*ih-ih/zoom/2))':"
+        f"d={frames}:s={out_width}x{out_height}:fps={FPS},"
+        f"format=yuv420p[{output_label}];"
+    )
+
+# Output templates for render_castle_video_formats. Every format is rendered
+# from the same decoded images; only the framing, subtitle layout and encode differ.
+# Subtitle layouts are defined in subtitles.SUBTITLE_LAYOUTS.
+VIDEO_FORMATS = {
+    'shorts': {
+        'size': (1080, 1920),
+        'video_args': ['-preset', 'medium', '-crf', '23'],
+        'subtitle_layout': 'shorts',
+        'container': 'faststart',
+    },
+    'reels': {
+        'size': (1080, 1920),
+        'video_args': ['-preset', 'medium', '-b:v', '5M', '-maxrate', '5M', '-bufsize', '10M'],
+        'subtitle_layout': 'reels',
+        'container': 'faststart',
+    },
+    'landscape': {
+        'size': (1920, 1080),
+        'video_args': ['-preset', 'medium', '-crf', '23'],
+        'subtitle_layout': 'landscape',
+        'container': 'faststart',
+    },
+    'square': {
+        'size': (1080, 1080),
+        'video_args': ['-preset', 'medium', '-crf', '23'],
+        'subtitle_layout': 'square',
+        'container': 'faststart',
+    },
+}
+
+def create_castle_video(image_paths, audio_path, subtitle_path, output_path, castle_name, music_library=None,
+                        container=None):
     """
     Create a TikTok-style video with background images and synced subtitles.
-    Using crossfade transitions between images.
+    Each image pans or zooms to fill the frame, with crossfade transitions between images.
     
     Parameters:
     - image_paths: List of paths to image files
     - audio_path: Path to the audio file
-    - subtitle_path: Path to subtitle file in SRT format
+    - subtitle_path: Path to subtitle file (ASS from generate_azure_voice_with_subtitles, or SRT)
     - output_path: Path where the final video will be saved
     - castle_name: Name of the castle to display at the beginning
+    - music_library: Optional directory of background tracks to mix under the narration
+    - container: 'faststart' or 'fragmented' (key of CONTAINER_MOVFLAGS), defaults to the format's own
+    
+    Returns:
+    - Boolean indicating success or failure
+    """
+    return render_castle_video_formats(image_paths, audio_path, subtitle_path, {'shorts': output_path}, castle_name,
+                                       music_library=music_library, container=container)
+
+def render_castle_video_formats(image_paths, audio_path, subtitle_path, outputs, castle_name, music_library=None,
+                                container=None):
+    """
+    Render one castle video in several formats with a single FFmpeg process.
+    Images and audio are decoded once and split per format, so each extra
+    format only costs its own framing and encode.
+    
+    Parameters:
+    - image_paths: List of paths to image files
+    - audio_path: Path to the audio file
+    - subtitle_path: Path to subtitle file (ASS from generate_azure_voice_with_subtitles, or SRT)
+    - outputs: Dictionary of format name (key of VIDEO_FORMATS) to output path
+    - castle_name: Name of the castle to display at the beginning
+    - music_library: Optional directory of background tracks to mix under the narration
+    - container: 'faststart' or 'fragmented' for every output, instead of each format's default
     
     Returns:
     - Boolean indicating success or failure
@@ -223,6 +414,14 @@ def create_castle_video(image_paths, audio_path, subtitle_path, output_path, cas
     import subprocess
     import tempfile
     
+    unknown_formats = [name for name in outputs if name not in VIDEO_FORMATS]
+    if unknown_formats:
+        print(f"Unknown video formats: {', '.join(unknown_formats)}")
+        return False
+    if container and container not in CONTAINER_MOVFLAGS:
+        print(f"Unknown container: {container}")
+        return False
+    
     # Get audio duration
     duration = get_audio_duration(audio_path)
     if not duration:
@@ -233,107 +432,139 @@ def create_castle_video(image_paths, audio_path, subtitle_path, output_path, cas
     
     # Create temporary directory for processing
     with tempfile.TemporaryDirectory() as temp_dir:
-        # Scale and pad all images to 1080x1920 (vertical video format)
-        scaled_images = []
+        # Probe each image and find its focal point once, for all formats
+        image_info = []
+        valid_images = []
         for i, img_path in enumerate(image_paths):
-            scaled_path = os.path.join(temp_dir, f"scaled_{i}.jpg")
-            scale_cmd = [
-                'ffmpeg', '-y',
-                '-i', img_path,
-                '-vf', 'scale=1080:1920:force_original_aspect_ratio=decrease,'
-                       'pad=1080:1920:(ow-iw)/2:(oh-ih)/2',
-                scaled_path
-            ]
-            try:
-                subprocess.run(scale_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                scaled_images.append(scaled_path)
-            except subprocess.CalledProcessError as e:
-                print(f"Error scaling image {i}: {e}")
+            dimensions = get_image_dimensions(img_path)
+            if not dimensions:
+                print(f"Error reading image {i}: {img_path}")
+                continue
+            image_info.append((dimensions, find_focal_point(img_path)))
+            valid_images.append(img_path)
         
-        if not scaled_images:
-            print("No images were successfully scaled")
+        if not valid_images:
+            print("No images could be read")
             return False
         
         # Calculate duration per image (excluding transitions)
-        num_images = len(scaled_images)
+        num_images = len(valid_images)
         transition_duration = 1.0  # 1 second crossfade
         
         # Calculate how long each image should be shown
         total_show_time = duration - ((num_images - 1) * transition_duration)
         image_duration = total_show_time / num_images if num_images > 0 else duration
         
-        # Create subtitle ASS file with more flexibility than SRT
-        ass_path = os.path.join(temp_dir, "subtitles.ass")
+        # Each image is on screen from its crossfade in to the end of its crossfade out
+        offsets = [i * image_duration + (i - 1) * transition_duration for i in range(1, num_images)]
+        starts = [0.0] + offsets
+        ends = [offset + transition_duration for offset in offsets] + [duration]
         
-        # Convert SRT to ASS format using FFmpeg (more reliable for embedding)
-        if subtitle_path and os.path.exists(subtitle_path):
-            convert_cmd = [
-                'ffmpeg', '-y',
-                '-i', subtitle_path,
-                ass_path
-            ]
-            try:
-                subprocess.run(convert_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                print(f"Converted subtitles to ASS format: {ass_path}")
-            except subprocess.CalledProcessError as e:
-                print(f"Error converting subtitles to ASS: {e}")
-                # If conversion fails, we'll try to use the SRT directly
-                ass_path = subtitle_path
+        # Subtitles written by generate_azure_voice_with_subtitles are ASS already;
+        # each format gets a copy with its own layout header
+        has_subtitles = bool(subtitle_path) and os.path.exists(subtitle_path)
+        is_ass = has_subtitles and subtitle_path.lower().endswith('.ass')
         
         # Create a filter complex string directly instead of using a file
         filter_complex = []
+        format_names = list(outputs)
         
-        # Input section for each image
-        for i in range(num_images):
-            filter_complex.append(f"[{i}:v]format=yuv420p,fps=30[v{i}];")
-        
-        # Chain the crossfades
-        last_output = "v0"
-        for i in range(1, num_images):
-            offset = i * image_duration + (i - 1) * transition_duration
-            filter_complex.append(f"[{last_output}][v{i}]xfade=transition=fade:duration={transition_duration}:offset={offset}[v{i}out];")
-            last_output = f"v{i}out"
+        # Split each decoded image into one stream per format
+        if len(format_names) > 1:
+            for i in range(num_images):
+                branches = "".join(f"[img{i}_{name}]" for name in format_names)
+                filter_complex.append(f"[{i}:v]split={len(format_names)}{branches};")
         
-        # Add fade in/out and castle name
-        filter_complex.append(f"[{last_output}]fade=t=in:st=0:d=1,fade=t=out:st={duration-1}:d=1")
+        for name in format_names:
+            out_width, out_height = VIDEO_FORMATS[name]['size']
+            
+            # Motion section for each image, planned for this frame shape
+            for i in range(num_images):
+                input_label = f"img{i}_{name}" if len(format_names) > 1 else f"{i}:v"
+                (width, height), focal_point = image_info[i]
+                motion = plan_motion(width, height, focal_point, i, out_width, out_height)
+                filter_complex.append(
+                    build_motion_filter(input_label, f"v{i}_{name}", motion, ends[i] - starts[i], out_width, out_height)
+                )
+            
+            # Chain the crossfades
+            last_output = f"v0_{name}"
+            for i in range(1, num_images):
+                offset = offsets[i - 1]
+                filter_complex.append(
+                    f"[{last_output}][v{i}_{name}]xfade=transition=fade:duration={transition_duration}"
+                    f":offset={offset}[v{i}out_{name}];"
+                )
+                last_output = f"v{i}out_{name}"
+            
+            # Add fade in/out and castle name
+            filter_complex.append(f"[{last_output}]fade=t=in:st=0:d=1,fade=t=out:st={duration-1}:d=1")
+            
+            # Add subtitle if subtitle file exists and is accessible
+            if has_subtitles:
+                # Use subtitles filter directly in the filter_complex, with this format's layout
+                layout = VIDEO_FORMATS[name]['subtitle_layout']
+                if is_ass:
+                    format_subtitle_path = restyle_ass(subtitle_path, os.path.join(temp_dir, f"subtitles_{name}.ass"), layout)
+                    subtitle_escaped = format_subtitle_path.replace("\\", "/").replace(":", "\\:")
+                    filter_complex.append(f",subtitles='{subtitle_escaped}'")
+                else:
+                    subtitle_escaped = subtitle_path.replace("\\", "/").replace(":", "\\:")
+                    filter_complex.append(f",subtitles='{subtitle_escaped}':force_style='{force_style(layout)}'")
+            # Always end with the output label
+            filter_complex.append(f"[vout_{name}];")
         
-        # Add subtitle if subtitle file exists and is accessible
-        if subtitle_path and os.path.exists(subtitle_path):
-            # Use subtitles filter directly in the filter_complex
-            subtitle_escaped = subtitle_path.replace("\\", "/").replace(":", "\\:")
-            filter_complex.append(
-                # centre the subtitles and set font properties
-                f",subtitles='{subtitle_escaped}':force_style='Fontname=Arial,Fontsize=10,Bold=1,Alignment=2,"
-                f"PrimaryColour=&H008AFF,OutlineColour=&H000000,BorderStyle=1,Outline=2,Shadow=0,MarginV=50'"
-            )
-        # Always end with the output label
-        filter_complex.append("[vout]")
+        # Normalise the narration and mix in the music bed within the same graph
+        music_path = choose_music_track(music_library, castle_name)
+        music_label = f"{num_images + 1}:a" if music_path else None
+        filter_complex.append(
+            build_audio_filter(f"{num_images}:a", "aout", duration, measure_loudness(audio_path), music_label)
+        )
+        if len(format_names) > 1:
+            branches = "".join(f"[aout_{name}]" for name in format_names)
+            filter_complex.append(f"[aout]asplit={len(format_names)}{branches};")
         
         # Join all filter complex parts
-        filter_complex_str = "".join(filter_complex)
+        filter_complex_str = "".join(filter_complex).rstrip(";")
         
-        # Create input arguments for each scaled image
+        # Each image is a single-frame input, decoded once
         input_args = []
-        for img in scaled_images:
-            input_args.extend(['-loop', '1', '-t', str(total_duration), '-i', img])
+        for img in valid_images:
+            input_args.extend(['-i', img])
+        # Audio comes after all images, then the looped music track if any
+        input_args.extend(['-i', audio_path])
+        if music_path:
+            print(f"Background music: {music_path}")
+            input_args.extend(['-stream_loop', '-1', '-i', music_path])
+        
+        # One set of output options per format, all fed from the same filter graph
+        output_args = []
+        for name, output_path in outputs.items():
+            output_container = container or VIDEO_FORMATS[name]['container']
+            output_args.extend([
+                '-map', f'[vout_{name}]',
+                '-map', f'[aout_{name}]' if len(format_names) > 1 else '[aout]',
+                '-c:v', 'libx264',
+                *VIDEO_FORMATS[name]['video_args'],
+                '-c:a', 'aac',
+                '-b:a', '128k',       # Reduced audio bitrate from 192k
+                '-ar', '48000',
+                '-pix_fmt', 'yuv420p',
+                '-g', str(FPS * KEYFRAME_INTERVAL),
+                '-keyint_min', str(FPS * KEYFRAME_INTERVAL),
+                '-sc_threshold', '0',
+                '-movflags', CONTAINER_MOVFLAGS[output_container],
+                '-t', str(total_duration),
+                '-max_muxing_queue_size', '9999',  # Prevent muxing queue errors
+                output_path
+            ])
         
         # Combine images, audio, and apply filters
         cmd = [
             'ffmpeg', '-y',
             *input_args,
-            '-i', audio_path,
             '-filter_complex', filter_complex_str,
-            '-map', '[vout]',
-            '-map', f'{num_images}:a',  # Audio comes after all images
-            '-c:v', 'libx264', 
-            '-preset', 'medium',  # Balance between speed and quality
-            '-crf', '23',         # Constant Rate Factor for quality
-            '-c:a', 'aac',
-            '-b:a', '128k',       # Reduced audio bitrate from 192k
-            '-pix_fmt', 'yuv420p',
-            '-t', str(total_duration),
-            '-max_muxing_queue_size', '9999',  # Prevent muxing queue errors
-            output_path
+            *output_args
         ]
         
         print("Running FFmpeg command:")
@@ -345,11 +576,17 @@ def create_castle_video(image_paths, audio_path, subtitle_path, output_path, cas
             
             # Check if the process was successful
             if process.returncode == 0:
-                print(f"Video created successfully: {output_path}")
+                # Platforms fetching by URL need the moov atom before the media data
+                for output_path in outputs.values():
+                    if not is_faststart(output_path):
+                        print(f"Error: {output_path} was written without the moov atom at the front")
+                        return False
+                    print(f"Video created successfully: {output_path}")
                 return True
             else:
                 print(f"Error creating video. FFmpeg output:")
                 print(process.stderr)
+                return False
 
         except Exception as e:
             print(f"Error creating video: {e}")
@@ -389,13 +626,20 @@ def ffmpeg_availability_check():
         return False
         
 
-def process_castle_spreadsheet(csv_path, output_dir="castle_videos", start_index=0, jump=10):
+def process_castle_spreadsheet(csv_path, output_dir="castle_videos", start_index=0, jump=10, max_images=8,
+                               formats=('shorts',), music_library=None, container=None, ranked=False):
     """
     Process a spreadsheet of castles to create TikTok-style videos.
     
     Parameters:
     - csv_path: Path to CSV with columns 'name', 'description', and 'image_urls' (as JSON string list)
     - output_dir: Directory to save videos
+    - max_images: Maximum number of distinct images used per video
+    - formats: Names of VIDEO_FORMATS to render; all are produced in one FFmpeg run
+    - music_library: Optional directory of background tracks to mix under the narration
+    - container: 'faststart' or 'fragmented' MP4 for every format, instead of each format's default
+    - ranked: Take castles in render queue order (best first, countries interleaved, already
+      rendered castles skipped) instead of spreadsheet order; start_index then counts into the queue
     """
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
@@ -406,8 +650,21 @@ def process_castle_spreadsheet(csv_path, output_dir="castle_videos", start_index
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
     
+    # Index of image metadata and hashes shared across castles and runs
+    image_index = ImageIndex()
+
     # Read castle data
-    df = pd.read_csv(csv_path)[start_index:start_index+jump]
+    df = pd.read_csv(csv_path)
+    if ranked:
+        # Only castles whose inputs changed since the last run are rescored,
+        # on their URL count; images are only fetched for the castles to render
+        queue = RenderQueue()
+        engagement = load_engagement(csv_path)
+        queue.update(df, engagement=engagement)
+        queue.refine(df, image_index, start_index + jump, output_dir=output_dir, engagement=engagement)
+        queue.print_top()
+        df = queue.order(df, output_dir=output_dir)
+    df = df[start_index:start_index+jump]
     
     for index, row in df.iterrows():
         try:
@@ -422,18 +679,27 @@ def process_castle_spreadsheet(csv_path, output_dir="castle_videos", start_index
             if not isinstance(wikipedia_urls, list):
                 wikipedia_urls = literal_eval(wikipedia_urls)
 
-            # Combine all image URLs
-            image_urls = wikimedia_urls + wikipedia_urls
+            # Rank both sources together and drop repeats of the same photo
+            image_index.add_candidates(wikimedia_urls, source='commons')
+            image_index.add_candidates(wikipedia_urls, source='wikipedia')
+            image_index.save()
+            image_urls = image_index.top_k(wikimedia_urls + wikipedia_urls, k=max_images)
             print(f"\nProcessing castle {index+1}/{len(df)}: {castle_name}")
-            print(f"Found {len(image_urls)} images for this castle")
+            print(f"Found {len(image_urls)} distinct images for this castle "
+                  f"({len(wikimedia_urls) + len(wikipedia_urls)} candidates)")
             
             # Generate safe filename
             safe_name = "".join([c if c.isalnum() else "_" for c in castle_name])
             
             # Prepare file paths
             audio_path = os.path.join(output_dir, f"{safe_name}_audio.mp3")
-            subtitle_path = os.path.join(output_dir, f"{safe_name}_subtitles.srt")
+            subtitle_path = os.path.join(output_dir, f"{safe_name}_subtitles.ass")
             video_path = os.path.join(output_dir, f"{safe_name}_video.mp4")
+            # The first format keeps the plain name picked up by the scheduler
+            video_paths = {
+                name: video_path if i == 0 else os.path.join(output_dir, f"{safe_name}_video_{name}.mp4")
+                for i, name in enumerate(formats)
+            }
             
             # Step 1: Download all images
             image_paths = []
@@ -477,11 +743,12 @@ def process_castle_spreadsheet(csv_path, output_dir="castle_videos", start_index
             subtitle_path_abs = os.path.abspath(subtitle_path)
             print(f"Subtitle path for FFmpeg: {subtitle_path_abs}")
             
-            create_castle_video(image_paths, audio_path, subtitle_path_abs, video_path, castle_name)
+            render_castle_video_formats(image_paths, audio_path, subtitle_path_abs, video_paths, castle_name,
+                                        music_library=music_library, container=container)
             
-            print(f"Completed video for {castle_name}: {video_path}")
+            print(f"Completed video for {castle_name}: {', '.join(video_paths.values())}")
 
-            # delete temporrary images after video creation and the srt and mp3 files
+            # delete temporrary images after video creation and the subtitle and mp3 files
             for img_path in image_paths:
                 try:
                     os.remove(img_path)
@@ -0,0 +1,416 @@
+"""
+Pre-publish video validation
+
+Checks each scheduled video against the Reels and Shorts limits (duration,
+resolution, frame rate, bitrate, codecs, moov atom position) before it is
+uploaded. ffprobe results are cached by file contents, so each video is
+probed once. Videos that don't conform are remuxed (if only the moov atom is
+misplaced) or transcoded to a compliant variant ahead of posting day, and the
+variant is recorded on the post as its publish file for that platform.
+
+Variants and the probe cache live under outputs/cache, outside git (CI keeps
+them in the Actions cache), so Instagram has to fetch variants from an origin
+that uploads or serves local files (MEDIA_ORIGIN=s3 or local) rather than
+from the repo.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+import json
+import os
+import struct
+import subprocess
+from datetime import datetime, timedelta
+
+from audio_processing import file_fingerprint
+
+
+PROBE_CACHE = "outputs/cache/probe.json"
+COMPLIANT_DIR = "outputs/cache/compliant"
+
+# Frame the portrait-only platforms are padded into when transcoding
+OUTPUT_PORTRAIT = (1080, 1920)
+
+# Upload limits per platform
+PLATFORM_SPECS = {
+    'instagram': {  # Reels via the Content Publishing API
+        'min_duration': 3,
+        'max_duration': 900,
+        'max_width': 1920,
+        'max_fps': 60,
+        'min_fps': 23,
+        'max_video_bitrate': 25_000_000,
+        'max_audio_rate': 48000,
+        'max_size': 300 * 1024 * 1024,
+        'video_codecs': ('h264', 'hevc'),
+        'audio_codecs': ('aac',),
+        'faststart': True,
+    },
+    'youtube': {  # Shorts: vertical or square, up to three minutes
+        'min_duration': 1,
+        'max_duration': 180,
+        'max_width': 1920,
+        'max_fps': 60,
+        'min_fps': 1,
+        'max_video_bitrate': 50_000_000,
+        'max_audio_rate': 48000,
+        'max_size': 2 * 1024 * 1024 * 1024,
+        'video_codecs': ('h264', 'hevc', 'vp9', 'av1'),
+        'audio_codecs': ('aac', 'opus'),
+        'faststart': False,
+        'portrait': True,
+    },
+}
+
+
+def mp4_top_level_atoms(path):
+    """
+    Types of the top-level boxes of an MP4 file, in file order.
+    Only box headers are read, so this is instant even for large files.
+    """
+    atoms = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= size:
+            f.seek(offset)
+            header = f.read(8)
+            box_size, box_type = struct.unpack('>I4s', header)
+            if box_size == 1:  # 64-bit size follows the type
+                box_size = struct.unpack('>Q', f.read(8))[0]
+            elif box_size == 0:  # box runs to the end of the file
+                box_size = size - offset
+            if box_size < 8:
+                break
+            atoms.append(box_type.decode('latin-1'))
+            offset += box_size
+    return atoms
+
+
+# Boxes on the path from moov to the chunk offset tables
+CONTAINER_ATOMS = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+
+def _read_atoms(data, offset=0, end=None):
+    """(type, start, header size, total size) of the boxes in data[offset:end]"""
+    end = len(data) if end is None else end
+    atoms = []
+    while offset + 8 <= end:
+        box_size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header:
+            break
+        atoms.append((box_type, offset, header, box_size))
+        offset += box_size
+    return atoms
+
+
+def _shift_chunk_offsets(moov, shift, start=0, end=None):
+    """Add shift to every stco/co64 entry in a moov box (a bytearray), in place"""
+    for box_type, offset, header, size in _read_atoms(moov, start, end):
+        if box_type in CONTAINER_ATOMS:
+            _shift_chunk_offsets(moov, shift, offset + header, offset + size)
+        elif box_type in (b'stco', b'co64'):
+            # Full box: version/flags, entry count, then the offsets
+            count = struct.unpack('>I', moov[offset + header + 4:offset + header + 8])[0]
+            width, fmt = (4, '>I') if box_type == b'stco' else (8, '>Q')
+            position = offset + header + 8
+            for _ in range(count):
+                value = struct.unpack(fmt, moov[position:position + width])[0] + shift
+                if box_type == b'stco' and value > 0xFFFFFFFF:
+                    raise ValueError("chunk offset no longer fits in stco")
+                moov[position:position + width] = struct.pack(fmt, value)
+                position += width
+
+
+def make_faststart(path, output_path=None):
+    """
+    Move the moov atom in front of the media data without re-encoding (what
+    ffmpeg's +faststart does), shifting the chunk offsets to match. Replaces
+    the file unless output_path is given.
+
+    Returns:
+        bool: True if the output is faststart, False if the file couldn't be remuxed
+    """
+    output_path = output_path or path
+    if is_faststart(path):
+        if output_path != path:
+            with open(path, 'rb') as src, open(output_path, 'wb') as dst:
+                dst.write(src.read())
+        return True
+    with open(path, 'rb') as f:
+        data = f.read()
+    atoms = _read_atoms(data)
+    types = [box_type for box_type, *_ in atoms]
+    if types.count(b'moov') != 1 or b'mdat' not in types:
+        return False
+    _, moov_start, moov_header, moov_size = atoms[types.index(b'moov')]
+    moov = bytearray(data[moov_start:moov_start + moov_size])
+    if any(box_type == b'cmov' for box_type, *_ in _read_atoms(moov, moov_header)):
+        return False  # compressed movie header
+    try:
+        _shift_chunk_offsets(moov, moov_size, moov_header)
+    except ValueError as e:
+        print(f"Can't remux {path}: {e}")
+        return False
+
+    first_mdat = types.index(b'mdat')
+    head = atoms[:first_mdat]
+    tail = [atom for atom in atoms[first_mdat:] if atom[0] != b'moov']
+    temp_path = output_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        for _, start, _, size in head:
+            f.write(data[start:start + size])
+        f.write(moov)
+        for _, start, _, size in tail:
+            f.write(data[start:start + size])
+    os.replace(temp_path, output_path)
+    return True
+
+
+def is_faststart(path):
+    """Whether the moov atom comes before the media data (or the file is fragmented)"""
+    atoms = mp4_top_level_atoms(path)
+    if 'moov' not in atoms:
+        return False
+    if 'moof' in atoms:
+        return True
+    return 'mdat' not in atoms or atoms.index('moov') < atoms.index('mdat')
+
+
+def _load_cache(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _save_cache(cache, cache_path):
+    if not cache_path:
+        return
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+
+
+def _frame_rate(rate):
+    numerator, _, denominator = rate.partition('/')
+    return float(numerator) / float(denominator or 1) if float(denominator or 1) else 0.0
+
+
+def probe_video(path, cache_path=PROBE_CACHE):
+    """
+    Summary of a video's container and streams.
+    Cached by file contents, so an unchanged video is only probed once.
+
+    Returns:
+        dict: duration, size, width, height, fps, video_codec, video_bitrate,
+        audio_codec, audio_rate, faststart; or None if ffprobe failed
+    """
+    key = file_fingerprint(path)
+    cache = _load_cache(cache_path)
+    if key in cache:
+        return cache[key]
+
+    cmd = [
+        'ffprobe', '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Error probing {path}")
+        return None
+
+    data = json.loads(result.stdout)
+    video = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in data.get('streams', []) if s.get('codec_type') == 'audio'), {})
+    info = {
+        'duration': float(data.get('format', {}).get('duration', 0)),
+        'size': os.path.getsize(path),
+        'width': video.get('width', 0),
+        'height': video.get('height', 0),
+        'fps': _frame_rate(video.get('avg_frame_rate', '0/1')),
+        'video_codec': video.get('codec_name'),
+        'video_bitrate': int(video.get('bit_rate') or data.get('format', {}).get('bit_rate') or 0),
+        'audio_codec': audio.get('codec_name'),
+        'audio_rate': int(audio.get('sample_rate') or 0),
+        'faststart': is_faststart(path),
+    }
+    cache[key] = info
+    _save_cache(cache, cache_path)
+    return info
+
+
+def check_video(info, platform):
+    """
+    Compare probe results with a platform's limits.
+
+    Returns:
+        list: Problems found, as short descriptions (empty if the video conforms)
+    """
+    spec = PLATFORM_SPECS[platform]
+    problems = []
+    if not spec['min_duration'] <= info['duration'] <= spec['max_duration']:
+        problems.append(f"duration {info['duration']:.1f}s outside {spec['min_duration']}-{spec['max_duration']}s")
+    if max(info['width'], info['height']) > spec['max_width']:
+        problems.append(f"resolution {info['width']}x{info['height']} too large")
+    if spec.get('portrait') and info['width'] > info['height']:
+        problems.append("landscape video")
+    if not spec['min_fps'] <= info['fps'] <= spec['max_fps']:
+        problems.append(f"frame rate {info['fps']:.2f} outside {spec['min_fps']}-{spec['max_fps']}")
+    if info['video_bitrate'] > spec['max_video_bitrate']:
+        problems.append(f"video bitrate {info['video_bitrate'] // 1000} kbps too high")
+    if info['video_codec'] not in spec['video_codecs']:
+        problems.append(f"video codec {info['video_codec']}")
+    if info['audio_codec'] and info['audio_codec'] not in spec['audio_codecs']:
+        problems.append(f"audio codec {info['audio_codec']}")
+    if info['audio_rate'] > spec['max_audio_rate']:
+        problems.append(f"audio sample rate {info['audio_rate']}")
+    if info['size'] > spec['max_size']:
+        problems.append(f"file size {info['size'] // (1024 * 1024)} MB too large")
+    if spec['faststart'] and not info['faststart']:
+        problems.append("moov atom after media data")
+    return problems
+
+
+def _only_faststart(problems):
+    return problems == ["moov atom after media data"]
+
+
+def make_compliant(path, platform, output_dir=COMPLIANT_DIR, problems=None):
+    """
+    Write a variant of a video that meets a platform's limits.
+
+    Only remuxes (moving the moov atom in Python, or a stream copy with
+    +faststart) if the moov atom is the sole problem, otherwise re-encodes
+    within the limits. Variants are named after
+    the source's content hash, so an existing variant is reused.
+
+    Returns:
+        str: Path to the compliant variant, or None if it couldn't be made
+    """
+    spec = PLATFORM_SPECS[platform]
+    info = probe_video(path)
+    if not info:
+        return None
+    problems = check_video(info, platform) if problems is None else problems
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    output_path = os.path.join(output_dir, f"{base}_{platform}_{file_fingerprint(path)[:8]}.mp4")
+    if os.path.exists(output_path):
+        variant = probe_video(output_path)
+        if variant and not check_video(variant, platform):
+            return output_path
+    os.makedirs(output_dir, exist_ok=True)
+
+    if _only_faststart(problems):
+        print(f"Remuxing {path} with faststart for {platform}")
+        if make_faststart(path, output_path):
+            return output_path
+        codec_args = ['-c', 'copy']
+    else:
+        print(f"Transcoding {path} for {platform}: {'; '.join(problems)}")
+        max_side = spec['max_width']
+        fps = min(max(info['fps'], spec['min_fps']), spec['max_fps']) or 30
+        bitrate = min(spec['max_video_bitrate'], 8_000_000)
+        scale = (f"scale='if(gt(iw,ih),min(iw,{max_side}),-2)':'if(gt(iw,ih),-2,min(ih,{max_side}))'")
+        if spec.get('portrait'):
+            scale = (f"scale={OUTPUT_PORTRAIT[0]}:{OUTPUT_PORTRAIT[1]}:force_original_aspect_ratio=decrease,"
+                     f"pad={OUTPUT_PORTRAIT[0]}:{OUTPUT_PORTRAIT[1]}:(ow-iw)/2:(oh-ih)/2")
+        codec_args = [
+            '-vf', f"{scale},fps={fps:g},format=yuv420p",
+            '-c:v', 'libx264', '-preset', 'medium',
+            '-b:v', str(bitrate), '-maxrate', str(bitrate), '-bufsize', str(bitrate * 2),
+            '-c:a', 'aac', '-b:a', '128k', '-ar', '48000',
+        ]
+        if info['duration'] > spec['max_duration']:
+            codec_args.extend(['-t', str(spec['max_duration'])])
+
+    cmd = ['ffmpeg', '-y', '-i', path, *codec_args, '-movflags', '+faststart', output_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Error making {platform} variant of {path}:")
+        print(result.stderr[-2000:])
+        return None
+
+    variant = probe_video(output_path)
+    remaining = check_video(variant, platform) if variant else ["probe failed"]
+    if remaining:
+        print(f"Variant {output_path} still fails {platform} checks: {'; '.join(remaining)}")
+        return None
+    return output_path
+
+
+def publish_file(post, platform, fix=True):
+    """
+    The file to upload for a post on a platform.
+
+    Uses the variant recorded on the post if there is one; otherwise checks
+    the original and, if fix is set, makes a compliant variant on the spot.
+
+    Returns:
+        str: Path to upload, or None if the video can't be made compliant
+    """
+    variant = post.get('publish_files', {}).get(platform)
+    if variant and os.path.exists(variant):
+        return variant
+
+    info = probe_video(post['video_file'])
+    if not info:
+        return None
+    problems = check_video(info, platform)
+    if not problems:
+        return post['video_file']
+
+    print(f"⚠️ {post['id']} does not meet {platform} limits: {'; '.join(problems)}")
+    return make_compliant(post['video_file'], platform, problems=problems) if fix else None
+
+
+def prepare_upcoming(store, days=7, start_date=None):
+    """
+    Validate the videos of posts scheduled in the next few days and record a
+    compliant variant for any platform whose limits they break.
+
+    Args:
+        store (ScheduleStore): The posting schedule
+        days (int): How many days ahead to prepare
+        start_date (str, optional): First date, YYYY-MM-DD, defaults to today
+
+    Returns:
+        dict: Post ID to {platform: file} for posts that needed a variant
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else datetime.now()
+    prepared = {}
+    for offset in range(days):
+        date_key = (start + timedelta(days=offset)).strftime('%Y-%m-%d')
+        for post in store.get_posts(date_key):
+            if post.get('posted') or not os.path.exists(post['video_file']):
+                continue
+            publish_files = dict(post.get('publish_files', {}))
+            for platform in post.get('platforms', PLATFORM_SPECS):
+                path = publish_file(post, platform)
+                if path and path != post['video_file']:
+                    publish_files[platform] = path
+                elif not path:
+                    print(f"❌ {post['id']}: no {platform}-compliant file")
+            if publish_files != post.get('publish_files', {}):
+                store.record_result(post, publish_files=publish_files)
+                prepared[post['id']] = publish_files
+    return prepared
+
+
+if __name__ == "__main__":
+    from schedule_store import open_store
+
+    prepared = prepare_upcoming(open_store())
+    print(f"✅ Prepared compliant variants for {len(prepared)} posts")
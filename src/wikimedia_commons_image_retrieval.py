@@ -16,6 +16,11 @@ import time
 from tqdm import tqdm
 import os
 
+try:
+    from http_client import get_client
+except ImportError:
+    from src.http_client import get_client
+
 class WikimediaImageScraper:
     def __init__(self, delay=1):
         """
@@ -26,7 +31,7 @@ class WikimediaImageScraper:
         """
         self.base_url = "https://commons.wikimedia.org/w/api.php"
         self.delay = delay
-        self.session = requests.Session()
+        self.session = get_client("wikimedia")
         
     def search_images(self, query, max_images=10):
         """
@@ -1,24 +1,151 @@
-import requests
 import pandas as pd
 from tqdm import tqdm
 import time
 import json
+import os
+import random
+from functools import lru_cache
+
+try:
+    from http_client import get_client
+    from image_index import quality_score
+except ImportError:
+    from src.http_client import get_client
+    from src.image_index import quality_score
+
+COUNTRY_LANG_MAP = "data/country_lang_map.json"
+LANGUAGE_STATS = "outputs/cache/wikipedia_language_stats.json"
+# Castles processed between saves of the language stats
+LANGUAGE_STATS_SAVE_EVERY = 50
+
+
+@lru_cache(maxsize=None)
+def load_country_language_map(path=COUNTRY_LANG_MAP):
+    """Country to primary Wikipedia language code, read once per process (don't modify it)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class LanguageRouter:
+    """
+    Decides which Wikipedias to search for a castle, most likely first.
+
+    Outcomes are kept per (country, language) and split by position: a
+    language searched first tells how often it has the castle, while one
+    searched after others missed only tells how often it helps as a
+    fallback. Languages are ranked by their first-position hit rate,
+    smoothed towards a prior: the country's primary language starts ahead of
+    the default one, so local-language wikis are tried first until the
+    outcomes say otherwise. A fallback that almost never finds anything for a
+    country is skipped for it, but every search has an EXPLORATION_RATE
+    chance of trying all the languages with a lower-ranked one first, so no
+    language's outcomes stop being updated.
+    """
+    # Prior hit rate and its weight (in searches) before any outcomes
+    PRIMARY_PRIOR = 0.6
+    DEFAULT_PRIOR = 0.5
+    OTHER_PRIOR = 0.3
+    PRIOR_WEIGHT = 2
+    # A fallback is skipped for a country after this many searches below this hit rate
+    MIN_SEARCHES = 20
+    MIN_HIT_RATE = 0.05
+    # Share of searches that try every language, with a lower-ranked one first
+    EXPLORATION_RATE = 0.1
+
+    def __init__(self, default_language="en", stats_path=LANGUAGE_STATS, map_path=COUNTRY_LANG_MAP, seed=None):
+        """
+        Args:
+            default_language (str): Wikipedia tried for every country
+            stats_path (str): JSON file the outcomes are kept in (None to disable)
+            map_path (str): Country to primary language map
+            seed (int, optional): Seed for the exploration choices
+        """
+        self.default_language = default_language
+        self.stats_path = stats_path
+        self.country_language_map = load_country_language_map(map_path)
+        self.random = random.Random(seed)
+        # country -> language -> [hits first, searches first, hits after a miss, searches after a miss]
+        self.stats = {}
+        if stats_path and os.path.exists(stats_path):
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+            # Older files didn't record the position, so their counts are dropped
+            self.stats = {country: {language: counts for language, counts in languages.items() if len(counts) == 4}
+                          for country, languages in stats.items()}
+
+    def save(self):
+        if not self.stats_path:
+            return
+        os.makedirs(os.path.dirname(self.stats_path) or '.', exist_ok=True)
+        with open(self.stats_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, indent=2)
+
+    @staticmethod
+    def _key(country):
+        return country.strip() if isinstance(country, str) else ""
+
+    def _counts(self, country, language):
+        return self.stats.get(self._key(country), {}).get(language, (0, 0, 0, 0))
+
+    def primary_language(self, country):
+        return self.country_language_map.get(self._key(country), self.default_language)
+
+    def hit_rate(self, country, language):
+        """Smoothed hit rate of a language for a country, when searched first"""
+        if language == self.primary_language(country) and language != self.default_language:
+            prior = self.PRIMARY_PRIOR
+        elif language == self.default_language:
+            prior = self.DEFAULT_PRIOR
+        else:
+            prior = self.OTHER_PRIOR
+        hits, searches = self._counts(country, language)[:2]
+        return (hits + prior * self.PRIOR_WEIGHT) / (searches + self.PRIOR_WEIGHT)
+
+    def languages(self, country):
+        """Languages to search for a castle in this country, most likely first"""
+        observed = self.stats.get(self._key(country), {})
+        candidates = {self.primary_language(country), self.default_language}
+        candidates.update(language for language, counts in observed.items() if counts[0] or counts[2])
+        ranked = sorted(candidates, key=lambda language: self.hit_rate(country, language), reverse=True)
+
+        if len(ranked) > 1 and self.random.random() < self.EXPLORATION_RATE:
+            ranked.insert(0, ranked.pop(self.random.randrange(1, len(ranked))))
+            return ranked
+
+        def useful(language):
+            hits, searches = self._counts(country, language)[2:]
+            return searches < self.MIN_SEARCHES or hits / searches >= self.MIN_HIT_RATE
+
+        return ranked[:1] + [language for language in ranked[1:] if useful(language)]
+
+    def record(self, country, language, hit, first=True):
+        """
+        Args:
+            first (bool): Whether the language was searched first, rather
+                than after the languages before it missed
+        """
+        counts = self.stats.setdefault(self._key(country), {}).setdefault(language, [0, 0, 0, 0])
+        offset = 0 if first else 2
+        counts[offset] += int(bool(hit))
+        counts[offset + 1] += 1
+
 
 class WikipediaImageFinder:
-    def __init__(self, default_language="en", delay=1):
+    def __init__(self, default_language="en", delay=1, router=None):
         """
         Initialize the Wikipedia image finder with country-based language support.
         
         Args:
             default_language (str): Default Wikipedia language code
             delay (float): Delay between API requests in seconds
+            router (LanguageRouter, optional): Shared language routing table
         """
         self.default_language = default_language
         self.delay = delay
-        self.session = requests.Session()
+        self.session = get_client("wikimedia")
         
-        # Map countries to their primary Wikipedia language codes
-        self.country_language_map = json.loads(open("data/country_lang_map.json").read())
+        # Which Wikipedias to search per country, learned from earlier searches
+        self.router = router or LanguageRouter(default_language)
 
     def get_language_for_country(self, country):
         """
@@ -31,7 +158,7 @@ class WikipediaImageFinder:
         Returns:
             str: Wikipedia language code
         """
-        return self.country_language_map.get(country, self.default_language)
+        return self.router.primary_language(country)
         
 
     
@@ -59,24 +186,25 @@ class WikipediaImageFinder:
         Returns:
             dict: Dictionary with article info and language used
         """
-        # Try language based on country after trying english
-        primary_language = self.get_language_for_country(country)
-    
-        # First try the country's primary language
-        article = self._search_article(castle_name, "en")
-        
-        # If not found and primary language isn't English, try secondary language
-        if not article and primary_language != "en":
-            article = self._search_article(castle_name, primary_language)
-
-        # Return what we found, including which language succeeded
-        if article:
-            return {
-                "title": article,
-                "language": primary_language if article["language"] != "en" else "en"
-            }
-        else:
-            return None
+        # Search the Wikipedias most likely to have the castle first, stopping at the first hit
+        searched = False
+        for language in self.router.languages(country):
+            try:
+                article = self._search_article(castle_name, language)
+            except Exception as e:
+                # A failed request says nothing about the wiki, so it isn't recorded
+                print(f"Error searching in {language} Wikipedia for {castle_name}: {e}")
+                continue
+            # After a failed request the next wiki is still the first real search
+            self.router.record(country, language, article is not None, first=not searched)
+            searched = True
+            if article:
+                # Return what we found, including which language succeeded
+                return {
+                    "title": article,
+                    "language": language
+                }
+        return None
     
     def _search_article(self, query, language):
         """
@@ -87,7 +215,10 @@ class WikipediaImageFinder:
             language (str): Wikipedia language code
             
         Returns:
-            dict: Article info if found, None otherwise
+            dict: Article info if found, None if the wiki has no match
+
+        Raises:
+            Exception: If the request failed (timeout, rate limit, bad response)
         """
         base_url = self.get_base_url(language)
         
@@ -99,22 +230,17 @@ class WikipediaImageFinder:
             "srlimit": 1
         }
         
-        try:
-            response = self.session.get(base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("query", {}).get("search"):
-                # Return the article title and note which language succeeded
-                return {
-                    "title": data["query"]["search"][0]["title"],
-                    "language": language
-                }
-            return None
-            
-        except Exception as e:
-            print(f"Error searching in {language} Wikipedia for {query}: {e}")
-            return None
+        response = self.session.get(base_url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        
+        if data.get("query", {}).get("search"):
+            # Return the article title and note which language succeeded
+            return {
+                "title": data["query"]["search"][0]["title"],
+                "language": language
+            }
+        return None
     
     def get_article_images(self, article_title, language, max_images=5):
         """
@@ -225,8 +351,8 @@ class WikipediaImageFinder:
                         "height": height
                     })
             
-            # Sort by image dimensions (approximate quality indicator)
-            results.sort(key=lambda x: x["width"] * x["height"], reverse=True)
+            # Sort by resolution and how well the image fits a portrait frame
+            results.sort(key=lambda x: quality_score(x["width"], x["height"]), reverse=True)
             
             return results
             
@@ -260,37 +386,41 @@ class WikipediaImageFinder:
         result_df[f"wikipedia_article_url"] = ""
         result_df[f"wikipedia_language"] = ""
         
-        # Process each castle
-        for idx, row in tqdm(result_df.iterrows(), total=len(result_df), desc="Processing castles"):
-            castle_name = row[castle_name_col]
-            country = row[country_col] if country_col and country_col in row else None
-            region = row[region_col] if region_col and region_col in row else None
+        # Process each castle; the language stats are saved as they are learned
+        try:
+            for count, (idx, row) in enumerate(tqdm(result_df.iterrows(), total=len(result_df), desc="Processing castles"), 1):
+                castle_name = row[castle_name_col]
+                country = row[country_col] if country_col and country_col in row else None
+                region = row[region_col] if region_col and region_col in row else None
             
-            # Find Wikipedia article using country info
-            article_info = self.find_castle_article(castle_name, country, region)
+                # Find Wikipedia article using country info
+                article_info = self.find_castle_article(castle_name, country, region)
             
-            if article_info:
-                article_title = article_info["title"]['title']
-                language = article_info["language"]
+                if article_info:
+                    article_title = article_info["title"]['title']
+                    language = article_info["language"]
                 
-                # Store the article URL and language
-                wiki_url = f"https://{language}.wikipedia.org/wiki/{article_title.replace(' ', '_')}"
-                result_df.at[idx, f"wikipedia_article_url"] = wiki_url
-                result_df.at[idx, f"wikipedia_language"] = language
+                    # Store the article URL and language
+                    wiki_url = f"https://{language}.wikipedia.org/wiki/{article_title.replace(' ', '_')}"
+                    result_df.at[idx, f"wikipedia_article_url"] = wiki_url
+                    result_df.at[idx, f"wikipedia_language"] = language
                 
-                # Get images from the article
-                image_titles = self.get_article_images(article_title, language, max_images=max_images)
+                    # Get images from the article
+                    image_titles = self.get_article_images(article_title, language, max_images=max_images)
                 
-                if image_titles:
-                    # Get image information
-                    image_info = self.get_image_info(image_titles, language)
+                    if image_titles:
+                        # Get image information
+                        image_info = self.get_image_info(image_titles, language)
                     
-                    # Add to DataFrame
-                    for i, info in enumerate(image_info):
-                        if i < max_images:
-                            result_df.at[idx, f"{output_col_prefix}{i+1}_url"] = info["url"]
+                        # Add to DataFrame
+                        for i, info in enumerate(image_info):
+                            if i < max_images:
+                                result_df.at[idx, f"{output_col_prefix}{i+1}_url"] = info["url"]
             
-            # Respect rate limits
-            time.sleep(self.delay)
-        
+                # Respect rate limits
+                time.sleep(self.delay)
+                if count % LANGUAGE_STATS_SAVE_EVERY == 0:
+                    self.router.save()
+        finally:
+            self.router.save()
         return result_df
\ No newline at end of file
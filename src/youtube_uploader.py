@@ -1,11 +1,37 @@
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
+import hashlib
+import httplib2
+import json
 import os
+import random
+import socket
+import time
+
+# Upload chunks must be a multiple of 256 KB
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Where upload session URIs are kept so an interrupted upload can be resumed.
+# Session URIs are live upload credentials, so this file is kept out of git
+# (CI persists it with actions/cache).
+UPLOAD_SESSIONS_PATH = os.environ.get("YOUTUBE_UPLOAD_SESSIONS", "outputs/cache/upload_sessions.json")
+
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, IOError, ConnectionError, socket.timeout)
+MAX_BACKOFF = 64
 
 class YouTubeUploader:
-    def __init__(self):
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, max_retries=8, sessions_path=UPLOAD_SESSIONS_PATH):
         self.service = None
+        self.credentials = None
+        # Round up to the nearest allowed chunk size
+        self.chunk_size = -(-chunk_size // CHUNK_ALIGNMENT) * CHUNK_ALIGNMENT
+        self.max_retries = max_retries
+        self.sessions_path = sessions_path
         self.authenticate()
     
     def authenticate(self):
@@ -32,6 +58,7 @@ class YouTubeUploader:
             
             # Build YouTube service
             self.service = build("youtube", "v3", credentials=creds)
+            self.credentials = creds
             print("✅ YouTube authentication successful")
             return True
             
@@ -39,11 +66,88 @@ class YouTubeUploader:
             print(f"❌ YouTube authentication failed: {e}")
             return False
     
-    def upload_video(self, video_path, title, description, tags):
-        """Upload video to YouTube"""
+    def _load_sessions(self):
+        """Load saved upload session URIs"""
+        if self.sessions_path and os.path.exists(self.sessions_path):
+            with open(self.sessions_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save_session(self, key, resumable_uri):
+        """Save (or with None, forget) the session URI for an upload"""
+        if not self.sessions_path:
+            return
+        sessions = self._load_sessions()
+        if resumable_uri:
+            sessions[key] = {'uri': resumable_uri, 'saved': time.time()}
+        else:
+            sessions.pop(key, None)
+        os.makedirs(os.path.dirname(self.sessions_path) or '.', exist_ok=True)
+        with open(self.sessions_path, 'w', encoding='utf-8') as f:
+            json.dump(sessions, f, indent=2)
+
+    @staticmethod
+    def _session_key(video_path, chunk_size=1024 * 1024):
+        """Identify an upload by file path, size and a hash of its contents
+        (not mtime, which changes on every CI checkout)"""
+        digest = hashlib.sha1()
+        with open(video_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return f"{video_path}|{os.path.getsize(video_path)}|{digest.hexdigest()}"
+
+    def _session_status(self, resumable_uri, total_size):
+        """Ask the server how much of a saved session it has.
+
+        Returns ('partial', bytes received), ('complete', response body) or
+        ('expired', None) for a session the server no longer knows."""
+        http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        resp, content = http.request(
+            resumable_uri, method='PUT', body=b'',
+            headers={'Content-Length': '0', 'Content-Range': f'bytes */{total_size}'}
+        )
+        if resp.status in (200, 201):
+            return 'complete', json.loads(content)
+        if resp.status == 308:
+            # Range is 'bytes=0-N' for the bytes received so far; absent means none
+            received = resp.get('range')
+            return 'partial', int(received.split('-')[1]) + 1 if received else 0
+        if resp.status in (404, 410):
+            return 'expired', None
+        raise HttpError(resp, content, uri=resumable_uri)
+
+    def _insert_request(self, video_path, body):
+        """A fresh resumable insert request for the video"""
+        media = MediaFileUpload(
+            video_path,
+            chunksize=self.chunk_size,
+            resumable=True,
+            mimetype='video/mp4'
+        )
+        return self.service.videos().insert(
+            part=','.join(body.keys()),
+            body=body,
+            media_body=media
+        )
+
+    @staticmethod
+    def print_progress(uploaded, total):
+        """Default progress callback"""
+        print(f"📤 Uploaded {uploaded / 1024 / 1024:.1f}/{total / 1024 / 1024:.1f} MB ({uploaded / total:.0%})")
+
+    def upload_video(self, video_path, title, description, tags, progress_callback=None, deadline=None):
+        """Upload video to YouTube in resumable chunks.
+
+        Progress is reported after each chunk, retriable errors are retried with
+        exponential backoff and the session URI is saved, so a re-run resumes a
+        partial upload instead of sending the whole video again. With a deadline
+        (a time.time() value) the upload stops between chunks once it passes,
+        leaving the session to be resumed next run."""
         if not self.service:
             print("❌ YouTube service not authenticated")
             return None
+
+        progress_callback = progress_callback or self.print_progress
         
         try:
             # Prepare video metadata
@@ -60,24 +164,71 @@ class YouTubeUploader:
                 }
             }
             
-            # Create media upload object
-            media = MediaFileUpload(
-                video_path,
-                chunksize=-1,
-                resumable=True,
-                mimetype='video/mp4'
-            )
-            
             print(f"📤 Starting upload of {os.path.basename(video_path)}...")
             
-            # Execute upload
-            insert_request = self.service.videos().insert(
-                part=','.join(body.keys()),
-                body=body,
-                media_body=media
-            )
+            insert_request = self._insert_request(video_path, body)
+            total_size = os.path.getsize(video_path)
             
-            response = insert_request.execute()
+            session_key = self._session_key(video_path)
+            saved_session = self._load_sessions().get(session_key)
+            response = None
+            if saved_session:
+                state, result = self._session_status(saved_session['uri'], total_size)
+                if state == 'complete':
+                    print("🔁 Previous upload session had already finished")
+                    response = result
+                elif state == 'partial':
+                    print(f"🔁 Resuming previous upload session at {result / 1024 / 1024:.1f} MB")
+                    insert_request.resumable_uri = saved_session['uri']
+                    insert_request.resumable_progress = result
+                else:
+                    print("⚠️ Upload session expired, starting again")
+                    self._save_session(session_key, None)
+                    saved_session = None
+
+            retry = 0
+            while response is None:
+                if deadline and time.time() > deadline:
+                    print("⏰ Publish deadline reached, stopping upload (will resume next run)")
+                    return None
+                error = None
+                try:
+                    # After a failed chunk, next_chunk itself asks the server
+                    # how much it has before sending more
+                    status, response = insert_request.next_chunk()
+
+                    if insert_request.resumable_uri and not saved_session:
+                        self._save_session(session_key, insert_request.resumable_uri)
+                        saved_session = {'uri': insert_request.resumable_uri}
+                    if status:
+                        progress_callback(status.resumable_progress, status.total_size)
+                    retry = 0
+
+                except HttpError as e:
+                    if e.resp.status in RETRIABLE_STATUS_CODES:
+                        error = f"HTTP {e.resp.status}"
+                    elif e.resp.status in (404, 410) and saved_session:
+                        # The saved session has expired, start a fresh one
+                        print("⚠️ Upload session expired, starting again")
+                        self._save_session(session_key, None)
+                        saved_session = None
+                        insert_request = self._insert_request(video_path, body)
+                        continue
+                    else:
+                        raise
+                except RETRIABLE_EXCEPTIONS as e:
+                    error = str(e)
+
+                if error:
+                    retry += 1
+                    if retry > self.max_retries:
+                        print(f"❌ Giving up after {self.max_retries} retries: {error}")
+                        return None
+                    sleep_seconds = random.uniform(0.5, 1.0) * min(2 ** retry, MAX_BACKOFF)
+                    print(f"⚠️ Retriable upload error ({error}), retrying in {sleep_seconds:.1f}s")
+                    time.sleep(sleep_seconds)
+
+            self._save_session(session_key, None)
             
             if 'id' in response:
                 video_id = response['id']
@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+pytest.importorskip("requests")
+
+from analytics import (InstagramInsightsCollector, MetricsStore, YouTubeAnalyticsCollector, castle_priority,
+                       collect_analytics)
+from http_client import HTTPClient
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'analytics')
+
+
+class ReplayHttp:
+    """
+    Stands in for httplib2.Http under a googleapiclient service, answering
+    each API path with its recorded response body.
+    """
+    RESPONSES = {
+        '/youtube/v3/videos': 'videos.json',
+        '/v2/reports': 'reports.json',
+    }
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=1, connection_type=None):
+        import httplib2
+
+        parts = urlsplit(uri)
+        self.requests.append((parts.path, parse_qs(parts.query)))
+        with open(os.path.join(FIXTURES, 'youtube', self.RESPONSES[parts.path]), 'rb') as f:
+            content = f.read()
+        return httplib2.Response({'status': '200', 'content-type': 'application/json'}), content
+
+
+def replayed_services():
+    discovery = pytest.importorskip("googleapiclient.discovery")
+    http = ReplayHttp()
+    youtube = discovery.build("youtube", "v3", http=http, static_discovery=True)
+    analytics = discovery.build("youtubeAnalytics", "v2", http=http, static_discovery=True)
+    return youtube, analytics, http
+
+
+def test_youtube_collector_merges_statistics_and_retention():
+    youtube, analytics, http = replayed_services()
+    metrics = YouTubeAnalyticsCollector(youtube, analytics).collect(['yt1', 'yt2'])
+
+    assert metrics['yt1'] == {'view_count': 5400.0, 'like_count': 210.0, 'comment_count': 14.0,
+                              'views': 5400.0, 'averageViewDuration': 31.0, 'averageViewPercentage': 78.5}
+    # A video with comments turned off has no commentCount
+    assert metrics['yt2']['comment_count'] == 0.0
+    # One videos.list and one report for both videos
+    paths = [path for path, _ in http.requests]
+    assert paths == ['/youtube/v3/videos', '/v2/reports']
+    assert http.requests[0][1]['id'] == ['yt1,yt2']
+    assert http.requests[1][1]['filters'] == ['video==yt1,yt2']
+
+
+def test_instagram_collector_reads_recorded_insights():
+    session = HTTPClient(replay_dir=os.path.join(FIXTURES, 'http'))
+    collector = InstagramInsightsCollector(access_token='test-token', session=session)
+    metrics = collector.collect(['111', '222', '333'])
+
+    assert metrics['111'] == {'like_count': 40.0, 'comments_count': 5.0, 'plays': 1200.0, 'reach': 900.0,
+                              'saved': 12.0, 'shares': 8.0, 'total_interactions': 65.0}
+    assert metrics['222']['plays'] == 150.0
+    # Media missing from the response are left out
+    assert '333' not in metrics
+
+
+def test_castle_priority_from_recorded_metrics(tmp_path):
+    youtube, analytics, _ = replayed_services()
+    session = HTTPClient(replay_dir=os.path.join(FIXTURES, 'http'))
+    posts = [
+        {'id': 'castle_001', 'video_file': 'content/castle_videos/Alnwick_Castle_video.mp4',
+         'youtube_video_id': 'yt1', 'instagram_media_id': 111},
+        {'id': 'castle_002', 'video_file': 'content/castle_videos/Bodiam_Castle_video.mp4',
+         'youtube_video_id': 'yt2', 'instagram_media_id': 222},
+        {'id': 'castle_003', 'video_file': 'content/castle_videos/Chateau_de_Blois_video.mp4',
+         'instagram_media_id': 333},
+    ]
+    metadata = {
+        'Alnwick_Castle': {'country': 'United Kingdom', 'structure_type': 'castle'},
+        'Bodiam_Castle': {'country': 'United Kingdom', 'structure_type': 'castle'},
+        'Chateau_de_Blois': {'country': 'France', 'structure_type': 'chateau'},
+        'Warwick_Castle': {'country': 'United Kingdom', 'structure_type': 'castle'},
+        'Chateau_de_Chambord': {'country': 'France', 'structure_type': 'chateau'},
+    }
+
+    metrics_store = MetricsStore(str(tmp_path / 'analytics.db'))
+    counts = collect_analytics(posts, metrics_store, YouTubeAnalyticsCollector(youtube, analytics),
+                               InstagramInsightsCollector(access_token='test-token', session=session))
+    assert counts == {'youtube': 2, 'instagram': 2}
+
+    priority = castle_priority(metrics_store, posts, metadata)
+    # Posted castles are scored on their own videos
+    assert priority['Alnwick_Castle'] > priority['Bodiam_Castle']
+    # Unposted castles get their group's average, pulled towards the overall one
+    assert priority['Bodiam_Castle'] < priority['Warwick_Castle'] < priority['Alnwick_Castle']
+    # No metrics came back for Blois, so France only has the overall average
+    assert priority['Chateau_de_Blois'] == pytest.approx(priority['Chateau_de_Chambord'])
+
+    # The exported summary seeds an empty store with the same priorities
+    summary = tmp_path / 'analytics_latest.json'
+    metrics_store.export_latest(str(summary))
+    metrics_store.close()
+    assert json.loads(summary.read_text())['media']
+    seeded = MetricsStore(str(tmp_path / 'seeded.db'))
+    seeded.import_latest(str(summary))
+    assert castle_priority(seeded, posts, metadata) == pytest.approx(priority)
+    seeded.close()
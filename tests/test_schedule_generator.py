@@ -0,0 +1,109 @@
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from schedule_generator import plan_schedule, spread_castles
+
+
+def make_castles(groups):
+    """Castles and metadata from {(country, type): count}"""
+    castles, metadata = [], {}
+    for (country, structure_type), count in groups.items():
+        for i in range(count):
+            name = f"{country}_{structure_type}_{i}"
+            castles.append({'name': name, 'video_file': f"{name}_video.mp4"})
+            metadata[name] = {'country': country, 'structure_type': structure_type}
+    return castles, metadata
+
+
+def neighbour_repeats(ordered, metadata, field):
+    values = [metadata[castle['name']][field] for castle in ordered]
+    return sum(1 for a, b in zip(values, values[1:]) if a == b)
+
+
+def test_no_country_repeats_when_groups_share_a_country():
+    # uk/castle and uk/palace are separate groups of the same country
+    castles, metadata = make_castles({
+        ('uk', 'castle'): 4, ('uk', 'palace'): 4, ('france', 'castle'): 4, ('germany', 'palace'): 4,
+    })
+    ordered = spread_castles(castles, metadata)
+    assert len(ordered) == len(castles)
+    assert neighbour_repeats(ordered, metadata, 'country') == 0
+
+
+def test_no_type_repeats_when_an_alternative_exists():
+    castles, metadata = make_castles({
+        ('uk', 'castle'): 3, ('france', 'castle'): 3, ('germany', 'palace'): 3, ('spain', 'palace'): 3,
+    })
+    ordered = spread_castles(castles, metadata)
+    assert neighbour_repeats(ordered, metadata, 'country') == 0
+    assert neighbour_repeats(ordered, metadata, 'structure_type') == 0
+
+
+def test_repeats_only_when_unavoidable():
+    # Six uk castles and two others: only the leftover uk castles can repeat
+    castles, metadata = make_castles({('uk', 'castle'): 6, ('france', 'castle'): 1, ('spain', 'castle'): 1})
+    ordered = spread_castles(castles, metadata)
+    countries = [metadata[castle['name']]['country'] for castle in ordered]
+    assert Counter(countries) == {'uk': 6, 'france': 1, 'spain': 1}
+    assert neighbour_repeats(ordered, metadata, 'country') == 6 - 1 - 2
+
+
+def test_country_repeats_only_when_no_other_country_is_left():
+    rng = random.Random(7)
+    for _ in range(50):
+        groups = {(rng.choice('abcd'), rng.choice(['castle', 'palace', 'fort'])): rng.randint(1, 6)
+                  for _ in range(rng.randint(2, 8))}
+        castles, metadata = make_castles(groups)
+        ordered = spread_castles(castles, metadata)
+        countries = [metadata[castle['name']]['country'] for castle in ordered]
+        for i in range(1, len(countries)):
+            if countries[i] == countries[i - 1]:
+                assert set(countries[i:]) == {countries[i]}
+
+
+def test_engagement_priority_moves_a_group_forward():
+    castles, metadata = make_castles({('uk', 'castle'): 4, ('france', 'palace'): 4, ('spain', 'fort'): 4})
+    priority = {castle['name']: 1.0 for castle in castles if metadata[castle['name']]['country'] == 'spain'}
+    ordered = spread_castles(castles, metadata, priority)
+    countries = [metadata[castle['name']]['country'] for castle in ordered]
+    assert countries[0] == 'spain'
+    # Spain is drawn more often early on without breaking the spread
+    assert countries[:6].count('spain') == 3
+    assert neighbour_repeats(ordered, metadata, 'country') == 0
+
+
+def make_videos(directory, names):
+    for name in names:
+        (directory / f"{name}_video.mp4").write_bytes(b"")
+    return str(directory)
+
+
+def test_plan_schedule_fills_free_slots_from_the_start_date(tmp_path):
+    directory = make_videos(tmp_path, ['A', 'B', 'C'])
+    posts = plan_schedule(directory, [], '2026-01-01', slots={'youtube': ['17:00'], 'instagram': ['17:00']})
+    assert [post['scheduled_date'] for post in posts] == ['2026-01-01', '2026-01-02', '2026-01-03']
+    assert [post['id'] for post in posts] == ['castle_001', 'castle_002', 'castle_003']
+    # Both platforms post the same video at the same time, so they share a post
+    assert all(post['platforms'] == ['instagram', 'youtube'] for post in posts)
+
+
+def test_plan_schedule_keeps_existing_posts_and_their_slots(tmp_path):
+    directory = make_videos(tmp_path, ['A', 'B'])
+    existing = [{'id': 'castle_007', 'video_file': f"{directory}/A_video.mp4", 'scheduled_date': '2026-01-01',
+                 'scheduled_time': '17:00', 'platforms': ['youtube'], 'posted': True}]
+    posts = plan_schedule(directory, existing, '2026-01-01', slots={'youtube': ['17:00']})
+    assert len(posts) == 1
+    assert posts[0]['video_file'] == f"{directory}/B_video.mp4"
+    assert posts[0]['scheduled_date'] == '2026-01-02'
+    assert posts[0]['id'] == 'castle_008'
+
+
+def test_plan_schedule_uses_every_slot_of_a_day(tmp_path):
+    directory = make_videos(tmp_path, ['A', 'B', 'C'])
+    posts = plan_schedule(directory, [], '2026-01-01', slots={'youtube': ['09:00', '17:00']})
+    assert [(post['scheduled_date'], post['scheduled_time']) for post in posts] == [
+        ('2026-01-01', '09:00'), ('2026-01-01', '17:00'), ('2026-01-02', '09:00')]
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from schedule_store import ScheduleStore, open_store
+
+
+def make_post(post_id, date_key, **fields):
+    return {'id': post_id, 'video_file': f"{post_id}_video.mp4", 'scheduled_date': date_key,
+            'scheduled_time': '17:00', 'platforms': ['youtube'], 'posted': False, **fields}
+
+
+def test_posts_are_sharded_by_date(tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    store.put_posts([make_post('a', '2026-01-01'), make_post('b', '2026-01-02'), make_post('c', '2026-01-02')])
+    assert store.dates() == ['2026-01-01', '2026-01-02']
+    assert [post['id'] for post in store.get_posts('2026-01-02')] == ['b', 'c']
+    assert [post['id'] for post in store.get_all_posts()] == ['a', 'b', 'c']
+
+
+def test_results_are_appended_to_the_ledger_and_compacted(tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    post = make_post('a', '2026-01-01')
+    store.put_posts([post])
+    store.record_result(post, posted=True, youtube_id='xyz')
+
+    # The shard is untouched until compaction, but reads see the result
+    with open(os.path.join(store.days_dir, '2026-01-01.json'), encoding='utf-8') as f:
+        assert json.load(f)[0]['posted'] is False
+    assert store.get_posts('2026-01-01')[0]['youtube_id'] == 'xyz'
+
+    assert store.compact() == 1
+    with open(os.path.join(store.days_dir, '2026-01-01.json'), encoding='utf-8') as f:
+        assert json.load(f)[0]['posted'] is True
+    assert os.path.getsize(os.path.join(store.ledger_dir, '2026-01-01.jsonl')) == 0
+
+
+def test_compact_before_leaves_recent_ledgers(tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    old, new = make_post('a', '2026-01-01'), make_post('b', '2026-01-05')
+    store.put_posts([old, new])
+    store.record_result(old, posted=True)
+    store.record_result(new, posted=True)
+    assert store.compact(before='2026-01-05') == 1
+    assert os.path.getsize(os.path.join(store.ledger_dir, '2026-01-05.jsonl')) > 0
+
+
+def test_broken_last_ledger_line_is_skipped(tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    post = make_post('a', '2026-01-01')
+    store.put_posts([post])
+    store.record_result(post, posted=True)
+    with open(os.path.join(store.ledger_dir, '2026-01-01.jsonl'), 'a', encoding='utf-8') as f:
+        f.write('{"id": "a", "fiel')
+    assert store.get_posts('2026-01-01')[0]['posted'] is True
+
+
+def test_moving_a_post_removes_it_from_its_old_date(tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    store.put_posts([make_post('a', '2026-01-01'), make_post('b', '2026-01-01')])
+    store.put_posts([make_post('a', '2026-01-03')])
+    assert [post['id'] for post in store.get_posts('2026-01-01')] == ['b']
+    assert [post['id'] for post in store.get_posts('2026-01-03')] == ['a']
+
+
+def test_open_store_imports_the_legacy_schedule_once(tmp_path):
+    legacy = tmp_path / 'schedule.json'
+    legacy.write_text(json.dumps({'posts': [make_post('a', '2026-01-01')]}), encoding='utf-8')
+    root = str(tmp_path / 'schedule')
+    store = open_store(root, str(legacy))
+    assert [post['id'] for post in store.get_all_posts()] == ['a']
+
+    legacy.write_text(json.dumps({'posts': [make_post('z', '2026-02-01')]}), encoding='utf-8')
+    assert [post['id'] for post in open_store(root, str(legacy)).get_all_posts()] == ['a']
@@ -1,5 +1,5 @@
 # check_instagram_token.py - Check your current Instagram token details
-import requests
+from src.http_client import get_client
 from datetime import datetime, timedelta
 
 def check_instagram_token(access_token):
@@ -14,7 +14,7 @@ def check_instagram_token(access_token):
         }
         
         print("🔍 Checking Instagram token...")
-        response = requests.get(url, params=params)
+        response = get_client("instagram").get(url, params=params)
         
         if response.status_code == 200:
             user_data = response.json()
@@ -29,7 +29,7 @@ def check_instagram_token(access_token):
                 'access_token': access_token  # Self-debug
             }
             
-            debug_response = requests.get(debug_url, params=debug_params)
+            debug_response = get_client("instagram").get(debug_url, params=debug_params)
             
             if debug_response.status_code == 200:
                 debug_data = debug_response.json()
@@ -84,7 +84,7 @@ def exchange_for_long_lived_token(short_token, app_id, app_secret):
         }
         
         print("🔄 Exchanging for long-lived token...")
-        response = requests.get(url, params=params)
+        response = get_client("instagram").get(url, params=params)
         
         if response.status_code == 200:
             data = response.json()
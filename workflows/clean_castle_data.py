@@ -1,193 +1,63 @@
 """
 Clean and update the castle data
+
+Runs the three cleaning stages from src/castle_cleaning.py: generated
+descriptions, structure classification and image retrieval. Each stage reads
+its input CSV, applies its rules in one pass and prints how many rows each
+rule rejected.
 """
 
 __date__ = "2025-03-11"
 __author__ = "NedeeshaWeerasuriya"
-__version__ = "0.1"
+__version__ = "0.2"
 
 
 
 # %% --------------------------------------------------------------------------
-
-# -----------------------------------------------------------------------------
 # Import Modules
-import pandas as pd
-import numpy as np
-# Read the data
-df = pd.read_csv("outputs/llm_descriptions_2.csv")
-
-# filter out castles with missing or unknown names
-df = df[df['name']!="Unknown"]
-df = df[df['name']!=""]
-df = df[df['name'].notnull()]
-
-# filter out descriptions beginning with "Unfortunately" or "I'm sorry"
-null_descriptions = df[df['description'].isnull()]
-df = df[df['description'].notnull()]
-removed_descriptions = df[df['description'].str.startswith("Unfortunately") | df['description'].str.startswith("I'm sorry") | df['description'].str.startswith("I'm afraid")]
-
-df = df.drop(removed_descriptions.index)
-
-filtered_df = df[['name', 'description', 'historic_type', 'castle_type', 'country']]
-
-# removed descriptions with less than 50 words
-filtered_df = filtered_df[filtered_df['description'].str.split().str.len() > 50]
-
-
-# %% --------------------------------------------------------------------------
-# Add City column
-# -----------------------------------------------------------------------------
-
-def separate_city_country(text: str):
-    """
-    Separate city and country from a text string that has the format 'City: city_name, Country: country_name'
-    """
-    if 'City' in text:
-        city = text.split('City: ')[1].split(',')[0]
-        if city == 'Unknown':
-            city = np.nan
-    else:
-        city = np.nan
-    if 'Country' in text:
-        country = text.split('Country: ')[1].split('\n')[0]
-    else:
-        country = np.nan
-    return city, country
-
-
-cities, countries = zip(*filtered_df['description'].apply(separate_city_country))
-cities
-
-# fix cases where single quotes are within double quotes
-cities = [city.replace("'", "") if isinstance(city, str) else city for city in cities]
-filtered_df['city'] = cities
-
-# sort by populated columns with the order of preference: description, city, historic_type, castle_type
-# Define column weights (higher = more important)
-weights = {
-    'description': 4,
-    'city': 3,
-    'historic_type': 2,
-    'castle_type': 1
-}
-# Default weight of 1 for unspecified columns
-
-# Apply weights to the notna() result
-weighted_counts = pd.DataFrame({
-    col: filtered_df[col].notna() * weights.get(col, 1) for col in filtered_df.columns
-}).sum(axis=1)
-
-# Sort by the weighted counts
-df_sorted = filtered_df.loc[weighted_counts.sort_values(ascending=False).index]
-df_sorted.reset_index(drop=True, inplace=True)
-
-df_sorted = df_sorted[['name', 'country', 'city', 'castle_type', 'description']]
-
-# Save the cleaned data enabling utf-8 encoding
-df_sorted.to_csv("outputs/cleaned_castle_data_2.csv", index=False, encoding='utf-8')
-
-# %%
-
-# %% --------------------------------------------------------------------------
-# Join classified castle datasets and remove rows
 # -----------------------------------------------------------------------------
 import pandas as pd
 
-# Load the classified castle data
-df = pd.read_csv("outputs/classified_castles_2.csv")
+from src.castle_cleaning import clean_classified, clean_descriptions, clean_with_images
 
-# remove rows marked for removal in structure_type column. Any with 'remove' included in the string
-df = df[~df['structure_type'].str.contains('remove', case=False)]
-df = df[~df['structure_type'].str.contains('invalid', case=False)]
-#combined.to_csv("outputs/castle_list_rest.csv", index=False)
 
-# Remove any row with the word ruin in the description or name
-df = df[~df['description'].str.contains('ruin', case=False)]
-df = df[~df['name'].str.contains('ruin', case=False)]
+def clean_description_data(input_path="outputs/llm_descriptions_2.csv",
+                           output_path="outputs/cleaned_castle_data_2.csv"):
+    """Castles with usable descriptions, most complete rows first"""
+    df = clean_descriptions(pd.read_csv(input_path))
+    # Save the cleaned data enabling utf-8 encoding
+    df.to_csv(output_path, index=False, encoding='utf-8')
+    return df
 
-# remove any castle types in 'castle_type' columns that are stately. the column contains nans
-df = df[~df['castle_type'].str.contains('stately', case=False, na=False)]
 
+def clean_classified_data(input_path="outputs/classified_castles_2.csv",
+                          output_path="outputs/castle_list_rest.csv", min_confidence=0.5):
+    """Castles the classifier kept (structure_type is one of llm_verify.STRUCTURE_TYPES)"""
+    df = clean_classified(pd.read_csv(input_path), min_confidence=min_confidence)
+    df.to_csv(output_path, index=False)
+    return df
 
-# only keep castles, palaces and fortresses
-#df = df[df['structure_type'].str.contains('castle|palace|fortress', case=False)]
-df = df[['name', 'country', 'city', 'structure_type', 'description']].reset_index(drop=True)
 
-df.to_csv("outputs/castle_list_rest.csv", index=False)
+def clean_image_data(input_paths=("outputs/final/castle_data_all_images_v1.csv",
+                                  "outputs/final/castle_data_all_images_rest.csv"),
+                     output_path="outputs/final/castle_data_all_images_v2.csv",
+                     castles_path="outputs/final/only_castles_v2.csv", min_images=4):
+    """Castles with enough images, plus the subset classified as castles"""
+    combined = pd.concat([pd.read_csv(path) for path in input_paths], ignore_index=True)
+    df = clean_with_images(combined, min_images=min_images)
+    df.to_csv(output_path, index=False)
 
+    castles_only = df[df['structure_type'] == 'castle'].reset_index(drop=True)
+    castles_only.to_csv(castles_path, index=False)
+    return df
 
-# %%
 
 # %% --------------------------------------------------------------------------
-#
+# Run every stage
 # -----------------------------------------------------------------------------
-import pandas as pd
-
-# Load the classified castle data
-class_1 = pd.read_csv("outputs/images/castle_data_with_images_1000.csv")
-class_2 = pd.read_csv("outputs/images/castle_data_with_images_rest.csv")
-
-# Combine the two dataframes
-combined = pd.concat([class_1, class_2], ignore_index=True)
-
-# remove columns with image descriptions
-combined = combined.drop(columns=combined.filter(like='description_url').columns)
-
-# create number of images column (columns with image urls are name image_url_n)
-combined['num_images'] = combined.filter(like='image_url').count(axis=1)
-
-
-
-#to csv
-#combined.to_csv("outputs/castle_data_with_images.csv", index=False)
-# %%
-# number of rows with < 3 images
-combined[combined['num_images'] < 3].shape[0]
-
-# %%
-import pandas as pd
-
-df1 = pd.read_csv("outputs/final/castle_data_all_images_v1.csv")
-df2 = pd.read_csv("outputs/final/castle_data_all_images_rest.csv")
-
-combined = pd.concat([df1, df2], ignore_index=True)
-
-# remove columns with less than 3 images between the two columns "wikimedia_number_of_images" and "wikipedia_number_of_images"
-combined = combined[combined['wikimedia_number_of_images'] + combined['wikipedia_number_of_images'] > 3]
-
-# remove rows with the same name irrespective of case
-combined = combined[~combined['name'].str.lower().duplicated(keep='first')]
-
-combined = combined[['name', 'country', 'city', 'structure_type', 'description',
-       'wikipedia_article_url', 'wikipedia_language', 'wikipedia_image_urls',
-       'wikimedia_image_urls', 'wikipedia_number_of_images',
-       'wikimedia_number_of_images']]
-
-def get_country_from_description(text: str):
-    """
-    Separate city and country from a text string that has the format 'City: city_name, Country: country_name'
-    """
-    if 'Country' in text:
-        country = text.split('Country: ')[1].split('\n')[0]
-    else:
-        country = np.nan
-    return country
-
-
-countries = combined['description'].apply(get_country_from_description)
-
-combined['country'] = combined['country'].fillna(pd.Series(countries))
-
-# reset index
-combined.reset_index(drop=True, inplace=True)
-
-
-# save to csv
-combined.to_csv("outputs/final/castle_data_all_images_v2.csv", index=False)
-castles_only = combined[combined['structure_type'] == 'castle']
-# reset index
-castles_only.reset_index(drop=True, inplace=True)
-castles_only.to_csv("outputs/final/only_castles_v2.csv", index=False)
+if __name__ == "__main__":
+    clean_description_data()
+    clean_classified_data()
+    clean_image_data()
 
 # %%
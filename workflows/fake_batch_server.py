@@ -0,0 +1,256 @@
+"""
+Local stand-in for the Anthropic and OpenAI batch APIs
+
+Implements just enough of both (create, retrieve and results for Message
+Batches; file upload, batch create/retrieve and file content for OpenAI) to
+run llm_batch end to end without an API key. Every request is answered by a
+responder function, and a batch reports itself as in progress for a given
+number of polls before it ends.
+
+    server = FakeBatchServer(responder).start()
+    anthropic.Anthropic(api_key="test", base_url=server.url)
+    openai.OpenAI(api_key="test", base_url=server.url + "/v1")
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+# %% --------------------------------------------------------------------------
+import email
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def echo_responder(provider, params):
+    """Default responder: replies with the last user message"""
+    text = params['messages'][-1]['content']
+    if provider == 'anthropic':
+        return {
+            'id': 'msg_fake', 'type': 'message', 'role': 'assistant', 'model': params['model'],
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {'input_tokens': len(text) // 4, 'output_tokens': len(text) // 4},
+        }
+    return {
+        'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': params['model'],
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': text}}],
+        'usage': {'prompt_tokens': len(text) // 4, 'completion_tokens': len(text) // 4, 'total_tokens': len(text) // 2},
+    }
+
+
+class FakeBatchServer:
+    def __init__(self, responder=echo_responder, polls_until_done=1, host="127.0.0.1", port=0):
+        """
+        Args:
+            responder: Function (provider, request params) -> response dict,
+                raising an exception to make that request fail
+            polls_until_done (int): Status checks that report the batch as still running
+            host, port: Where to listen (port 0 picks a free one)
+        """
+        self.responder = responder
+        self.polls_until_done = polls_until_done
+        self.host = host
+        self.port = port
+        self.server = None
+        self.files = {}
+        self.batches = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.server.server_address[1]}"
+
+    def start(self):
+        server = self
+
+        class Handler(FakeBatchHandler):
+            fake = server
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="fake-batch-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def new_id(self, prefix):
+        with self.lock:
+            return f"{prefix}_{next(self.ids):06d}"
+
+    def run_requests(self, provider, requests):
+        """Answer every request in a batch, as result lines"""
+        lines = []
+        for request in requests:
+            params = request['params'] if provider == 'anthropic' else request['body']
+            try:
+                response = self.responder(provider, params)
+                error = None
+            except Exception as e:
+                response, error = None, str(e)
+            if provider == 'anthropic':
+                result = ({'type': 'succeeded', 'message': response} if error is None else
+                          {'type': 'errored', 'error': {'type': 'error', 'error': {'type': 'api_error', 'message': error}}})
+                lines.append({'custom_id': request['custom_id'], 'result': result})
+            else:
+                lines.append({
+                    'id': self.new_id('batch_req'),
+                    'custom_id': request['custom_id'],
+                    'response': {'status_code': 200, 'request_id': 'fake', 'body': response} if error is None else
+                                {'status_code': 500, 'request_id': 'fake', 'body': {'error': {'message': error}}},
+                    'error': None,
+                })
+        return lines
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, data, content_type='application/json'):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send(404, {'error': {'type': 'not_found_error', 'message': f'No route for {self.path}'}})
+
+    # Anthropic: /v1/messages/batches[/{id}[/results]]
+    # OpenAI:    /v1/files, /v1/files/{id}/content, /v1/batches[/{id}]
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        if path == '/v1/messages/batches':
+            self._create_anthropic_batch(json.loads(self._body()))
+        elif path == '/v1/files':
+            self._upload_file()
+        elif path == '/v1/batches':
+            self._create_openai_batch(json.loads(self._body()))
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        match = re.match(r'/v1/messages/batches/([^/]+)(/results)?$', path)
+        if match:
+            batch = self.fake.batches.get(match.group(1))
+            if not batch:
+                return self._not_found()
+            if match.group(2):
+                body = "".join(json.dumps(line) + "\n" for line in batch['results'])
+                return self._send(200, body.encode('utf-8'), 'application/binary')
+            return self._send(200, self._anthropic_batch(batch))
+
+        match = re.match(r'/v1/batches/([^/]+)$', path)
+        if match:
+            batch = self.fake.batches.get(match.group(1))
+            return self._send(200, self._openai_batch(batch)) if batch else self._not_found()
+
+        match = re.match(r'/v1/files/([^/]+)/content$', path)
+        if match and match.group(1) in self.fake.files:
+            return self._send(200, self.fake.files[match.group(1)]['content'], 'application/octet-stream')
+        self._not_found()
+
+    def _poll(self, batch):
+        """Count a status check; True once the batch has finished"""
+        with self.fake.lock:
+            batch['polls'] += 1
+            return batch['polls'] > self.fake.polls_until_done
+
+    def _create_anthropic_batch(self, data):
+        batch_id = self.fake.new_id('msgbatch')
+        self.fake.batches[batch_id] = {
+            'id': batch_id, 'polls': 0, 'created': time.time(),
+            'results': self.fake.run_requests('anthropic', data['requests']),
+        }
+        self._send(200, self._anthropic_batch(self.fake.batches[batch_id], count_poll=False))
+
+    def _anthropic_batch(self, batch, count_poll=True):
+        ended = self._poll(batch) if count_poll else False
+        total = len(batch['results'])
+        succeeded = sum(1 for line in batch['results'] if line['result']['type'] == 'succeeded')
+        created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(batch['created']))
+        return {
+            'id': batch['id'], 'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else total,
+                'succeeded': succeeded if ended else 0,
+                'errored': total - succeeded if ended else 0,
+                'canceled': 0, 'expired': 0,
+            },
+            'created_at': created, 'expires_at': created,
+            'ended_at': created if ended else None,
+            'archived_at': None, 'cancel_initiated_at': None,
+            'results_url': f"{self.fake.url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def _upload_file(self):
+        content_type = self.headers.get('Content-Type', '')
+        message = email.message_from_bytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + self._body()
+        )
+        content, purpose = b'', 'batch'
+        for part in message.walk():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'file':
+                content = part.get_payload(decode=True)
+            elif name == 'purpose':
+                purpose = part.get_payload(decode=True).decode('utf-8')
+        file_id = self.fake.new_id('file')
+        self.fake.files[file_id] = {'content': content, 'purpose': purpose}
+        self._send(200, self._file(file_id))
+
+    def _file(self, file_id):
+        entry = self.fake.files[file_id]
+        return {'id': file_id, 'object': 'file', 'bytes': len(entry['content']), 'created_at': int(time.time()),
+                'filename': f'{file_id}.jsonl', 'purpose': entry['purpose'], 'status': 'processed'}
+
+    def _create_openai_batch(self, data):
+        requests = [json.loads(line) for line in self.fake.files[data['input_file_id']]['content'].decode('utf-8').splitlines()
+                    if line.strip()]
+        batch_id = self.fake.new_id('batch')
+        output_id = self.fake.new_id('file')
+        results = self.fake.run_requests('openai', requests)
+        self.fake.files[output_id] = {
+            'content': "".join(json.dumps(line) + "\n" for line in results).encode('utf-8'),
+            'purpose': 'batch_output',
+        }
+        self.fake.batches[batch_id] = {
+            'id': batch_id, 'polls': 0, 'created': time.time(), 'results': results,
+            'input_file_id': data['input_file_id'], 'output_file_id': output_id,
+            'endpoint': data['endpoint'], 'completion_window': data['completion_window'],
+        }
+        self._send(200, self._openai_batch(self.fake.batches[batch_id], count_poll=False))
+
+    def _openai_batch(self, batch, count_poll=True):
+        completed = self._poll(batch) if count_poll else False
+        total = len(batch['results'])
+        failed = sum(1 for line in batch['results'] if line['response']['status_code'] != 200)
+        return {
+            'id': batch['id'], 'object': 'batch', 'endpoint': batch['endpoint'],
+            'input_file_id': batch['input_file_id'], 'completion_window': batch['completion_window'],
+            'status': 'completed' if completed else 'in_progress',
+            'output_file_id': batch['output_file_id'] if completed else None,
+            'error_file_id': None,
+            'created_at': int(batch['created']),
+            'request_counts': {'total': total, 'completed': total - failed if completed else 0,
+                               'failed': failed if completed else 0},
+        }
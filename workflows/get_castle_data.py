@@ -10,13 +10,15 @@ __version__ = "0.1"
 # %% --------------------------------------------------------------------------
 
 # -----------------------------------------------------------------------------
-import pandas as pd
-import os
+from concurrent.futures import ThreadPoolExecutor
+from src.castle_merge import merge_shards, shard_paths
 from src.openstreetmap import get_castles_from_overpass, get_castles_by_countries
 from src.utilities import read_sort_get_countries_by_first_letter
 
 # Read the country data
 csv_path = "data/countries.csv"
+# Letters harvested at once; Overpass allows a couple of concurrent queries per IP
+HARVEST_WORKERS = 2
 
 def get_data(csv_path, chosen_letter):
     """
@@ -35,8 +37,8 @@ def get_data(csv_path, chosen_letter):
         castle_df.to_csv(f"data/letter_{chosen_letter}_castles.csv", index=False)
         print(f"Castles per country:\n{castle_df['country'].value_counts()}")
 # %%
-for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
-    get_data(csv_path, letter)
+with ThreadPoolExecutor(max_workers=HARVEST_WORKERS) as executor:
+    list(executor.map(lambda letter: get_data(csv_path, letter), "ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
 
 
 # %% --------------------------------------------------------------------------
@@ -53,11 +55,8 @@ print(f"Total castles collected: {len(castle_df)}")
 # %% --------------------------------------------------------------------------
 # Combine all data into a single CSV
 # -----------------------------------------------------------------------------
+# Shards are read in parallel, de-duplicated by location as they are merged
+# and streamed to the output; use a .parquet path for a columnar file
 file_path = "data/"
-all_castles = pd.DataFrame()
-for file in os.listdir(file_path):
-    if file.endswith("_castles.csv"):
-        df = pd.read_csv(file_path + file)
-        all_castles = pd.concat([all_castles, df])
-# combine all data
-all_castles.to_csv(file_path + "all_castles.csv", index=False)
+output_path = file_path + "all_castles.csv"
+merge_shards(shard_paths(file_path, exclude=[output_path]), output_path=output_path)
@@ -0,0 +1,216 @@
+"""
+Batch API mode for the LLM workflows
+
+Submits every pending castle as one Anthropic Message Batch or OpenAI Batch
+instead of one interactive request each; batches cost half as much and
+aren't bound by the per-minute rate limits. Castles can be packed several to
+a request, as in interactive mode. The request JSONL is written to disk, the
+batch is submitted and polled until it ends, and each result is mapped back
+to its castle ids and journaled.
+
+A manifest next to the request file records the submitted batch, so a
+re-run picks up polling the same batch rather than paying for it again.
+Point the clients' base_url at fake_batch_server.FakeBatchServer to run the
+whole flow locally.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+# %% --------------------------------------------------------------------------
+import json
+import os
+import time
+
+try:
+    from llm_journal import answer_from_cache, pending_items
+except ImportError:
+    from workflows.llm_journal import answer_from_cache, pending_items
+
+
+class AnthropicBatchProvider:
+    """Message Batches API (client is anthropic.Anthropic)"""
+    name = "anthropic"
+    max_requests = 100_000
+
+    def __init__(self, client):
+        self.client = client
+
+    def request_line(self, custom_id, params):
+        return {'custom_id': custom_id, 'params': params}
+
+    def submit(self, request_path):
+        with open(request_path, 'r', encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        return self.client.messages.batches.create(requests=requests).id
+
+    def status(self, batch_id):
+        """'ended' once every request is finished, otherwise the batch's processing status"""
+        return self.client.messages.batches.retrieve(batch_id).processing_status
+
+    def is_finished(self, status):
+        return status == 'ended'
+
+    def results(self, batch_id):
+        """Yields (custom_id, message dict or None, error or None)"""
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == 'succeeded':
+                yield entry.custom_id, entry.result.message.model_dump(), None
+            else:
+                error = getattr(entry.result, 'error', None)
+                yield entry.custom_id, None, f"{entry.result.type}: {error}"
+
+
+class OpenAIBatchProvider:
+    """Batch API over chat completions (client is openai.OpenAI)"""
+    name = "openai"
+    max_requests = 50_000
+    endpoint = "/v1/chat/completions"
+
+    def __init__(self, client):
+        self.client = client
+
+    def request_line(self, custom_id, params):
+        return {'custom_id': custom_id, 'method': 'POST', 'url': self.endpoint, 'body': params}
+
+    def submit(self, request_path):
+        with open(request_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self.endpoint,
+            completion_window='24h'
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def is_finished(self, status):
+        return status in ('completed', 'failed', 'expired', 'cancelled')
+
+    def results(self, batch_id):
+        """Yields (custom_id, chat completion dict or None, error or None)"""
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get('response') or {}
+                if response.get('status_code') == 200 and not entry.get('error'):
+                    yield entry['custom_id'], response['body'], None
+                else:
+                    yield entry['custom_id'], None, str(entry.get('error') or response.get('body'))
+
+
+def _load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def _save_manifest(manifest, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def run_batch(provider, items, build_params, parse, journal, request_path, cache=None, poll_interval=60,
+              group_size=None):
+    """
+    Run the pending items as one batch and journal the results.
+
+    Args:
+        provider: AnthropicBatchProvider or OpenAIBatchProvider
+        items: Iterable of (castle id, payload) pairs
+        build_params: Function giving the API request parameters for a payload
+            (a list of payloads with group_size)
+        parse: Function turning a response dict into the stored result; with
+            group_size it also takes the number of castles and returns a list
+            of results in request order, None where one failed validation
+        journal (Journal): Where results are recorded; done castles are skipped
+        request_path (str): Where the request JSONL is written; the manifest
+            is saved alongside it as .manifest.json
+        cache (CacheScope, optional): Response cache; hits aren't submitted
+        poll_interval (float): Seconds between status checks
+        group_size (int, optional): Castles per request; without it each
+            castle is a request of its own
+
+    Returns:
+        dict: castle id to result for every completed entry, old and new
+    """
+    items = dict(items)
+    manifest_path = os.path.splitext(request_path)[0] + ".manifest.json"
+    manifest = _load_manifest(manifest_path)
+    os.makedirs(os.path.dirname(request_path) or '.', exist_ok=True)
+    os.makedirs(os.path.dirname(journal.path) or '.', exist_ok=True)
+
+    with open(journal.path, 'a', encoding='utf-8') as journal_file:
+        if manifest and manifest['provider'] == provider.name and not manifest.get('collected'):
+            print(f"Resuming batch {manifest['batch_id']}")
+        else:
+            todo = answer_from_cache(pending_items(items, journal), journal, journal_file, cache)
+            if not todo:
+                print("Nothing to submit")
+                return journal.results()
+            size = group_size or 1
+            if len(todo) > provider.max_requests * size:
+                print(f"Submitting the first {provider.max_requests * size} of {len(todo)}; run again for the rest")
+                todo = todo[:provider.max_requests * size]
+            groups = [todo[i:i + size] for i in range(0, len(todo), size)]
+
+            # Castle ids contain characters batch custom ids don't allow, so number them
+            custom_ids = {f"req-{i}": [key for key, _ in group] for i, group in enumerate(groups)}
+            with open(request_path, 'w', encoding='utf-8') as f:
+                for custom_id, group in zip(custom_ids, groups):
+                    payloads = [payload for _, payload in group]
+                    line = provider.request_line(custom_id, build_params(payloads if group_size else payloads[0]))
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+            batch_id = provider.submit(request_path)
+            manifest = {'provider': provider.name, 'batch_id': batch_id, 'custom_ids': custom_ids,
+                        'group_size': group_size, 'submitted': time.time()}
+            _save_manifest(manifest, manifest_path)
+            print(f"Submitted batch {batch_id} with {len(todo)} castles in {len(groups)} requests")
+
+        batch_id = manifest['batch_id']
+        while True:
+            status = provider.status(batch_id)
+            if provider.is_finished(status):
+                break
+            print(f"Batch {batch_id}: {status}")
+            time.sleep(poll_interval)
+
+        succeeded = failed = 0
+        grouped = manifest.get('group_size')
+        for custom_id, response, error in provider.results(batch_id):
+            keys = manifest['custom_ids'].get(custom_id)
+            if keys is None:
+                continue
+            results = [None] * len(keys)
+            if error is None:
+                try:
+                    results = parse(response, len(keys)) if grouped else [parse(response)]
+                except Exception as e:
+                    error = e
+            for key, result in zip(keys, results):
+                if error is None and result is not None:
+                    journal.append(journal_file, key, result)
+                    if cache and key in items:
+                        cache.put(items[key], result)
+                    succeeded += 1
+                else:
+                    # Failures are journaled and asked again on the next run
+                    reason = error or "response failed validation"
+                    journal.append(journal_file, key, error=reason if isinstance(reason, Exception) else RuntimeError(reason))
+                    failed += 1
+
+    manifest['collected'] = True
+    _save_manifest(manifest, manifest_path)
+    print(f"Batch {batch_id} finished ({status}): {succeeded} succeeded, {failed} failed")
+    return journal.results()
@@ -0,0 +1,112 @@
+"""
+Content-addressed cache of LLM responses
+
+Responses are stored in SQLite under a hash of the model, the prompt
+template version and the normalised input, so a re-run (or the same castle
+appearing in another CSV) never pays for an identical request twice. Bump a
+workflow's PROMPT_VERSION whenever its prompt changes.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+# %% --------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+LLM_CACHE_PATH = "outputs/cache/llm_cache.db"
+
+
+def normalise_input(payload):
+    """Case, whitespace and NaN-insensitive form of a request's input"""
+    if isinstance(payload, (list, tuple)):
+        return [normalise_input(item) for item in payload]
+    if isinstance(payload, dict):
+        return {key: normalise_input(value) for key, value in sorted(payload.items())}
+    if payload is None or payload != payload:  # NaN
+        return ""
+    return re.sub(r'\s+', ' ', str(payload)).strip().lower()
+
+
+class LLMCache:
+    def __init__(self, path=LLM_CACHE_PATH):
+        """
+        Args:
+            path (str): SQLite database file
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                prompt_version TEXT,
+                input TEXT,
+                response TEXT,
+                created TEXT
+            )
+        """)
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, prompt_version, payload):
+        material = json.dumps([model, str(prompt_version), normalise_input(payload)], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt_version, payload):
+        """Cached response, or None (counted as a hit or a miss)"""
+        row = self.connection.execute(
+            "SELECT response FROM responses WHERE key = ?", (self.key(model, prompt_version, payload),)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, model, prompt_version, payload, response):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(model, prompt_version, payload), model, str(prompt_version),
+                 json.dumps(normalise_input(payload), ensure_ascii=False),
+                 json.dumps(response, ensure_ascii=False), datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def scope(self, model, prompt_version):
+        """The cache for one workflow's model and prompt"""
+        return CacheScope(self, model, prompt_version)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
+    def close(self):
+        self.connection.close()
+
+
+class CacheScope:
+    """An LLMCache bound to one model and prompt version"""
+
+    def __init__(self, cache, model, prompt_version):
+        self.cache = cache
+        self.model = model
+        self.prompt_version = prompt_version
+
+    def get(self, payload):
+        return self.cache.get(self.model, self.prompt_version, payload)
+
+    def put(self, payload, response):
+        self.cache.put(self.model, self.prompt_version, payload, response)
@@ -0,0 +1,157 @@
+"""
+Rate-limited streaming executor for LLM requests
+
+Keeps a fixed number of requests in flight (a new one starts as soon as any
+finishes, rather than waiting for a whole batch), within request-per-minute
+and token-per-minute budgets. Rate limit (429) and overload (529) errors are
+retried with backoff, pausing every request when the provider asks for it.
+Results are yielded as each request completes (see llm_journal for writing
+them to disk).
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+# %% --------------------------------------------------------------------------
+import asyncio
+import random
+import time
+from collections import deque
+
+# Status codes worth retrying: rate limited, server errors, overloaded
+RETRY_STATUS_CODES = (429, 500, 502, 503, 529)
+# Connection problems raised by the anthropic and openai clients
+RETRY_ERROR_NAMES = ('APIConnectionError', 'APITimeoutError')
+
+
+def estimate_tokens(text, max_output_tokens=0):
+    """Rough token count of a prompt (about 4 characters per token) plus the output allowance"""
+    return len(str(text)) // 4 + max_output_tokens
+
+
+class RateLimiter:
+    """Sliding one-minute window over requests and tokens"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self.events = deque()  # (time, tokens) of requests in the window
+        self.tokens_in_window = 0
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Hold back every request for a while (e.g. after a 429 with retry-after)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens=0):
+        """Wait until a request of this many tokens fits in the budgets"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                while self.events and now - self.events[0][0] >= self.window:
+                    self.tokens_in_window -= self.events.popleft()[1]
+
+                fits_requests = len(self.events) < self.requests_per_minute
+                # A request larger than the whole budget still goes through once the window is empty
+                fits_tokens = (not self.tokens_per_minute or not self.events
+                               or self.tokens_in_window + tokens <= self.tokens_per_minute)
+                if fits_requests and fits_tokens:
+                    self.events.append((now, tokens))
+                    self.tokens_in_window += tokens
+                    return
+                await asyncio.sleep(self.window - (now - self.events[0][0]))
+
+
+def _retry_after(error):
+    """Seconds the provider asked us to wait, if it said"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retriable(error):
+    """Whether an API error is worth retrying"""
+    if getattr(error, 'status_code', None) in RETRY_STATUS_CODES:
+        return True
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or type(error).__name__ in RETRY_ERROR_NAMES
+
+
+class LLMExecutor:
+    def __init__(self, max_concurrency=8, requests_per_minute=50, tokens_per_minute=None,
+                 max_retries=6, base_delay=2.0, max_delay=60.0):
+        """
+        Args:
+            max_concurrency (int): Requests in flight at once
+            requests_per_minute (int): Request budget
+            tokens_per_minute (int): Token budget, or None for no limit
+            max_retries (int): Retries of a retriable error before giving up on an item
+            base_delay (float): First retry delay in seconds, doubled on each retry
+            max_delay (float): Longest retry delay
+        """
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def call(self, func, payload, tokens=0):
+        """Run func(payload) within the budgets, retrying retriable errors"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(tokens)
+            try:
+                return await func(payload)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retriable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(self.base_delay * 2 ** attempt, self.max_delay) * random.uniform(0.5, 1.0)
+                if getattr(e, 'status_code', None) in (429, 529):
+                    # Everyone backs off, not just this request
+                    self.limiter.pause(delay)
+                print(f"Retrying in {delay:.1f}s after {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+
+    async def stream(self, items, func, token_estimate=None):
+        """
+        Run func over items, yielding results in completion order.
+
+        Args:
+            items: Iterable of (key, payload) pairs
+            func: Async function taking a payload
+            token_estimate: Function giving the tokens a payload will use, for the token budget
+
+        Yields:
+            tuple: (key, result, error); error is None on success, result None on failure
+        """
+        items = iter(items)
+        pending = {}
+
+        def launch():
+            for key, payload in items:
+                tokens = token_estimate(payload) if token_estimate else 0
+                pending[asyncio.ensure_future(self.call(func, payload, tokens))] = key
+                return True
+            return False
+
+        while len(pending) < self.max_concurrency and launch():
+            pass
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = pending.pop(task)
+                # Refill the window straight away
+                launch()
+                error = task.exception()
+                yield key, None if error else task.result(), error
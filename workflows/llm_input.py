@@ -1,7 +1,9 @@
 """
-Enter script name
+Generate castle descriptions with Claude
 
-Enter short description of the script
+Each castle is described through a forced tool call, so the location, era,
+style and narration come back as separate fields rather than being parsed
+out of the text afterwards.
 """
 
 __date__ = "2025-03-11"
@@ -13,72 +15,203 @@ __version__ = "0.1"
 # %% --------------------------------------------------------------------------
 import pandas as pd
 import asyncio
-from typing import List, Callable
 import anthropic
 import nest_asyncio
 import os
 
+try:
+    from llm_executor import LLMExecutor, estimate_tokens
+    from llm_journal import Journal, castle_id, run_journaled
+    from llm_cache import LLMCache
+    from llm_batch import AnthropicBatchProvider, run_batch
+except ImportError:
+    from workflows.llm_executor import LLMExecutor, estimate_tokens
+    from workflows.llm_journal import Journal, castle_id, run_journaled
+    from workflows.llm_cache import LLMCache
+    from workflows.llm_batch import AnthropicBatchProvider, run_batch
+
 # Ensure nested event loops are allowed
 nest_asyncio.apply()
 
+MODEL = "claude-3-haiku-20240307"
+# Room for a 500-1000 word narration (about 1400 tokens) plus the other tool fields and JSON
+MAX_TOKENS = 3000
+# Bump when the prompt changes, so cached responses to the old prompt aren't reused
+PROMPT_VERSION = 2
+
+# 'interactive' sends requests one by one; 'batch' submits them all as a Message Batch
+LLM_MODE = os.getenv("LLM_MODE", "interactive")
+
+
+CASTLE_TOOL = {
+    "name": "record_castle",
+    "description": "Record the location, history and description of a castle.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "city": {
+                "type": ["string", "null"],
+                "description": "City or nearest town the castle is in, or null if unknown"
+            },
+            "country": {
+                "type": ["string", "null"],
+                "description": "Country the castle is in, in English, or null if unknown"
+            },
+            "era": {
+                "type": ["string", "null"],
+                "description": "Century or period it was built, e.g. '12th century'"
+            },
+            "style": {
+                "type": ["string", "null"],
+                "description": "Architectural style, e.g. 'Romanesque', 'Gothic revival'"
+            },
+            "narration": {
+                "type": "string",
+                "description": "A 500-1000 word summary of the castle"
+            },
+        },
+        "required": ["city", "country", "era", "style", "narration"],
+    },
+}
+
+# Columns the tool's fields are stored in
+RESULT_COLUMNS = {
+    "city": "city",
+    "country": "country",
+    "era": "era",
+    "style": "style",
+    "narration": "description",
+}
+
+
+def build_prompt(entry):
+    return f"I need descriptions of castles worldwide, give me a 500-1000 word summary of this castle: {entry}. Record it with the record_castle tool, giving null for any field you don't know rather than guessing."
+
+
+def build_request(entry):
+    """Request parameters for one castle, shared by interactive and batch mode"""
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "tools": [CASTLE_TOOL],
+        "tool_choice": {"type": "tool", "name": CASTLE_TOOL["name"]},
+        "messages": [
+            {
+                "role": "user",
+                "content": build_prompt(entry),
+            }
+        ],
+    }
+
+
+def parse_message(message):
+    """
+    Castle fields from a message (as a dict), raising ValueError if the tool
+    call is missing or incomplete so the castle is recorded as failed.
+    """
+    tool_input = next(
+        (block["input"] for block in message["content"]
+         if block["type"] == "tool_use" and block["name"] == CASTLE_TOOL["name"]),
+        None
+    )
+    if tool_input is None:
+        raise ValueError(f"no {CASTLE_TOOL['name']} call (stop reason {message.get('stop_reason')})")
+    if not isinstance(tool_input.get("narration"), str) or not tool_input["narration"].strip():
+        raise ValueError("empty narration")
+
+    result = {}
+    for field in CASTLE_TOOL["input_schema"]["properties"]:
+        value = tool_input.get(field)
+        result[field] = value.strip() if isinstance(value, str) and value.strip() else None
+    return result
+
+
+def add_results(df, keys, results):
+    """
+    One string column per tool field; failed rows are left empty. Values the
+    dataframe already has (e.g. the OpenStreetMap country) are kept and only
+    the gaps are filled.
+    """
+    for field, column in RESULT_COLUMNS.items():
+        values = pd.Series([(results.get(key) or {}).get(field) for key in keys],
+                           index=df.index, dtype="string")
+        df[column] = df[column].astype("string").fillna(values) if column in df else values
+    return df
+
+
 async def process_entry(entry, client):
-    try:
-        message = await client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=1000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"I need descriptions of castles worldwide, give me a 500-1000 word summary of this castle: {entry}. Start with the city and country where the castle is located, in the format City: 'city_name', Country: 'country:name'.",
-                }
-            ],
-        )
-        return message.content[0].text
-    except Exception as e:
-        print(f"Error processing entry: {e}")
-        return entry  # Return original text if cleaning fails
-
-
-async def process_batch(
-    texts: List[str], clean_func: Callable, client: str
-) -> List[str]:
-    """Process a batch of texts using the provided cleaning function"""
-    tasks = [clean_func(text, client) for text in texts]
-    return await asyncio.gather(*tasks)
+    """Describe one castle; errors are left to the executor to retry or report"""
+    message = await client.messages.create(**build_request(entry))
+    return parse_message(message.model_dump())
 
 
 async def process_dataframe(
-    df: pd.DataFrame, column: str, client: str, batch_size: int = 10
+    df: pd.DataFrame, column: str, client, executor: LLMExecutor, journal: Journal,
+    cache: LLMCache = None
 ) -> pd.DataFrame:
-    """Process the specified column of the dataframe in batches"""
-    results = []
-    for i in range(0, len(df), batch_size):
-        batch = df[column].iloc[i : i + batch_size].tolist()
-        cleaned_batch = await process_batch(batch, process_entry, client)
-        results.extend(cleaned_batch)
-
-        # add pause between batches to avoid rate limiting
-        if i < len(df) - batch_size:
-            await asyncio.sleep(1)
-
-    df["description"] = results
-    return df
+    """
+    Describe every row of the specified column. Requests run continuously
+    at the executor's rate limits and each result is journaled as soon as it
+    arrives; castles already in the journal are not requested again.
+    Rows that failed are left empty (and retried on the next run).
+    """
+    keys = [castle_id(row) for _, row in df.iterrows()]
+    results = await run_journaled(
+        executor,
+        zip(keys, df[column]),
+        lambda entry: process_entry(entry, client),
+        journal,
+        cache=cache.scope(MODEL, PROMPT_VERSION) if cache else None,
+        token_estimate=lambda entry: estimate_tokens(build_prompt(entry) + str(CASTLE_TOOL), MAX_TOKENS)
+    )
+
+    return add_results(df, keys, results)
+
+
+def process_dataframe_batch(
+    df: pd.DataFrame, column: str, client, journal: Journal, cache: LLMCache = None,
+    request_path: str = "outputs/batches/llm_descriptions.jsonl"
+) -> pd.DataFrame:
+    """
+    Describe every row of the specified column with one Message Batch.
+    Results are journaled like the interactive mode, so the two can be mixed.
+    """
+    keys = [castle_id(row) for _, row in df.iterrows()]
+    results = run_batch(
+        AnthropicBatchProvider(client),
+        zip(keys, df[column]),
+        build_request,
+        parse_message,
+        journal,
+        request_path,
+        cache=cache.scope(MODEL, PROMPT_VERSION) if cache else None
+    )
+
+    return add_results(df, keys, results)
 
 
 async def main():
     # Create an instance of the API client
     client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    executor = LLMExecutor(max_concurrency=8, requests_per_minute=50, tokens_per_minute=50000)
     # Create a sample dataframe
     df = pd.read_csv("outputs/missing_castles.csv")
     # combine the name and country columns
     #df['name_country'] = df['name'] + ', ' + df['country']
 
     # Process the dataframe
-    df_cleaned = await process_dataframe(df, "name", client, batch_size=2)
+    journal = Journal("outputs/journal/llm_descriptions_missing_structured.jsonl")
+    cache = LLMCache()
+    if LLM_MODE == "batch":
+        batch_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        df_cleaned = process_dataframe_batch(df, "name", batch_client, journal, cache)
+    else:
+        df_cleaned = await process_dataframe(df, "name", client, executor, journal, cache)
+    cache.print_stats()
+    cache.close()
 
     # Optionally, save the result
     df_cleaned.to_csv("outputs/llm_descriptions_missing.csv", index=False)
 
 if __name__ == "__main__":
     asyncio.run(main())
-# %%
@@ -0,0 +1,212 @@
+"""
+Durable journal for LLM enrichment runs
+
+Every completed request is appended to a JSONL journal keyed by castle id
+the moment it finishes, so a crash or rate-limit storm loses at most the
+requests in flight. Re-running skips castles already done and re-queues only
+the ones that failed; failures are recorded as errors, never as placeholder
+values in the results.
+"""
+
+__date__ = "2026-10-19"
+__author__ = "NedeeshaWeerasuriya"
+__version__ = "0.1"
+
+
+# %% --------------------------------------------------------------------------
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+def castle_id(row):
+    """
+    Stable id for a castle row: the OpenStreetMap element if the row has one,
+    otherwise a hash of its name, country and city.
+    """
+    def value(column):
+        item = row.get(column)
+        return None if item is None or item != item else item  # NaN != NaN
+
+    if value('id') is not None:
+        return f"{value('osm_type') or 'osm'}/{int(value('id'))}"
+    parts = [str(value(column) or '').strip().lower() for column in ('name', 'country', 'city')]
+    return "name/" + hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class Journal:
+    def __init__(self, path):
+        """
+        Args:
+            path (str): JSONL file; created on first write
+        """
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed mid-write leaves at most one broken last line
+                        continue
+                    # Later lines win, so a retried failure is replaced by its success
+                    self.records[record['key']] = record
+
+    def is_done(self, key):
+        record = self.records.get(key)
+        return bool(record) and record.get('error') is None
+
+    def results(self):
+        """key to result for every completed entry"""
+        return {key: record['result'] for key, record in self.records.items() if record.get('error') is None}
+
+    def failures(self):
+        """key to error message for entries whose last attempt failed"""
+        return {key: record['error'] for key, record in self.records.items() if record.get('error') is not None}
+
+    def append(self, f, key, result=None, error=None):
+        record = {
+            'key': key,
+            'result': result,
+            'error': None if error is None else f"{type(error).__name__}: {error}",
+            'recorded': datetime.now().isoformat(timespec='seconds'),
+        }
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        self.records[key] = record
+
+
+def pending_items(items, journal):
+    """The (castle id, payload) pairs not yet done in the journal"""
+    todo = [(key, payload) for key, payload in items.items() if not journal.is_done(key)]
+    retrying = sum(1 for key, _ in todo if key in journal.records)
+    print(f"{len(items) - len(todo)} already done, {len(todo)} to run ({retrying} failed before)")
+    return todo
+
+
+def answer_from_cache(todo, journal, f, cache):
+    """Journal the cached results and return the items still to request"""
+    if not cache:
+        return todo
+    misses = []
+    for key, payload in todo:
+        cached = cache.get(payload)
+        if cached is None:
+            misses.append((key, payload))
+        else:
+            journal.append(f, key, cached)
+    print(f"{len(todo) - len(misses)} answered from the cache")
+    return misses
+
+
+async def run_journaled(executor, items, func, journal, token_estimate=None, cache=None):
+    """
+    Run func over the items not yet done in the journal, journaling each
+    result as it completes. With a cache, identical requests are answered
+    from it without calling func (or using any rate limit budget).
+
+    Args:
+        executor (LLMExecutor): Runs the requests
+        items: Iterable of (castle id, payload) pairs
+        func: Async function taking a payload
+        journal (Journal): Where results are recorded
+        token_estimate: Function giving the tokens a payload will use
+        cache (CacheScope, optional): Response cache for this model and prompt
+
+    Returns:
+        dict: castle id to result for every completed entry, old and new
+    """
+    items = dict(items)  # duplicate rows of a castle are only requested once
+    todo = pending_items(items, journal)
+
+    completed = failed = 0
+    os.makedirs(os.path.dirname(journal.path) or '.', exist_ok=True)
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        todo = answer_from_cache(todo, journal, f, cache)
+
+        async for key, result, error in executor.stream(todo, func, token_estimate):
+            journal.append(f, key, result, error)
+            if cache and error is None:
+                cache.put(items[key], result)
+            completed += 1
+            if error is not None:
+                failed += 1
+                print(f"Failed {key}: {error}")
+            if completed % 100 == 0:
+                print(f"Completed {completed}/{len(todo)} requests ({failed} failed)")
+
+    if failed:
+        print(f"{failed} requests failed; run again to retry them")
+    return journal.results()
+
+
+async def run_journaled_groups(executor, items, func, journal, group_size=10, token_estimate=None,
+                               cache=None, max_rounds=3):
+    """
+    Like run_journaled, but packs several castles into each request.
+
+    func takes a list of payloads and returns a list of results in the same
+    order, with None for any castle whose part of the response failed
+    validation. Only those castles are asked again, in groups half the size,
+    for up to max_rounds rounds.
+
+    Args:
+        executor (LLMExecutor): Runs the requests
+        items: Iterable of (castle id, payload) pairs
+        func: Async function taking a list of payloads
+        journal (Journal): Where results are recorded, one line per castle
+        group_size (int): Castles per request in the first round
+        token_estimate: Function giving the tokens a list of payloads will use
+        cache (CacheScope, optional): Response cache, per castle
+        max_rounds (int): Rounds of re-asking before a castle is recorded as failed
+
+    Returns:
+        dict: castle id to result for every completed entry, old and new
+    """
+    items = dict(items)
+    todo = pending_items(items, journal)
+
+    failed = 0
+    os.makedirs(os.path.dirname(journal.path) or '.', exist_ok=True)
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        todo = answer_from_cache(todo, journal, f, cache)
+
+        size = group_size
+        for round_number in range(1, max_rounds + 1):
+            if not todo:
+                break
+            groups = [todo[i:i + size] for i in range(0, len(todo), size)]
+            print(f"Round {round_number}: {len(todo)} castles in {len(groups)} requests")
+            group_items = ((tuple(key for key, _ in group), [payload for _, payload in group]) for group in groups)
+
+            retry = []
+            async for keys, results, error in executor.stream(group_items, func, token_estimate):
+                if error is not None:
+                    # The whole request failed after the executor's own retries
+                    for key in keys:
+                        journal.append(f, key, error=error)
+                    failed += len(keys)
+                    print(f"Failed request for {len(keys)} castles: {error}")
+                    continue
+                for key, result in zip(keys, results):
+                    if result is None:
+                        retry.append((key, items[key]))
+                    else:
+                        journal.append(f, key, result)
+                        if cache:
+                            cache.put(items[key], result)
+            todo = retry
+            size = max(1, size // 2)
+
+        for key, _ in todo:
+            journal.append(f, key, error=ValueError("response failed validation"))
+        failed += len(todo)
+
+    if failed:
+        print(f"{failed} castles failed; run again to retry them")
+    return journal.results()
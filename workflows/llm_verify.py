@@ -1,88 +1,250 @@
 """
 A script that processes a CSV file of castle data using OpenAI to classify each entry
 as a castle, a different structure type (e.g. palace), or to be removed if invalid.
+
+Several castles are classified per request, with the answer constrained to a
+JSON schema (type, canonical name, confidence) so no free-text parsing is needed.
 """
 
 __date__ = "2025-03-13"
 __author__ = "NedeeshaWeerasuriya"
-__version__ = "0.2"
+__version__ = "0.3"
 
 # %% --------------------------------------------------------------------------
 import pandas as pd
 import asyncio
-from typing import List, Callable
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, OpenAI
 import nest_asyncio
-import random
+import json
 import os
 
+try:
+    from llm_executor import LLMExecutor, estimate_tokens
+    from llm_journal import Journal, castle_id, run_journaled_groups
+    from llm_cache import LLMCache
+    from llm_batch import OpenAIBatchProvider, run_batch
+except ImportError:
+    from workflows.llm_executor import LLMExecutor, estimate_tokens
+    from workflows.llm_journal import Journal, castle_id, run_journaled_groups
+    from workflows.llm_cache import LLMCache
+    from workflows.llm_batch import OpenAIBatchProvider, run_batch
+
 # Ensure nested event loops are allowed
 nest_asyncio.apply()
 
-async def process_entry(entry, client):
-    name, country, city = entry
-    
-    try:
-        await asyncio.sleep(random.uniform(0.1, 0.5))
-        response = await client.chat.completions.create(
-            model="gpt-4o",  # Or another OpenAI model of your choice
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a helpful assistant that determines if a structure is a castle, another type of structure (like a palace, fortress, etc.), or not a real structure at all."
+MODEL = "gpt-4o"  # Or another OpenAI model of your choice
+# Castles per request; rows that fail validation are re-asked in smaller groups
+GROUP_SIZE = 20
+# Output budget per castle: a JSON object with index, type, canonical name and confidence
+TOKENS_PER_CASTLE = 80
+# Bump when the prompt changes, so cached responses to the old prompt aren't reused
+PROMPT_VERSION = 2
+
+# 'interactive' sends grouped requests; 'batch' submits the same groups through the Batch API
+LLM_MODE = os.getenv("LLM_MODE", "interactive")
+
+STRUCTURE_TYPES = [
+    "castle", "palace", "fortress", "fort", "citadel", "tower house",
+    "manor house", "chateau", "stately home", "other", "remove",
+]
+
+SYSTEM_PROMPT = "You are a helpful assistant that determines if a structure is a castle, another type of structure (like a palace, fortress, etc.), or not a real structure at all."
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "structure_classifications",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "index": {"type": "integer"},
+                            "type": {"type": "string", "enum": STRUCTURE_TYPES},
+                            "canonical_name": {"type": "string"},
+                            "confidence": {"type": "number"},
+                        },
+                        "required": ["index", "type", "canonical_name", "confidence"],
+                        "additionalProperties": False,
+                    },
                 },
-                {
-                    "role": "user",
-                    "content": f"Given this structure name: '{name}', located in {city}, {country}, determine if it is: \n1. If it is simply ruins, a motte or not a real structure or invalid entry (respond with 'to be Removed').\n 2. Not a castle but another type of structure like a palace, fortress, etc. (respond with the accurate type, e.g. 'palace', 'fortress')\n 3. A castle (respond with 'castle')\n Also in the case where the name is incorrect or is not the common name for this castle, then return the correct or more common name\n\nRespond with ONLY ONE WORD or the castle name."
-                }
-            ],
-            max_tokens=50
-        )
-        return response.choices[0].message.content.strip().lower()
-    except Exception as e:
-        print(f"Error processing entry {name}: {e}")
-        return "error - to be Removed"  # Return error indicator if processing fails
-
-
-async def process_batch(
-    entries: List[tuple], process_func: Callable, client
-) -> List[str]:
-    """Process a batch of entries using the provided function"""
-    tasks = [process_func(entry, client) for entry in entries]
-    return await asyncio.gather(*tasks)
+            },
+            "required": ["results"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def build_prompt(entries):
+    structures = "\n".join(
+        f"{i}. '{name}', located in {city}, {country}" for i, (name, country, city) in enumerate(entries)
+    )
+    return (
+        "For each numbered structure below, determine its type:\n"
+        "- 'remove' if it is simply ruins, a motte, not a real structure or an invalid entry\n"
+        "- the accurate type if it is not a castle but another structure (palace, fortress, etc.)\n"
+        "- 'castle' if it is a castle\n"
+        "Also give its canonical name: the correct or most common name for it "
+        "(the given name if that already is), and your confidence from 0 to 1.\n"
+        "Return one result per structure, with its number as the index.\n\n"
+        f"{structures}"
+    )
+
+
+def build_request(entries):
+    """Request parameters for a group of structures, shared by interactive and batch mode"""
+    return {
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system", 
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": build_prompt(entries)
+            }
+        ],
+        "response_format": RESPONSE_FORMAT,
+        "max_tokens": TOKENS_PER_CASTLE * len(entries) + 50
+    }
+
+
+def validate_result(result):
+    """Whether one structure's classification is complete and in range"""
+    return (
+        isinstance(result, dict)
+        and result.get("type") in STRUCTURE_TYPES
+        and isinstance(result.get("canonical_name"), str) and result["canonical_name"].strip() != ""
+        and isinstance(result.get("confidence"), (int, float)) and 0 <= result["confidence"] <= 1
+    )
+
+
+def parse_response(response, count):
+    """
+    Split a chat completion (as a dict) into one classification per structure.
+
+    Returns:
+        list: {'type', 'canonical_name', 'confidence'} per structure, in request
+        order, or None where the answer was missing, duplicated or invalid
+    """
+    try:
+        results = json.loads(response["choices"][0]["message"]["content"])["results"]
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError):
+        return [None] * count
+
+    by_index = {}
+    duplicates = set()
+    for result in results:
+        index = result.get("index") if isinstance(result, dict) else None
+        if not isinstance(index, int) or not 0 <= index < count:
+            continue
+        if index in by_index:
+            duplicates.add(index)
+        by_index[index] = result
+
+    parsed = []
+    for index in range(count):
+        result = by_index.get(index)
+        if index in duplicates or not validate_result(result):
+            parsed.append(None)
+        else:
+            parsed.append({
+                "type": result["type"],
+                "canonical_name": result["canonical_name"].strip(),
+                "confidence": float(result["confidence"]),
+            })
+    return parsed
+
+
+async def process_group(entries, client):
+    """Classify a group of structures; errors are left to the executor to retry or report"""
+    response = await client.chat.completions.create(**build_request(entries))
+    return parse_response(response.model_dump(), len(entries))
+
+
+def add_results(df, keys, results):
+    """Classification columns from the journaled results; failed rows are left empty"""
+    df["structure_type"] = [results.get(key, {}).get("type") for key in keys]
+    df["canonical_name"] = [results.get(key, {}).get("canonical_name") for key in keys]
+    df["confidence"] = pd.Series([results.get(key, {}).get("confidence") for key in keys],
+                                 index=df.index, dtype="float64")
+    return df
 
 
 async def process_dataframe(
-    df: pd.DataFrame, client, batch_size: int = 10
+    df: pd.DataFrame, client, executor: LLMExecutor, journal: Journal,
+    cache: LLMCache = None
 ) -> pd.DataFrame:
-    """Process the dataframe in batches"""
-    results = []
-    total_entries = len(df)
-    
-    for i in range(0, len(df), batch_size):
-        batch = [(row['name'], row['country'], row['city']) 
-                 for _, row in df.iloc[i:i+batch_size].iterrows()]
-        
-        processed_batch = await process_batch(batch, process_entry, client)
-        results.extend(processed_batch)
-
-        # Add a pause between batches to avoid rate limits
-        if i + batch_size < total_entries:
-            await asyncio.sleep(1)
-
-    df["structure_type"] = results
-    return df
+    """
+    Classify every row, GROUP_SIZE structures per request. Requests run
+    continuously at the executor's rate limits and each row is journaled as
+    its group returns; castles already in the journal are not requested
+    again. Rows whose answers fail validation are re-asked in smaller groups;
+    rows that still fail are left empty (and retried on the next run).
+    """
+    keys = [castle_id(row) for _, row in df.iterrows()]
+    entries = [(row['name'], row['country'], row['city']) for _, row in df.iterrows()]
+    results = await run_journaled_groups(
+        executor,
+        zip(keys, entries),
+        lambda group: process_group(group, client),
+        journal,
+        group_size=GROUP_SIZE,
+        cache=cache.scope(MODEL, PROMPT_VERSION) if cache else None,
+        token_estimate=lambda group: estimate_tokens(SYSTEM_PROMPT + build_prompt(group), TOKENS_PER_CASTLE * len(group))
+    )
+    return add_results(df, keys, results)
+
+
+def process_dataframe_batch(
+    df: pd.DataFrame, client, journal: Journal, cache: LLMCache = None,
+    request_path: str = "outputs/batches/classified_castles.jsonl"
+) -> pd.DataFrame:
+    """
+    Classify every row with one Batch API job, GROUP_SIZE structures per
+    request. Results are journaled like the interactive mode, so the two can
+    be mixed; answers that fail validation are journaled as failures and
+    re-asked on the next run.
+    """
+    keys = [castle_id(row) for _, row in df.iterrows()]
+    entries = [(row['name'], row['country'], row['city']) for _, row in df.iterrows()]
+    results = run_batch(
+        OpenAIBatchProvider(client),
+        zip(keys, entries),
+        build_request,
+        parse_response,
+        journal,
+        request_path,
+        cache=cache.scope(MODEL, PROMPT_VERSION) if cache else None,
+        group_size=GROUP_SIZE
+    )
+    return add_results(df, keys, results)
 
 
 async def main():
     # Create an instance of the OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))    
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    executor = LLMExecutor(max_concurrency=16, requests_per_minute=500, tokens_per_minute=30000)
     # Load the dataframe
     df = pd.read_csv("outputs/cleaned_castle_data_2.csv")
 
     
     # Process the dataframe
-    df_processed = await process_dataframe(df, client, batch_size=3)
+    journal = Journal("outputs/journal/classified_castles_2_structured.jsonl")
+    cache = LLMCache()
+    if LLM_MODE == "batch":
+        batch_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        df_processed = process_dataframe_batch(df, batch_client, journal, cache)
+    else:
+        df_processed = await process_dataframe(df, client, executor, journal, cache)
+    cache.print_stats()
+    cache.close()
     
     # Optionally, save the result
     df_processed.to_csv("outputs/classified_castles_2.csv", index=False)
@@ -93,10 +255,13 @@ async def main():
     print(type_counts)
     
     # Count entries to be removed
-    to_remove = sum(df_processed['structure_type'] == 'to be removed')
+    to_remove = sum(df_processed['structure_type'] == 'remove')
     print(f"\nEntries marked for removal: {to_remove}")
+    
+    renamed = df_processed['canonical_name'].notna() & (df_processed['canonical_name'] != df_processed['name'])
+    print(f"Entries with a corrected name: {renamed.sum()}")
 
 
 if __name__ == "__main__":
     asyncio.run(main())
-# %%
\ No newline at end of file
+# %%